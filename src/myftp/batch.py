@@ -0,0 +1,228 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Non-interactive batch mode of the FTP client. Commands are read
+# from a file (or stdin) and run in parallel over a pool of connections, each
+# one owned by its own client, commands on the same file in file order. A
+# report of every command is returned once the whole batch ran.
+
+
+from fnmatch import fnmatchcase
+from threading import Condition, Thread
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import sys
+import traceback
+
+try:
+    from myftp.summary import FILES_SEPARATOR, is_pattern
+except ImportError:
+    from summary import FILES_SEPARATOR, is_pattern
+
+
+def read_commands(path: str) -> List[str]:
+    """
+    Commands of a batch file, one per line, "-" reads them from stdin
+
+    Blank lines and lines starting with # are ignored, "bye" ends the batch
+    """
+    file = sys.stdin if path == "-" else open(path)
+
+    commands = []
+
+    try:
+        for line in file:
+            command = line.strip()
+
+            if not command or command.startswith("#"):
+                continue
+
+            if command.lower() == "bye":
+                break
+
+            commands.append(command)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+    return commands
+
+
+def command_names(command: str) -> List[str]:
+    """
+    Names of the files a command touches, patterns included: the prefix of a
+    list becomes a pattern, "*" alone listing every file
+    """
+    verb, *arguments = command.split()
+
+    if verb.lower() == "list":
+        return [arguments[0].rstrip("*") + "*" if arguments else "*"]
+
+    return [
+        name
+        for argument in arguments
+        for name in argument.split(FILES_SEPARATOR)
+        if name
+    ]
+
+
+def command_dependencies(commands: List[str]) -> List[Set[int]]:
+    """
+    For every command, the earlier commands it must wait for: the last one
+    naming each of its files, and those whose pattern matches one of its
+    names (or the other way around). Two patterns are assumed to overlap
+    """
+    dependencies: List[Set[int]] = []
+
+    # name -> last command naming it, pattern commands in order
+    last_command: Dict[str, int] = {}
+    patterns: List[Tuple[int, List[str]]] = []
+
+    for index, command in enumerate(commands):
+        names = command_names(command)
+        waits_for: Set[int] = set()
+
+        for name in names:
+            if is_pattern(name):
+                waits_for.update(
+                    last
+                    for other, last in last_command.items()
+                    if fnmatchcase(other, name)
+                )
+                waits_for.update(other_index for other_index, _ in patterns)
+
+            else:
+                if name in last_command:
+                    waits_for.add(last_command[name])
+
+                waits_for.update(
+                    other_index
+                    for other_index, other_names in patterns
+                    if any(fnmatchcase(name, pattern) for pattern in other_names)
+                )
+
+        for name in names:
+            if not is_pattern(name):
+                last_command[name] = index
+
+        if any(is_pattern(name) for name in names):
+            patterns.append((index, [name for name in names if is_pattern(name)]))
+
+        dependencies.append(waits_for)
+
+    return dependencies
+
+
+def run_batch(
+    make_client: Callable[[], Any],
+    commands: List[str],
+    connections: int,
+    debug: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run commands over up to connections clients made by make_client, each
+    client taking the first command ready to start as soon as it is done
+    with its previous one
+
+    Commands on different files run in parallel, a command only starts once
+    the commands before it on one of its files (put x then get x, put x then
+    change x y) are done. Return the report of the batch, commands listed in
+    input order
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(commands)
+    dependencies = command_dependencies(commands)
+    finished = [False] * len(commands)
+
+    # commands not started yet, in input order
+    waiting: List[int] = list(range(len(commands)))
+    condition = Condition()
+
+    def next_command() -> Optional[int]:
+        """
+        First waiting command whose dependencies are all finished, None once
+        every command started
+        """
+        with condition:
+            while waiting:
+                for position, index in enumerate(waiting):
+                    if all(finished[other] for other in dependencies[index]):
+                        del waiting[position]
+                        return index
+
+                condition.wait()
+
+            return None
+
+    def worker() -> None:
+        client = None
+
+        while True:
+            index = next_command()
+
+            if index is None:
+                break
+
+            start = perf_counter()
+
+            try:
+                # (re)connect lazily, a connection broken by a failed command
+                # is never reused
+                if client is None:
+                    client = make_client()
+
+                    if not client.connect():
+                        client = None
+                        raise ConnectionRefusedError("Server refused the connection")
+
+                    client.negotiate_features(multiplex=False)
+
+                result = client.execute(commands[index])
+
+            except Exception as error:
+                print(traceback.format_exc()) if debug else None
+
+                result = {
+                    "status": "error",
+                    "result": f"{type(error).__name__}: {error}",
+                    "bytes_sent": 0,
+                    "bytes_received": 0,
+                }
+
+                if client is not None:
+                    client.client_socket.close()
+                    client = None
+
+            result["latency_ms"] = round((perf_counter() - start) * 1000, 3)
+            results[index] = {"command": commands[index], **result}
+
+            with condition:
+                finished[index] = True
+                condition.notify_all()
+
+        if client is not None:
+            client.client_socket.close()
+
+    start = perf_counter()
+
+    workers = [
+        Thread(target=worker, daemon=True)
+        for _ in range(max(1, min(connections, len(commands))))
+    ]
+
+    for thread in workers:
+        thread.start()
+
+    for thread in workers:
+        thread.join()
+
+    elapsed = perf_counter() - start
+    done: List[Dict[str, Any]] = [result for result in results if result is not None]
+
+    return {
+        "connections": len(workers),
+        "elapsed_ms": round(elapsed * 1000, 3),
+        "commands": done,
+        "ok": sum(result["status"] == "ok" for result in done),
+        "failed": sum(result["status"] != "ok" for result in done),
+        "bytes_sent": sum(result["bytes_sent"] for result in done),
+        "bytes_received": sum(result["bytes_received"] for result in done),
+    }
@@ -0,0 +1,628 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Load generator and benchmark of the FTP server. A weighted mix of
+# help/get/put/summary/change requests is run by concurrent clients for a fixed
+# duration, and throughput, latency percentiles and error rates are reported as
+# JSON, optionally compared against the report of a previous run.
+
+
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from math import ceil
+from random import Random
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import os
+import sys
+
+try:
+    from myftp.client import Client, check_directory
+except ImportError:
+    from client import Client, check_directory
+
+# operations a mix is made of
+OPERATIONS: Tuple[str, ...] = ("help", "get", "put", "summary", "change")
+
+DEFAULT_MIX: str = "get=50,put=20,summary=10,help=10,change=10"
+DEFAULT_FILE_SIZES: str = "1K=4,64K=2,1M=1"
+
+# suffixes accepted in file sizes
+SIZE_UNITS: Dict[str, int] = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+
+# latency percentiles reported, name -> fraction of the requests below it
+PERCENTILES: Dict[str, float] = {"p50": 0.50, "p99": 0.99, "p999": 0.999}
+
+# a metric worse than its baseline by more than the tolerance is a regression,
+# throughputs must not drop, latencies and error rates must not rise (any error
+# is a regression from an error free baseline)
+HIGHER_IS_BETTER: Dict[str, bool] = {
+    "throughput_rps": True,
+    "throughput_bytes_per_s": True,
+    "p50": False,
+    "p99": False,
+    "p999": False,
+    "error_rate": False,
+}
+
+# a tail percentile is only compared when both runs measured at least this
+# many requests in its scope, below that it hinges on a handful of requests
+MIN_REQUESTS: Dict[str, int] = {"p99": 1000, "p999": 10000}
+
+# tail percentiles are noisier than the other metrics, they get their own
+# tolerance
+TAIL_PERCENTILES: Tuple[str, ...] = ("p99", "p999")
+DEFAULT_TOLERANCE: float = 0.1
+DEFAULT_TAIL_TOLERANCE: float = 0.5
+
+
+def parse_weights(spec: str, parse_key) -> List[Tuple[Any, float]]:
+    """
+    Parse "key=weight,key=weight" into (key, weight) pairs, weights default
+    to 1
+    """
+    pairs = []
+
+    for item in spec.split(","):
+        item = item.strip()
+
+        if not item:
+            continue
+
+        key, _, weight = item.partition("=")
+        pairs.append((parse_key(key.strip()), float(weight) if weight else 1.0))
+
+    if not pairs or any(weight < 0 for _, weight in pairs):
+        raise ValueError(f"Invalid weights {spec!r}")
+
+    if sum(weight for _, weight in pairs) <= 0:
+        raise ValueError(f"Weights of {spec!r} are all zero")
+
+    return pairs
+
+
+def parse_operation(name: str) -> str:
+    if name.lower() not in OPERATIONS:
+        raise ValueError(f"Unknown operation {name!r}, expected one of {OPERATIONS}")
+
+    return name.lower()
+
+
+def parse_size(text: str) -> int:
+    unit = SIZE_UNITS.get(text[-1:].upper(), 1)
+    number = text[:-1] if unit > 1 else text
+
+    return int(float(number) * unit)
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list
+    """
+    if not sorted_values:
+        return 0.0
+
+    rank = ceil(fraction * len(sorted_values)) - 1
+
+    return sorted_values[max(0, min(len(sorted_values) - 1, rank))]
+
+
+class Workload:
+    """
+    Files a benchmark runs against and the commands of its mix
+
+    Every kind of file exists once per file size class: get and summary
+    files are shared, read only, by every client. Put and change files are
+    owned by one client each, so concurrent requests never race on a file,
+    and each client downloads into a directory of its own
+    """
+
+    def __init__(
+        self,
+        directory_path: str,
+        mix: List[Tuple[str, float]],
+        file_sizes: List[Tuple[int, float]],
+        concurrency: int,
+    ) -> None:
+        self.directory_path = directory_path
+        self.operations = [operation for operation, _ in mix]
+        self.operation_weights = [weight for _, weight in mix]
+        self.sizes = [size for size, _ in file_sizes]
+        self.size_weights = [weight for _, weight in file_sizes]
+        self.concurrency = concurrency
+
+    def client_directory(self, index: int) -> str:
+        return os.path.join(self.directory_path, f"client{index}")
+
+    @property
+    def seed_directory(self) -> str:
+        return os.path.join(self.directory_path, "seed")
+
+    def prepare(self, make_client) -> None:
+        """
+        Write the files of the workload and put the shared ones and the
+        change files on the server
+        """
+        os.makedirs(self.seed_directory, exist_ok=True)
+
+        # files put on the server
+        seeds: List[str] = []
+
+        for size_class, size in enumerate(self.sizes):
+            seeds += [f"bget{size_class}.bin", f"bsum{size_class}.txt"]
+
+            write_random_file(os.path.join(self.seed_directory, seeds[-2]), size)
+            write_numbers_file(os.path.join(self.seed_directory, seeds[-1]), size)
+
+        for index in range(self.concurrency):
+            directory = self.client_directory(index)
+            os.makedirs(directory, exist_ok=True)
+
+            for size_class, size in enumerate(self.sizes):
+                write_random_file(
+                    os.path.join(directory, f"bput{index}_{size_class}.bin"), size
+                )
+
+            seeds.append(f"bchg{index}a")
+            write_random_file(os.path.join(self.seed_directory, seeds[-1]), 64)
+
+        client = make_client(self.seed_directory)
+
+        if not client.connect():
+            raise ConnectionRefusedError("Server refused the connection")
+
+        try:
+            for name in seeds:
+                result = client.execute(f"put {name}")
+
+                if result["status"] != "ok":
+                    raise RuntimeError(f"Could not put {name}: {result['result']}")
+        finally:
+            client.client_socket.close()
+
+    def commands(self, index: int, seed: int):
+        """
+        Endless commands of client index, as (operation, command) pairs
+        """
+        random = Random(seed * 1000003 + index)
+        renamed = False
+
+        while True:
+            operation = random.choices(self.operations, self.operation_weights)[0]
+            size_class = random.choices(range(len(self.sizes)), self.size_weights)[0]
+
+            if operation == "help":
+                yield operation, "help"
+
+            elif operation == "get":
+                yield operation, f"get bget{size_class}.bin"
+
+            elif operation == "put":
+                yield operation, f"put bput{index}_{size_class}.bin"
+
+            elif operation == "summary":
+                yield operation, f"summary bsum{size_class}.txt"
+
+            else:
+                # the file goes back and forth between two names
+                old, new = ("b", "a") if renamed else ("a", "b")
+                renamed = not renamed
+
+                yield operation, f"change bchg{index}{old} bchg{index}{new}"
+
+
+def write_random_file(path: str, size: int) -> None:
+    with open(path, "wb") as file:
+        remaining = size
+
+        while remaining > 0:
+            chunk = os.urandom(min(remaining, 1024 * 1024))
+            file.write(chunk)
+            remaining -= len(chunk)
+
+
+def write_numbers_file(path: str, size: int) -> None:
+    """
+    Numeric file of about size bytes (at least one number) for summaries
+    """
+    random = Random(size)
+
+    with open(path, "w") as file:
+        written = 0
+
+        while written == 0 or written < size:
+            line = f"{random.randrange(1_000_000_000)}\n"
+            file.write(line)
+            written += len(line)
+
+
+class Recorder:
+    """
+    Latency and outcome of every request of a run, shared by the clients
+    """
+
+    def __init__(self) -> None:
+        self.lock = Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+
+    def record(
+        self, operation: str, latency_ms: float, ok: bool, bytes_moved: int
+    ) -> None:
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(latency_ms)
+            self.errors[operation] = self.errors.get(operation, 0) + (not ok)
+            self.bytes[operation] = self.bytes.get(operation, 0) + bytes_moved
+
+    def summarize(self, elapsed: float) -> Dict[str, Any]:
+        with self.lock:
+            operations = {
+                operation: summarize_requests(
+                    latencies, self.errors[operation], self.bytes[operation], elapsed
+                )
+                for operation, latencies in sorted(self.latencies.items())
+            }
+
+            overall = summarize_requests(
+                [
+                    latency
+                    for latencies in self.latencies.values()
+                    for latency in latencies
+                ],
+                sum(self.errors.values()),
+                sum(self.bytes.values()),
+                elapsed,
+            )
+
+        return {**overall, "operations": operations}
+
+
+def summarize_requests(
+    latencies: List[float], errors: int, bytes_moved: int, elapsed: float
+) -> Dict[str, Any]:
+    ordered = sorted(latencies)
+    requests = len(ordered)
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": errors / requests if requests else 0.0,
+        "throughput_rps": round(requests / elapsed, 3) if elapsed else 0.0,
+        "throughput_bytes_per_s": round(bytes_moved / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            **{
+                name: round(percentile(ordered, fraction), 3)
+                for name, fraction in PERCENTILES.items()
+            },
+            "mean": round(sum(ordered) / requests, 3) if requests else 0.0,
+            "max": round(ordered[-1], 3) if ordered else 0.0,
+        },
+    }
+
+
+def run_benchmark(
+    make_client,
+    workload: Workload,
+    duration: float,
+    seed: int = 0,
+    warmup: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Run the workload with one client per concurrency slot for warmup plus
+    duration seconds, only the requests started after the warmup count
+
+    Every client reconnects after a failed request, since its connection may
+    be out of step with the server
+    """
+    recorder = Recorder()
+    start = perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    def run_client(index: int) -> None:
+        client: Optional[Client] = None
+
+        for operation, command in workload.commands(index, seed):
+            started = perf_counter()
+
+            if started >= deadline:
+                break
+
+            try:
+                if client is None:
+                    client = make_client(workload.client_directory(index))
+
+                    if not client.connect():
+                        client = None
+                        raise ConnectionRefusedError("Server refused the connection")
+
+                result = client.execute(command)
+                ok = result["status"] == "ok"
+                bytes_moved = result["bytes_sent"] + result["bytes_received"]
+
+            except Exception:
+                ok = False
+                bytes_moved = 0
+
+                if client is not None:
+                    client.client_socket.close()
+                    client = None
+
+            if started >= measure_from:
+                recorder.record(
+                    operation, (perf_counter() - started) * 1000, ok, bytes_moved
+                )
+
+        if client is not None:
+            client.client_socket.close()
+
+    threads = [
+        Thread(target=run_client, args=(index,), daemon=True)
+        for index in range(workload.concurrency)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # requests still running at the deadline are waited for and counted
+    elapsed = max(perf_counter(), deadline) - measure_from
+
+    return {"elapsed_s": round(elapsed, 3), **recorder.summarize(elapsed)}
+
+
+def compare_to_baseline(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = DEFAULT_TOLERANCE,
+    tail_tolerance: float = DEFAULT_TAIL_TOLERANCE,
+    per_operation: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Metrics of report worse than in baseline by more than tolerance (a
+    fraction, tail_tolerance for the tail percentiles), overall and, with
+    per_operation, per operation run in both
+
+    Tail percentiles measured over too few requests (see MIN_REQUESTS) are
+    left out, a single slow request would move them
+    """
+    regressions = []
+
+    scopes = [("overall", report, baseline)]
+
+    if per_operation:
+        scopes += [
+            (operation, results, baseline["operations"][operation])
+            for operation, results in report["operations"].items()
+            if operation in baseline.get("operations", {})
+        ]
+
+    for scope, current, previous in scopes:
+        requests = min(current["requests"], previous["requests"])
+
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            if requests < MIN_REQUESTS.get(metric, 0):
+                continue
+
+            allowed = tail_tolerance if metric in TAIL_PERCENTILES else tolerance
+
+            if metric in PERCENTILES:
+                value = current["latency_ms"][metric]
+                reference = previous["latency_ms"][metric]
+            else:
+                value = current[metric]
+                reference = previous[metric]
+
+            if higher_is_better:
+                regressed = value < reference * (1 - allowed)
+            else:
+                regressed = value > reference * (1 + allowed)
+
+            if regressed:
+                regressions.append(
+                    {
+                        "scope": scope,
+                        "metric": metric,
+                        "baseline": reference,
+                        "value": value,
+                    }
+                )
+
+    return regressions
+
+
+def init():
+    arg_parser = ArgumentParser(
+        description="Benchmark a running FTP server with a mix of requests"
+    )
+
+    arg_parser.add_argument(
+        "--ip_addr", default="127.0.0.1", type=str, help="Server IP address"
+    )
+
+    arg_parser.add_argument(
+        "--port_number", default=12000, type=int, help="Server port number"
+    )
+
+    arg_parser.add_argument(
+        "--protocol", default="TCP", choices=["TCP", "UDP"], help="Default = TCP"
+    )
+
+    arg_parser.add_argument(
+        "--reliable_udp",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="UDP only: use reliable UDP, needed for files larger than one datagram (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--directory",
+        required=True,
+        type=str,
+        help="Directory the benchmark files are written to and downloaded into",
+    )
+
+    arg_parser.add_argument(
+        "--mix",
+        default=DEFAULT_MIX,
+        type=str,
+        help=f"Weights of the operations among {','.join(OPERATIONS)}. Default = {DEFAULT_MIX}",
+    )
+
+    arg_parser.add_argument(
+        "--file_sizes",
+        default=DEFAULT_FILE_SIZES,
+        type=str,
+        help=f"Weights of the sizes of the files got, put and summarized, K/M/G suffixes allowed. Default = {DEFAULT_FILE_SIZES}",
+    )
+
+    arg_parser.add_argument(
+        "--concurrency",
+        default=4,
+        type=int,
+        help="Clients sending requests at the same time, each on its own connection. Default = 4",
+    )
+
+    arg_parser.add_argument(
+        "--duration",
+        default=10,
+        type=float,
+        help="Seconds the requests are measured for. Default = 10",
+    )
+
+    arg_parser.add_argument(
+        "--warmup",
+        default=1,
+        type=float,
+        help="Seconds of requests run before measuring. Default = 1",
+    )
+
+    arg_parser.add_argument(
+        "--seed",
+        default=0,
+        type=int,
+        help="Seed of the request sequences, the same seed replays the same mix. Default = 0",
+    )
+
+    arg_parser.add_argument(
+        "--report",
+        default="-",
+        type=str,
+        help="File the JSON report is written to, usable as a later --baseline. Default = - (stdout)",
+    )
+
+    arg_parser.add_argument(
+        "--baseline",
+        type=str,
+        required=False,
+        help="Report of a previous run: exit with status 1 if this run regressed from it",
+    )
+
+    arg_parser.add_argument(
+        "--tolerance",
+        default=DEFAULT_TOLERANCE,
+        type=float,
+        help=f"Fraction a metric may be worse than its baseline by before being reported as a regression. Default = {DEFAULT_TOLERANCE}",
+    )
+
+    arg_parser.add_argument(
+        "--tail_tolerance",
+        default=DEFAULT_TAIL_TOLERANCE,
+        type=float,
+        help=f"--tolerance of the p99 and p999 latencies. Default = {DEFAULT_TAIL_TOLERANCE}",
+    )
+
+    arg_parser.add_argument(
+        "--per_operation",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="Also compare the metrics of each request type to the baseline, not only the overall ones. Default = 0",
+    )
+
+    arg_parser.add_argument(
+        "--debug",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        help="Enable or disable the flag (0 or 1)",
+    )
+
+    args = arg_parser.parse_args()
+
+    try:
+        mix = parse_weights(args.mix, parse_operation)
+        file_sizes = parse_weights(args.file_sizes, parse_size)
+    except ValueError as error:
+        arg_parser.error(str(error))
+
+    if args.concurrency < 1 or args.duration <= 0 or args.warmup < 0:
+        arg_parser.error("--concurrency and --duration must be positive")
+
+    if not check_directory(args.directory):
+        return
+
+    def make_client(directory_path: str) -> Client:
+        return Client(
+            args.ip_addr,
+            args.port_number,
+            directory_path,
+            args.debug,
+            args.protocol,
+            bool(args.reliable_udp),
+        )
+
+    workload = Workload(args.directory, mix, file_sizes, args.concurrency)
+
+    # client messages would drown the report, they go to stderr with --debug
+    with open(os.devnull, "w") as devnull, redirect_stdout(
+        sys.stderr if args.debug else devnull
+    ):
+        workload.prepare(make_client)
+        results = run_benchmark(
+            make_client, workload, args.duration, args.seed, args.warmup
+        )
+
+    report: Dict[str, Any] = {
+        "config": {
+            "protocol": args.protocol,
+            "reliable_udp": bool(args.reliable_udp),
+            "mix": dict(mix),
+            "file_sizes": {str(size): weight for size, weight in file_sizes},
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "seed": args.seed,
+        },
+        **results,
+    }
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        report["regressions"] = compare_to_baseline(
+            report,
+            baseline,
+            args.tolerance,
+            args.tail_tolerance,
+            bool(args.per_operation),
+        )
+
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    init()
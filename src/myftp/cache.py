@@ -0,0 +1,177 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Bounded caches used by the FTP server. Entries are tied to the
+# identity of the file they were computed from, so a cached value is never
+# served for a file that changed on disk.
+
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional, Tuple
+import os
+
+# size, modification time in nanoseconds and inode of a file
+FileIdentity = Tuple[int, int, int]
+
+
+def file_identity(path: str) -> FileIdentity:
+    """
+    Raise FileNotFoundError (or another OSError) if path can not be stat'ed
+    """
+    return stat_identity(os.stat(path))
+
+
+def stat_identity(stat: os.stat_result) -> FileIdentity:
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
+
+class LRUCache:
+    """
+    Thread safe least recently used cache holding at most capacity entries
+
+    Every entry remembers the identity of the file it was computed from, a
+    lookup with a different identity is a miss. A capacity of 0 disables the
+    cache
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.entries: OrderedDict[Hashable, Tuple[FileIdentity, Any]] = OrderedDict()
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, identity: FileIdentity) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[0] != identity:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[1]
+
+    def put(self, key: Hashable, identity: FileIdentity, value: Any) -> None:
+        if self.capacity <= 0:
+            return
+
+        with self.lock:
+            self.entries[key] = (identity, value)
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ByteBudgetCache:
+    """
+    Thread safe cache of file contents bounded by their total size in bytes
+
+    Files larger than max_entry_bytes are never cached. When the budget is
+    exceeded, entries are evicted by least recent use ("lru") or least
+    frequent use ("lfu", ties broken by recency). Contents are stored as
+    immutable bytes, shared by every reader without copying. A budget of 0
+    disables the cache
+    """
+
+    def __init__(
+        self, max_bytes: int, max_entry_bytes: int, policy: str = "lru"
+    ) -> None:
+        if policy not in {"lru", "lfu"}:
+            raise ValueError(f"Unknown eviction policy {policy}")
+
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self.policy = policy
+
+        # key -> [identity, content, number of hits], least recently used first
+        self.entries: OrderedDict[Hashable, list] = OrderedDict()
+        self.size = 0
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def admits(self, length: int) -> bool:
+        return 0 < length <= self.max_entry_bytes
+
+    def get(self, key: Hashable, identity: FileIdentity) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get(key)
+
+            if entry is None or entry[0] != identity:
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            entry[2] += 1
+            self.hits += 1
+
+            return entry[1]
+
+    def put(self, key: Hashable, identity: FileIdentity, content: bytes) -> None:
+        if not self.admits(len(content)):
+            return
+
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+
+            while self.entries and self.size + len(content) > self.max_bytes:
+                self.evict()
+
+            self.entries[key] = [identity, content, 0]
+            self.size += len(content)
+
+    def evict(self) -> None:
+        """
+        Drop one entry according to the policy, the lock must be held
+        """
+        if self.policy == "lru":
+            key = next(iter(self.entries))
+        else:
+            # first minimum in recency order is the least recently used one
+            key = min(self.entries, key=lambda k: self.entries[k][2])
+
+        self.size -= len(self.entries.pop(key)[1])
+        self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+
+            if entry is not None:
+                self.size -= len(entry[1])
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
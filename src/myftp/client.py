@@ -3,12 +3,252 @@
 # Description: FTP client (both UDP and TCP implemented)
 
 
-from socket import socket, AF_INET, SOCK_DGRAM, SOCK_STREAM
-from typing import Pattern, Tuple, Optional
+from socket import (
+    socket,
+    AF_INET,
+    SOCK_DGRAM,
+    SOCK_STREAM,
+    IPPROTO_TCP,
+    TCP_NODELAY,
+)
+from typing import Any, BinaryIO, Dict, Pattern, Tuple, Optional, Union
 from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime
+from threading import BoundedSemaphore, Lock, Thread
+from hashlib import sha256
 import traceback
+import json
 import os
 import re
+import sys
+
+from tempfile import SpooledTemporaryFile
+
+try:
+    from myftp.transport import (
+        MAX_DATAGRAM_SIZE,
+        SPOOL_MAX_SIZE,
+        BufferReader,
+        CountingReader,
+        FileReader,
+        SocketReader,
+        send_message,
+    )
+    from myftp.rudp import ReliableChannel, socket_recv_fn
+    from myftp.batch import read_commands, run_batch
+    from myftp.compression import (
+        COMPRESSED_GET_EXTENDED_OPCODE,
+        COMPRESSED_GET_FIRST_BYTE,
+        COMPRESSED_HEADER,
+        COMPRESSED_PUT_FIRST_BYTE,
+        NO_COMPRESSION,
+        DecompressingWriter,
+        algorithm_features,
+        algorithm_names,
+        compress_file,
+        format_stats,
+    )
+    from myftp.dedup import PUT_HASH_REQUEST, content_hash, request_put_hash
+    from myftp.conditional import (
+        CACHE_FILENAME,
+        CONDITIONAL_GET_EXTENDED_OPCODE,
+        CONDITIONAL_GET_RESPONSE,
+        NOT_MODIFIED,
+        DownloadCache,
+        build_conditional_get_request,
+    )
+    from myftp.metrics import STATS_EXTENDED_OPCODE, STATS_FIRST_BYTE, read_stats
+    from myftp.summary import (
+        SUMMARY_STATS_EXTENDED_OPCODE,
+        SUMMARY_STATS_FIRST_BYTE,
+        read_summary_stats,
+    )
+    from myftp.listing import (
+        LIST_EXACT,
+        LIST_EXTENDED_OPCODE,
+        LIST_WITH_HASH,
+        build_list_request,
+        read_listing,
+    )
+    from myftp.delta import (
+        HashingWriter,
+        compute_delta,
+        parse_signatures,
+        request_delta_put,
+        request_signatures,
+    )
+    from myftp.mux import (
+        FEATURE_CONDITIONAL_GET,
+        FEATURE_DEDUP,
+        FEATURE_DELTA,
+        FEATURE_MULTIPLEX,
+        FEATURE_PROTOCOL_V2,
+        FEATURE_RANGES,
+        FEATURE_RESUME,
+        FIN_FLAG,
+        MuxWriter,
+        StreamReader,
+        read_frame,
+        request_hello,
+    )
+    from myftp.protocol import (
+        CHANGE_OPCODE,
+        EXTENDED_OPCODE,
+        FILE_NOT_FOUND_RESCODE,
+        FIRST_BYTE_FIELDS,
+        FIRST_BYTES,
+        GET_OK_RESCODE,
+        GET_OPCODE,
+        HELP_OPCODE,
+        HELP_RESCODE,
+        PROTOCOL_V1,
+        PROTOCOL_V2,
+        PROTOCOL_VERSIONS,
+        PUT_OK_RESCODE,
+        PUT_OPCODE,
+        SUMMARY_OK_RESCODE,
+        SUMMARY_OPCODE,
+        UNKNOWN_OPCODE,
+        V1_MAX_NAME_LENGTH,
+        V1_MAX_SIZE,
+        encode_field,
+        encode_named,
+        encode_size,
+        error_rescodes,
+        read_response_length,
+        read_size,
+        rescode_meanings,
+    )
+    from myftp.ranges import (
+        DEFAULT_RANGE_CHUNK_SIZE,
+        DEFAULT_RANGE_THRESHOLD,
+        MAX_EXTENDED_NAME_LENGTH,
+        Checkpoint,
+        RangeError,
+        connect,
+        encode_filename,
+        plan_ranges,
+        range_crc32,
+        request_checksum,
+        request_get_range,
+        request_put_append,
+        request_put_range,
+        request_put_status,
+        run_ranges,
+    )
+except ImportError:
+    from transport import (
+        MAX_DATAGRAM_SIZE,
+        SPOOL_MAX_SIZE,
+        BufferReader,
+        CountingReader,
+        FileReader,
+        SocketReader,
+        send_message,
+    )
+    from rudp import ReliableChannel, socket_recv_fn
+    from batch import read_commands, run_batch
+    from compression import (
+        COMPRESSED_GET_EXTENDED_OPCODE,
+        COMPRESSED_GET_FIRST_BYTE,
+        COMPRESSED_HEADER,
+        COMPRESSED_PUT_FIRST_BYTE,
+        NO_COMPRESSION,
+        DecompressingWriter,
+        algorithm_features,
+        algorithm_names,
+        compress_file,
+        format_stats,
+    )
+    from dedup import PUT_HASH_REQUEST, content_hash, request_put_hash
+    from conditional import (
+        CACHE_FILENAME,
+        CONDITIONAL_GET_EXTENDED_OPCODE,
+        CONDITIONAL_GET_RESPONSE,
+        NOT_MODIFIED,
+        DownloadCache,
+        build_conditional_get_request,
+    )
+    from metrics import STATS_EXTENDED_OPCODE, STATS_FIRST_BYTE, read_stats
+    from summary import (
+        SUMMARY_STATS_EXTENDED_OPCODE,
+        SUMMARY_STATS_FIRST_BYTE,
+        read_summary_stats,
+    )
+    from listing import (
+        LIST_EXACT,
+        LIST_EXTENDED_OPCODE,
+        LIST_WITH_HASH,
+        build_list_request,
+        read_listing,
+    )
+    from delta import (
+        HashingWriter,
+        compute_delta,
+        parse_signatures,
+        request_delta_put,
+        request_signatures,
+    )
+    from mux import (
+        FEATURE_CONDITIONAL_GET,
+        FEATURE_DEDUP,
+        FEATURE_DELTA,
+        FEATURE_MULTIPLEX,
+        FEATURE_PROTOCOL_V2,
+        FEATURE_RANGES,
+        FEATURE_RESUME,
+        FIN_FLAG,
+        MuxWriter,
+        StreamReader,
+        read_frame,
+        request_hello,
+    )
+    from protocol import (
+        CHANGE_OPCODE,
+        EXTENDED_OPCODE,
+        FILE_NOT_FOUND_RESCODE,
+        FIRST_BYTE_FIELDS,
+        FIRST_BYTES,
+        GET_OK_RESCODE,
+        GET_OPCODE,
+        HELP_OPCODE,
+        HELP_RESCODE,
+        PROTOCOL_V1,
+        PROTOCOL_V2,
+        PROTOCOL_VERSIONS,
+        PUT_OK_RESCODE,
+        PUT_OPCODE,
+        SUMMARY_OK_RESCODE,
+        SUMMARY_OPCODE,
+        UNKNOWN_OPCODE,
+        V1_MAX_NAME_LENGTH,
+        V1_MAX_SIZE,
+        encode_field,
+        encode_named,
+        encode_size,
+        error_rescodes,
+        read_response_length,
+        read_size,
+        rescode_meanings,
+    )
+    from ranges import (
+        DEFAULT_RANGE_CHUNK_SIZE,
+        DEFAULT_RANGE_THRESHOLD,
+        MAX_EXTENDED_NAME_LENGTH,
+        Checkpoint,
+        RangeError,
+        connect,
+        encode_filename,
+        plan_ranges,
+        range_crc32,
+        request_checksum,
+        request_get_range,
+        request_put_append,
+        request_put_range,
+        request_put_status,
+        run_ranges,
+    )
 
 
 # Patterns for command matchings
@@ -20,30 +260,38 @@ summary_command_pattern: Pattern = re.compile(r"^summary\s+[^\s]+$", re.IGNORECA
 change_command_pattern: Pattern = re.compile(
     r"^change\s+[^\s]+\s+[^\s]+$", re.IGNORECASE
 )
+list_command_pattern: Pattern = re.compile(r"^list(\s+[^\s]+){0,2}$", re.IGNORECASE)
+stat_command_pattern: Pattern = re.compile(r"^stat\s+[^\s]+$", re.IGNORECASE)
+
+# prefix of a list command listing every file
+LIST_ALL_PREFIX: str = "*"
+
+# commands whose file names go into the first byte with protocol version 1
+named_command_patterns: tuple[Pattern, ...] = (
+    get_command_pattern,
+    put_command_pattern,
+    summary_command_pattern,
+    change_command_pattern,
+)
+
 
-# opcodes
-put_request_opcode: int = 0b000
-get_request_opcode: int = 0b001
-change_request_opcode: int = 0b010
-summary_request_opcode: int = 0b011
-help_request_opcode: int = 0b100
-unknown_request_opcode: int = 0b101
-
-# Res-code dict
-rescode_dict: dict[int, str] = {
-    0b011: "File Not Found Error",
-    0b100: "Unknown Request",
-    0b101: "Change/Put Unsuccessful Error",
-    0b000: "Put/Change Request Successful",
-    0b001: "Get Request Successful",
-    0b010: "Summary Request Successful",
-    0b110: "Help",
-}
+def fits_extended_requests(command: str) -> bool:
+    """
+    Whether the file names of command fit the 1 byte name length of the
+    extended requests. Longer names, protocol v2 only, go through the plain
+    requests, without the features built on extended ones
+    """
+    return all(len(name) <= MAX_EXTENDED_NAME_LENGTH for name in command.split()[1:])
 
 
 # custome type to represent the hostname(server name) and the server port
 Address = Tuple[str, int]
 
+# where a response from the server is read from
+Reader = Union[
+    SocketReader, BufferReader, FileReader, StreamReader, CountingReader
+]
+
 
 class Client:
     def __init__(
@@ -53,6 +301,18 @@ class Client:
         directory_path: str,
         debug: bool,
         protocol: str,
+        reliable_udp: bool = False,
+        multiplex: bool = False,
+        range_streams: int = 1,
+        range_chunk_size: int = DEFAULT_RANGE_CHUNK_SIZE,
+        range_threshold: int = DEFAULT_RANGE_THRESHOLD,
+        resume: bool = False,
+        compression: int = NO_COMPRESSION,
+        delta: bool = False,
+        dedup: bool = False,
+        protocol_version: int = PROTOCOL_V2,
+        download_cache: Optional[DownloadCache] = None,
+        summary_format: str = "text",
     ):
         self.server_name: str = server_name
         self.server_port: int = server_port
@@ -60,7 +320,137 @@ class Client:
         self.directory_path = directory_path
         self.debug = debug
 
+        # UDP only: segment, acknowledge and retransmit payloads so files
+        # larger than one datagram survive packet loss
+        self.reliable_udp = reliable_udp
+
+        # TCP only: ask the server to run requests concurrently over the
+        # connection, the prompt does not wait for responses anymore
+        self.multiplex = multiplex
+        self.mux_writer: Optional[MuxWriter] = None
+        self.streams: dict[int, StreamReader] = {}
+        self.streams_lock = Lock()
+        self.stream_handlers: list[Thread] = []
+
+        # client streams use odd ids
+        self.next_stream_id = 1
+
+        # TCP only: gets and puts of files of at least range_threshold bytes
+        # are cut into ranges of range_chunk_size bytes moved over
+        # range_streams parallel connections, 1 disables range transfers
+        self.range_streams = range_streams
+        self.range_chunk_size = range_chunk_size
+        self.range_threshold = range_threshold
+
+        # TCP only: interrupted gets and puts carry on where they stopped
+        self.resume = resume
+
+        # TCP only: algorithm get and put bodies are compressed with, if the
+        # server supports it. Features accepted by the server in its hello
+        self.compression = compression
+        self.server_features = 0
+        self.last_compression: Optional[Dict[str, Any]] = None
+
+        # metrics of the server, from the last stats command
+        self.last_stats: Optional[Dict[str, Any]] = None
+
+        # files of the server, from the last list or stat command
+        self.last_listing: Optional[Dict[str, Any]] = None
+
+        # summaries come back as summary.txt (text) or as statistics packed in
+        # binary (binary). Statistics from the last binary summary
+        self.summary_format = summary_format
+        self.last_summary: Optional[Dict[str, Any]] = None
+
+        # TCP only: puts of a file the server already has a copy of only send
+        # what changed
+        self.delta = delta
+
+        # TCP only: puts first offer the hash of the file, a server already
+        # storing that content does not need the upload
+        self.dedup = dedup
+
+        # TCP only: highest framing of the plain requests asked for in the
+        # hello, the framing the server agreed to and whether a hello already
+        # asked for it
+        self.wanted_protocol_version = protocol_version
+        self.protocol_version = PROTOCOL_V1
+        self.framing_negotiated = False
+
+        # TCP only: validators of the files downloaded before, gets of a file
+        # whose local copy is still up to date only cost a header. Whether
+        # the last get was answered from it
+        self.download_cache = download_cache
+        self.last_cache: Optional[str] = None
+
     def run(self):
+        if not self.connect():
+            return
+
+        try:
+            self.negotiate_features(self.multiplex)
+
+            while True:
+                # get command from user
+                command = input(f"myftp> - {self.protocol} - : ").strip()
+
+                # handling the "bye" command
+                if command == "bye" or command == "BYE":
+                    if self.mux_writer is not None:
+                        self.close_multiplexing()
+
+                    self.client_socket.close()
+                    print(f"myftp> - {self.protocol} - Session is terminated")
+                    break
+
+                # gets and puts may go through extended requests instead
+                if self.transfer_extended(command) is not None:
+                    continue
+
+                # file streamed after the payload, only set by put
+                payload, data, data_length = self.build_request(command)
+
+                print(
+                    f"myftp> - {self.protocol} - sent payload {payload} to the server. Payload length is {len(payload)}"
+                ) if self.debug else None
+
+                # the response is parsed in the background, the prompt is back
+                # right away
+                if self.mux_writer is not None:
+                    self.submit_multiplexed(payload, data, data_length)
+                else:
+                    self.exchange(payload, data, data_length)
+
+        except ConnectionRefusedError:
+            print(
+                f"myftp> - {self.protocol} - ConnectionRefusedError happened. Please restart the client program, make sure the server is running and/or put a different server name and server port."
+            )
+
+        except TimeoutError:
+            # Server did not respond within the specified timeout
+            print(
+                f"myftp> - {self.protocol} - Server at {self.server_name} did not respond within 5 seconds. Check the address or server status."
+            )
+
+        except KeyboardInterrupt:
+            print(f"\nmyftp> - {self.protocol} - Client shutting down")
+
+        except Exception as error:
+            traceback_info = traceback.format_exc()
+
+            print(f"myftp> - {self.protocol} - {error} happened.")
+
+            print(traceback_info)
+
+        finally:
+            self.client_socket.close()
+
+    def connect(self) -> bool:
+        """
+        Create the client socket, connected to the server if using TCP
+
+        Return False if the server refused the connection
+        """
         self.client_socket = socket(
             AF_INET, (SOCK_DGRAM if self.protocol == "UDP" else SOCK_STREAM)
         )
@@ -75,243 +465,1228 @@ class Client:
             print(
                 f"myftp> - {self.protocol} - ConnectionRefusedError happened. Please restart the client program, make sure the server is running and/or put a different server name and server port."
             )
-            return
+            return False
+
+        # requests are sent in pieces (header, then file content), which Nagle
+        # would hold back until the server acknowledges the previous one
+        if self.protocol == "TCP":
+            self.client_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+        self.socket_reader = SocketReader(self.client_socket)
+
+        if self.protocol == "UDP" and self.reliable_udp:
+            self.channel = ReliableChannel(
+                lambda datagram: self.client_socket.sendto(
+                    datagram, (self.server_name, self.server_port)
+                ),
+                socket_recv_fn(self.client_socket),
+            )
+
+        return True
+
+    def exchange(
+        self, payload: bytes, data: Optional[BinaryIO], data_length: int
+    ) -> Tuple[int, int]:
+        """
+        Send one request, followed by data_length bytes of data for a put,
+        then wait for its response and parse it
+
+        Return the rescode of the response and its size in bytes
+        """
+        if self.protocol == "UDP" and self.reliable_udp:
+            if data is not None:
+                with data:
+                    self.channel.send_message(payload, data, data_length)
+            else:
+                self.channel.send_message(payload)
+
+            with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as response:
+                self.channel.recv_message(response)
+                response.seek(0)
+
+                response_reader = CountingReader(FileReader(response))  # type: ignore
+
+                rescode = self.parse_response_payload(response_reader)
+
+                return rescode, response_reader.count
+
+        elif self.protocol == "UDP":
+            if data is not None:
+                with data:
+                    payload += data.read(data_length)
+
+            self.client_socket.sendto(payload, (self.server_name, self.server_port))
+
+            response_reader = CountingReader(
+                BufferReader(self.client_socket.recv(MAX_DATAGRAM_SIZE))
+            )
+        else:
+            # put: the file content is streamed right after the header
+            if data is not None:
+                with data:
+                    send_message(self.client_socket, payload, data, data_length)
+            else:
+                self.client_socket.sendall(payload)
+
+            response_reader = CountingReader(self.socket_reader)
+
+        return self.parse_response_payload(response_reader), response_reader.count
+
+    def execute(self, command: str) -> Dict[str, Any]:
+        """
+        Run one command without any prompt, return what happened to it
+        """
+        result = self.transfer_extended(command)
+
+        if result is not None:
+            return result
+
+        self.last_compression = None
+        self.last_stats = None
+        self.last_listing = None
+        self.last_cache = None
+        self.last_summary = None
+
+        payload, data, data_length = self.build_request(command)
+        rescode, bytes_received = self.exchange(payload, data, data_length)
+
+        result = {
+            "status": "failed" if rescode in error_rescodes else "ok",
+            "result": rescode_meanings.get(rescode, "Unknown rescode"),
+            "bytes_sent": len(payload) + data_length,
+            "bytes_received": bytes_received,
+        }
+
+        if self.last_compression is not None:
+            result["compression"] = self.last_compression
+
+        if self.last_stats is not None:
+            result["stats"] = self.last_stats
+
+        if self.last_listing is not None:
+            result["listing"] = self.last_listing
+
+        if self.last_cache is not None:
+            result["cache"] = self.last_cache
+
+        if self.last_summary is not None:
+            result["summary"] = self.last_summary
+
+        return result
+
+    def build_request(self, command: str) -> Tuple[bytes, Optional[BinaryIO], int]:
+        """
+        Assemble the request payload of a command typed by the user
+
+        Return the payload, plus for a put the opened file to stream right
+        after it and its size. The caller closes the file
+        """
+        data: Optional[BinaryIO] = None
+        data_length = 0
+
+        # gets carry the validators of the local copy if the server knows
+        # conditional gets
+        if (
+            self.download_cache is not None
+            and self.server_features & FEATURE_CONDITIONAL_GET
+            and get_command_pattern.match(command)
+            and fits_extended_requests(command)
+        ):
+            _, filename = command.split(" ", 1)
+
+            print(
+                f"myftp> - {self.protocol} - Getting file {filename} from the server unless the local copy is up to date"
+            ) if self.debug else None
+
+            return (
+                build_conditional_get_request(
+                    filename, self.download_cache.validators(filename)
+                ),
+                None,
+                0,
+            )
+
+        # bodies go compressed if the server agreed to it
+        if self.negotiated_compression() != NO_COMPRESSION and fits_extended_requests(
+            command
+        ):
+            if get_command_pattern.match(command):
+                return self.build_compressed_get_request(command.split(" ", 1)[1])
+
+            if put_command_pattern.match(command):
+                request = self.build_compressed_put_request(command.split(" ", 1)[1])
+
+                if request is not None:
+                    return request
+
+        # the names of a binary summary are a varint prefixed field whatever
+        # the protocol version
+        if self.summary_format == "binary" and summary_command_pattern.match(command):
+            _, filenames = command.split(" ", 1)
+
+            print(
+                f"myftp> - {self.protocol} - Summary of files {filenames} from the server, in binary"
+            ) if self.debug else None
+
+            return (
+                FIRST_BYTES[SUMMARY_STATS_FIRST_BYTE]
+                + encode_field(filenames.encode("ascii")),
+                None,
+                0,
+            )
+
+        # names longer than 31 characters do not fit a version 1 first byte
+        if self.protocol_version == PROTOCOL_V1 and any(
+            pattern.match(command) for pattern in named_command_patterns
+        ):
+            if any(
+                len(name) > V1_MAX_NAME_LENGTH for name in command.split()[1:]
+            ) and not self.upgrade_protocol():
+                print(
+                    f"myftp> - {self.protocol} - File names longer than {V1_MAX_NAME_LENGTH} characters need protocol v2, which this connection does not use"
+                )
+
+                return FIRST_BYTES[UNKNOWN_OPCODE << 5], None, 0
+
+        # help
+        if command == "help" or command == "HELP":
+            payload = FIRST_BYTES[HELP_OPCODE << 5]
+
+            print(
+                f"myftp> - {self.protocol} - Asking for help from the server"
+            ) if self.debug else None
+
+        # metrics of the server
+        elif command == "stats" or command == "STATS":
+            payload = FIRST_BYTES[STATS_FIRST_BYTE]
+
+            print(
+                f"myftp> - {self.protocol} - Asking for the metrics of the server"
+            ) if self.debug else None
+
+        # list and stat are complete requests of their own
+        elif list_command_pattern.match(command):
+            _, *arguments = command.split()
+            prefix = arguments[0] if arguments else LIST_ALL_PREFIX
+            after = arguments[1] if len(arguments) > 1 else ""
+
+            print(
+                f"myftp> - {self.protocol} - Listing files starting with {prefix} after {after!r} on the server"
+            ) if self.debug else None
+
+            return (
+                build_list_request("" if prefix == LIST_ALL_PREFIX else prefix, after),
+                None,
+                0,
+            )
+
+        elif stat_command_pattern.match(command):
+            _, filename = command.split()
+
+            print(
+                f"myftp> - {self.protocol} - Stat file {filename} on the server"
+            ) if self.debug else None
+
+            return (
+                build_list_request(filename, flags=LIST_EXACT | LIST_WITH_HASH),
+                None,
+                0,
+            )
+
+        # get command handling
+        elif get_command_pattern.match(command):
+            _, filename = command.split(" ", 1)
+
+            payload = encode_named(
+                GET_OPCODE, filename.encode("ascii"), self.protocol_version
+            )
+
+            print(
+                f"myftp> - {self.protocol} - Getting file {filename} from the server"
+            ) if self.debug else None
+
+        # put command handling
+        elif put_command_pattern.match(command):
+            _, filename = command.split(" ", 1)
+
+            payload, data, data_length = self.put_payload_handling(filename)
+
+            print(
+                f"myftp> - {self.protocol} - Putting file {filename} into the server"
+            ) if self.debug else None
+
+        # summary command handling
+        elif summary_command_pattern.match(command):
+            _, filename = command.split(" ", 1)
+
+            print(
+                f"myftp> - {self.protocol} - Summary file {filename} from the server"
+            ) if self.debug else None
+
+            payload = encode_named(
+                SUMMARY_OPCODE, filename.encode("ascii"), self.protocol_version
+            )
+
+        # change command handling
+        elif change_command_pattern.match(command):
+            _, old_filename, new_filename = command.split()
+
+            print(
+                f"myftp> - {self.protocol} - Changing file named {old_filename} into {new_filename} on the server"
+            ) if self.debug else None
+
+            new_filename_bytes = new_filename.encode("ascii")
+
+            payload = encode_named(
+                CHANGE_OPCODE, old_filename.encode("ascii"), self.protocol_version
+            ) + (
+                encode_field(new_filename_bytes)
+                if self.protocol_version == PROTOCOL_V2
+                else FIRST_BYTES[len(new_filename_bytes)] + new_filename_bytes
+            )
+
+        # unknown request, assigned opcode is 0b101
+        else:
+            payload = FIRST_BYTES[UNKNOWN_OPCODE << 5]
+
+        return payload, data, data_length
+
+    def transfer_extended(self, command: str) -> Optional[Dict[str, Any]]:
+        """
+        Run a get or put through extended requests over their own connections
+        (parallel ranges, resume, delta or deduplicated put), return what
+        happened to it like execute
+
+        Return None if the command goes through a regular request instead:
+        these features disabled, not TCP, not a get or put, put of a file
+        smaller than range_threshold, or a server without support
+        """
+        if self.protocol != "TCP":
+            return None
+
+        if not fits_extended_requests(command):
+            return None
+
+        if get_command_pattern.match(command) and (
+            self.range_streams > 1 or self.resume
+        ):
+            transfer = self.get_ranges
+        elif put_command_pattern.match(command) and (
+            self.range_streams > 1 or self.resume or self.delta or self.dedup
+        ):
+            transfer = self.put_extended
+        else:
+            return None
+
+        _, filename = command.split(" ", 1)
 
         try:
-            while True:
-                # get command from user
-                command = input(f"myftp> - {self.protocol} - : ").strip()
+            return transfer(filename)
+
+        except (OSError, EOFError, RangeError) as error:
+            print(f"myftp> - {self.protocol} - {error} happened.")
+
+            return {
+                "status": "error",
+                "result": f"{type(error).__name__}: {error}",
+                "bytes_sent": 0,
+                "bytes_received": 0,
+            }
+
+    def connect_ranges(self, feature: int) -> Optional[socket]:
+        """
+        Open a connection for range or resume requests, None if the server
+        does not support feature
+        """
+        sock = connect((self.server_name, self.server_port))
+
+        accepted_features, _ = request_hello(sock, SocketReader(sock), feature)
+
+        if not accepted_features & feature:
+            print(
+                f"myftp> - {self.protocol} - Server does not support feature {feature:#x}"
+            ) if self.debug else None
+
+            sock.close()
+            return None
+
+        return sock
+
+    def get_ranges(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Download filename one range at a time, over range_streams connections
+        if it is at least range_threshold bytes large
+
+        The first range also tells the size of the file. Ranges are written in
+        place into a .part file, renamed to filename once every range arrived
+        and matched its checksum
+
+        With resume, the progress is checkpointed next to the .part file, which
+        is kept if the transfer fails. The next get of the same file carries
+        on from the checkpoint, once the server confirmed with a checksum that
+        the bytes already downloaded still match its file
+        """
+        sock = self.connect_ranges(FEATURE_RANGES)
+
+        if sock is None:
+            return None
+
+        address = (self.server_name, self.server_port)
+        path = os.path.join(self.directory_path, filename)
+        part_path = path + ".part"
+        reader = SocketReader(sock)
+
+        checkpoint = Checkpoint.load(path + ".checkpoint") if self.resume else None
+
+        try:
+            offset = (
+                self.resumable_offset(sock, reader, filename, part_path, checkpoint)
+                if checkpoint is not None
+                else 0
+            )
+
+            fd = os.open(
+                part_path, os.O_RDWR | os.O_CREAT | (0 if offset else os.O_TRUNC), 0o666
+            )
+        except BaseException:
+            sock.close()
+            raise
+
+        try:
+            try:
+                file_size, received = request_get_range(
+                    sock, reader, filename, offset, self.range_chunk_size, fd
+                )
+
+            except RangeError as error:
+                sock.close()
+
+                if error.rescode is None:
+                    raise
+
+                os.close(fd)
+                os.unlink(part_path)
+
+                if checkpoint is not None:
+                    checkpoint.remove()
+
+                result = rescode_meanings.get(error.rescode, "Unknown rescode")
+                print(f"myftp> - {self.protocol} - {result}")
+
+                return {
+                    "status": "failed",
+                    "result": result,
+                    "bytes_sent": 0,
+                    "bytes_received": 1,
+                }
+
+            if offset:
+                print(
+                    f"myftp> - {self.protocol} - Resuming file {filename} from byte {offset}"
+                )
+
+            if self.resume:
+                checkpoint = Checkpoint(path + ".checkpoint", file_size, offset)
+                checkpoint.complete(offset, received)
+
+            streams = self.range_streams if file_size >= self.range_threshold else 1
+
+            print(
+                f"myftp> - {self.protocol} - Getting file {filename} of {file_size} bytes over {streams} connections"
+            ) if self.debug else None
+
+            def get_range(sock: socket, reader: SocketReader, current) -> None:
+                request_get_range(sock, reader, filename, current[0], current[1], fd)
+
+                if checkpoint is not None:
+                    checkpoint.complete(*current)
+
+            errors = run_ranges(
+                address,
+                plan_ranges(offset + received, file_size, self.range_chunk_size),
+                max(1, streams),
+                get_range,
+                first_connection=sock,
+            )
+
+            if errors:
+                raise errors[0]
+
+            if os.fstat(fd).st_size != file_size:
+                raise RangeError(
+                    f"Got {os.fstat(fd).st_size} of the {file_size} bytes of {filename}"
+                )
+
+        except BaseException:
+            os.close(fd)
+
+            if checkpoint is None:
+                os.unlink(part_path)
+            else:
+                print(
+                    f"myftp> - {self.protocol} - {checkpoint.offset} bytes of {filename} kept, get it again to resume"
+                )
+            raise
+
+        os.close(fd)
+        os.replace(part_path, path)
+
+        if checkpoint is not None:
+            checkpoint.remove()
+
+        print(
+            f"myftp> - {self.protocol} - File {filename} has been downloaded successfully"
+        )
+
+        return {
+            "status": "ok",
+            "result": rescode_meanings[GET_OK_RESCODE],
+            "bytes_sent": 0,
+            "bytes_received": file_size - offset,
+        }
+
+    def resumable_offset(
+        self,
+        sock: socket,
+        reader: SocketReader,
+        filename: str,
+        part_path: str,
+        checkpoint: Checkpoint,
+    ) -> int:
+        """
+        Offset a download of filename can resume from, 0 if the partial file
+        does not match the file on the server anymore
+        """
+        try:
+            with open(part_path, "rb") as part:
+                local_crc = range_crc32(part.fileno(), 0, checkpoint.offset)
+
+        # partial file gone, or shorter than the checkpoint says
+        except (OSError, EOFError):
+            return 0
+
+        try:
+            file_size, remote_crc = request_checksum(
+                sock, reader, filename, 0, checkpoint.offset
+            )
+
+        # file gone or shrunk on the server, the connection stays usable
+        except RangeError:
+            return 0
+
+        if file_size != checkpoint.file_size or local_crc != remote_crc:
+            print(
+                f"myftp> - {self.protocol} - File {filename} changed on the server, downloading it again"
+            )
+            return 0
+
+        return checkpoint.offset
+
+    def put_resumable(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Upload filename into a staging file on the server, promoted to
+        filename once complete and matching the checksum of the whole file
+
+        If a previous put of the same file was cut short, the staged bytes
+        are kept by the server and only the rest is sent, provided their
+        checksum matches the start of the local file
+        """
+        try:
+            file = open(os.path.join(self.directory_path, filename), "rb")
+        except OSError:
+            return None
+
+        with file:
+            sock = self.connect_ranges(FEATURE_RESUME)
+
+            if sock is None:
+                return None
+
+            try:
+                reader = SocketReader(sock)
+                file_size = os.fstat(file.fileno()).st_size
+
+                staged, staged_crc = request_put_status(sock, reader, filename)
+
+                offset = 0
+                crc = 0
+
+                if 0 < staged <= file_size:
+                    prefix_crc = range_crc32(file.fileno(), 0, staged)
+
+                    if prefix_crc == staged_crc:
+                        offset = staged
+                        crc = prefix_crc
+
+                        print(
+                            f"myftp> - {self.protocol} - Resuming file {filename} from byte {offset}"
+                        )
+
+                crc = range_crc32(file.fileno(), offset, file_size - offset, crc)
+
+                rescode = request_put_append(
+                    sock, reader, filename, file, file_size, offset, crc
+                )
+
+            finally:
+                sock.close()
+
+        result = rescode_meanings.get(rescode, "Unknown rescode")
+        print(f"myftp> - {self.protocol} - {result}")
+
+        return {
+            "status": "failed" if rescode in error_rescodes else "ok",
+            "result": result,
+            "bytes_sent": file_size - offset,
+            "bytes_received": 1,
+        }
+
+    def put_extended(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Put filename with the first extended put that applies: nothing to
+        upload if the server already stores its content, then resumable,
+        delta or range put
+        """
+        if self.dedup:
+            result = self.put_stored_content(filename)
+
+            if result is not None:
+                return result
+
+        if self.resume:
+            return self.put_resumable(filename)
+
+        if self.delta:
+            return self.put_delta(filename)
+
+        if self.range_streams > 1:
+            return self.put_ranges(filename)
+
+        return None
+
+    def put_stored_content(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Offer the server the hash of filename, return None if it does not
+        store that content yet and the file has to be uploaded
+        """
+        try:
+            file = open(os.path.join(self.directory_path, filename), "rb")
+        except OSError:
+            return None
+
+        with file:
+            file_size = os.fstat(file.fileno()).st_size
+            digest = content_hash(file.fileno())
+
+        sock = self.connect_ranges(FEATURE_DEDUP)
+
+        if sock is None:
+            return None
+
+        try:
+            rescode = request_put_hash(
+                sock, SocketReader(sock), filename, file_size, digest
+            )
+        finally:
+            sock.close()
+
+        if rescode == FILE_NOT_FOUND_RESCODE:
+            print(
+                f"myftp> - {self.protocol} - Content of file {filename} not on the server yet, uploading it"
+            ) if self.debug else None
+
+            return None
+
+        result = rescode_meanings.get(rescode, "Unknown rescode")
+        print(f"myftp> - {self.protocol} - {result}")
+
+        if rescode not in error_rescodes:
+            print(
+                f"myftp> - {self.protocol} - Server already stores the content of {filename}, nothing uploaded"
+            )
+
+        return {
+            "status": "failed" if rescode in error_rescodes else "ok",
+            "result": result,
+            "bytes_sent": 1 + len(encode_filename(filename)) + PUT_HASH_REQUEST.size,
+            "bytes_received": 1,
+            "deduplicated": rescode not in error_rescodes,
+        }
+
+    def put_delta(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Upload only what changed in filename since the copy on the server
+
+        The server sends the signatures of the blocks of its copy, the blocks
+        found anywhere in the local file are sent as references and the rest
+        as literal data. A file the server does not have yet goes through a
+        regular (or range) put
+        """
+        try:
+            file = open(os.path.join(self.directory_path, filename), "rb")
+        except OSError:
+            return None
+
+        with file:
+            sock = self.connect_ranges(FEATURE_DELTA)
+
+            if sock is None:
+                return None
+
+            try:
+                reader = SocketReader(sock)
+                signatures = request_signatures(sock, reader, filename)
+
+                if signatures is None:
+                    print(
+                        f"myftp> - {self.protocol} - No copy of file {filename} on the server, putting it whole"
+                    ) if self.debug else None
+
+                    sock.close()
+                    return self.put_ranges(filename) if self.range_streams > 1 else None
+
+                server_size, block_size, signature_data = signatures
+                file_size = os.fstat(file.fileno()).st_size
+
+                with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as delta:
+                    literal_bytes, copied_blocks = compute_delta(
+                        file, block_size, parse_signatures(signature_data), delta
+                    )
+
+                    delta_length = delta.tell()
+                    delta.seek(0)
+
+                    rescode = request_delta_put(
+                        sock,
+                        reader,
+                        filename,
+                        file_size,
+                        block_size,
+                        delta,  # type: ignore
+                        delta_length,
+                    )
+
+            finally:
+                sock.close()
+
+        print(
+            f"myftp> - {self.protocol} - Delta of {filename}: {copied_blocks} blocks of {block_size} bytes reused, {literal_bytes} literal bytes, {delta_length} bytes sent for a file of {file_size} bytes"
+        )
+
+        result = rescode_meanings.get(rescode, "Unknown rescode")
+        print(f"myftp> - {self.protocol} - {result}")
+
+        return {
+            "status": "failed" if rescode in error_rescodes else "ok",
+            "result": result,
+            "bytes_sent": delta_length,
+            "bytes_received": len(signature_data) + 1,
+            "delta": {
+                "block_size": block_size,
+                "server_size": server_size,
+                "reused_blocks": copied_blocks,
+                "literal_bytes": literal_bytes,
+            },
+        }
+
+    def put_ranges(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        Upload filename over range_streams connections if it is at least
+        range_threshold bytes large
+
+        The server checks every range against its checksum, the size of the
+        file on the server is checked once every range is written
+        """
+        path = os.path.join(self.directory_path, filename)
+
+        try:
+            file_size = os.stat(path).st_size
+        except OSError:
+            return None
+
+        if file_size == 0 or file_size < self.range_threshold:
+            return None
+
+        sock = self.connect_ranges(FEATURE_RANGES)
+
+        if sock is None:
+            return None
+
+        print(
+            f"myftp> - {self.protocol} - Putting file {filename} of {file_size} bytes over {self.range_streams} connections"
+        ) if self.debug else None
+
+        def put_range(sock: socket, reader: SocketReader, current) -> None:
+            # one file object per range, send_file moves its position
+            with open(path, "rb") as file:
+                request_put_range(
+                    sock, reader, filename, file, file_size, current[0], current[1]
+                )
+
+        errors = run_ranges(
+            (self.server_name, self.server_port),
+            plan_ranges(0, file_size, self.range_chunk_size),
+            self.range_streams,
+            put_range,
+            first_connection=sock,
+        )
+
+        if errors:
+            raise errors[0]
+
+        # an empty range only reports the size of the file on the server
+        sock = connect((self.server_name, self.server_port))
+
+        try:
+            server_size, _ = request_get_range(
+                sock, SocketReader(sock), filename, 0, 0
+            )
+        finally:
+            sock.close()
+
+        if server_size != file_size:
+            raise RangeError(
+                f"Server holds {server_size} of the {file_size} bytes of {filename}"
+            )
+
+        print(f"myftp> - {self.protocol} - {rescode_meanings[PUT_OK_RESCODE]}")
+
+        return {
+            "status": "ok",
+            "result": rescode_meanings[PUT_OK_RESCODE],
+            "bytes_sent": file_size,
+            "bytes_received": 0,
+        }
+
+    def negotiated_compression(self) -> int:
+        """
+        Compression algorithm bodies are sent with on this connection
+        """
+        if self.server_features & algorithm_features.get(self.compression, 0):
+            return self.compression
+
+        return NO_COMPRESSION
+
+    def build_compressed_get_request(
+        self, filename: str
+    ) -> Tuple[bytes, Optional[BinaryIO], int]:
+        print(
+            f"myftp> - {self.protocol} - Getting file {filename} from the server, compressed with {algorithm_names[self.compression]}"
+        ) if self.debug else None
+
+        return (
+            bytes([COMPRESSED_GET_FIRST_BYTE])
+            + encode_filename(filename)
+            + bytes([self.compression]),
+            None,
+            0,
+        )
+
+    def build_compressed_put_request(
+        self, filename: str
+    ) -> Optional[Tuple[bytes, Optional[BinaryIO], int]]:
+        """
+        Compress the file to put, unless sampling shows it does not compress
+
+        Return None if the file can not be opened
+        """
+        try:
+            file = open(os.path.join(self.directory_path, filename), "rb")
+        except OSError:
+            return None
+
+        try:
+            file_size = os.fstat(file.fileno()).st_size
+
+            algorithm, body, body_length, compress_us = compress_file(
+                file, file_size, self.compression
+            )
+
+        except BaseException:
+            file.close()
+            raise
+
+        self.report_compression(
+            filename, format_stats(algorithm, file_size, body_length, compress_us, 0)
+        )
+
+        payload = (
+            bytes([COMPRESSED_PUT_FIRST_BYTE])
+            + encode_filename(filename)
+            + COMPRESSED_HEADER.pack(algorithm, file_size, body_length, compress_us)
+        )
+
+        # not compressed, the file itself is streamed
+        if body is None:
+            file.seek(0)
+            return payload, file, file_size
+
+        file.close()
+
+        if isinstance(body, bytes):
+            return payload + body, None, 0
+
+        return payload, body, body_length
+
+    def report_compression(self, filename: str, stats: Dict[str, Any]) -> None:
+        self.last_compression = stats
+
+        print(
+            f"myftp> - {self.protocol} - Compression of {filename}: {stats['algorithm']}, {stats['size']} -> {stats['compressed_size']} bytes (ratio {stats['ratio']}), compression CPU {stats['compress_cpu_ms']} ms, decompression CPU {stats['decompress_cpu_ms']} ms"
+        )
+
+    def negotiate_features(self, multiplex: bool) -> None:
+        """
+        Ask the server, with a hello request, for the features this client
+        wants: carrying the requests of this connection as interleaved
+        streams, compression and conditional gets, along with the version 2
+        framing
+
+        Without any of these no hello is sent, the first command needing the
+        version 2 framing asks for it (see upgrade_protocol), so servers
+        predating hello keep working. A server that does not know hello, or
+        turns every feature down, gets a fresh connection speaking the plain
+        protocol
+        """
+        wanted_features = (
+            (FEATURE_MULTIPLEX if multiplex else 0)
+            | algorithm_features.get(self.compression, 0)
+            | (FEATURE_CONDITIONAL_GET if self.download_cache is not None else 0)
+        )
+
+        if self.protocol != "TCP" or not wanted_features:
+            return
+
+        if self.wanted_protocol_version == PROTOCOL_V2:
+            wanted_features |= FEATURE_PROTOCOL_V2
+
+        self.framing_negotiated = True
+        accepted_features, max_streams = request_hello(
+            self.client_socket, self.socket_reader, wanted_features
+        )
 
-                # handling the "bye" command
-                if command == "bye" or command == "BYE":
-                    self.client_socket.close()
-                    print(f"myftp> - {self.protocol} - Session is terminated")
-                    break
+        if not accepted_features:
+            print(
+                f"myftp> - {self.protocol} - Server does not support the features asked for, sending plain requests"
+            ) if self.debug else None
 
-                # help
-                elif command == "help" or command == "HELP":
-                    first_byte: int = help_request_opcode << 5
-                    command_name = "help"
+            self.reconnect_after_hello()
+            return
 
-                    print(
-                        f"myftp> - {self.protocol} - Asking for help from the server"
-                    ) if self.debug else None
+        self.server_features = accepted_features
 
-                # get command handling
-                elif get_command_pattern.match(command):
-                    _, filename = command.split(" ", 1)
-                    command_name = "get"
+        if accepted_features & FEATURE_PROTOCOL_V2:
+            self.protocol_version = PROTOCOL_V2
 
-                    first_byte = (get_request_opcode << 5) + len(filename)
+            print(
+                f"myftp> - {self.protocol} - Speaking protocol v2 with the server"
+            ) if self.debug else None
 
-                    second_byte_to_n_byte = filename.encode("ascii")
+        if accepted_features & FEATURE_MULTIPLEX and max_streams > 0:
+            print(
+                f"myftp> - {self.protocol} - Multiplexing up to {max_streams} requests on the connection"
+            ) if self.debug else None
 
-                    print(
-                        f"myftp> - {self.protocol} - Getting file {filename} from the server"
-                    ) if self.debug else None
+            self.mux_writer = MuxWriter(self.client_socket)
+            self.stream_slots = BoundedSemaphore(max_streams)
 
-                # put command handling
-                elif put_command_pattern.match(command):
-                    _, filename = command.split(" ", 1)
-                    command_name = "put"
+            Thread(target=self.read_multiplexed, daemon=True).start()
 
-                    first_byte, second_byte_to_n_byte, data = self.put_payload_handling(
-                        filename
-                    )
+        elif multiplex:
+            print(
+                f"myftp> - {self.protocol} - Server does not support multiplexing, sending requests one at a time"
+            ) if self.debug else None
 
-                    print(
-                        f"myftp> - {self.protocol} - Putting file {filename} into the server"
-                    ) if self.debug else None
+    def upgrade_protocol(self) -> bool:
+        """
+        Switch the connection to the version 2 framing for a command that
+        needs it, with a hello asking for it alone. Return whether the
+        connection speaks version 2
 
-                # summary command handling
-                elif summary_command_pattern.match(command):
-                    _, filename = command.split(" ", 1)
-                    command_name = "summary"
+        The framing is asked for at most once per connection, never with
+        --protocol_version 1
+        """
+        if self.protocol_version == PROTOCOL_V2:
+            return True
+
+        if (
+            self.protocol != "TCP"
+            or self.wanted_protocol_version != PROTOCOL_V2
+            or self.framing_negotiated
+        ):
+            return False
+
+        self.framing_negotiated = True
+        accepted_features, _ = request_hello(
+            self.client_socket, self.socket_reader, FEATURE_PROTOCOL_V2
+        )
 
-                    print(
-                        f"myftp> - {self.protocol} - Summary file {filename} from the server"
-                    ) if self.debug else None
+        if not accepted_features & FEATURE_PROTOCOL_V2:
+            print(
+                f"myftp> - {self.protocol} - Server does not support protocol v2"
+            ) if self.debug else None
 
-                    first_byte = (summary_request_opcode << 5) + len(filename)
+            self.reconnect_after_hello()
+            return False
 
-                    second_byte_to_n_byte = filename.encode("ascii")
+        self.server_features |= accepted_features
+        self.protocol_version = PROTOCOL_V2
 
-                # change command handling
-                elif change_command_pattern.match(command):
-                    _, old_filename, new_filename = command.split()
-                    command_name = "change"
+        print(
+            f"myftp> - {self.protocol} - Speaking protocol v2 with the server"
+        ) if self.debug else None
 
-                    print(
-                        f"myftp> - {self.protocol} - Changing file named {old_filename} into {new_filename} on the server"
-                    ) if self.debug else None
+        return True
 
-                    first_byte = (change_request_opcode << 5) + len(old_filename)
+    def reconnect_after_hello(self) -> None:
+        """
+        Start over on a clean connection after a hello the server turned
+        down, whatever it made of the hello
+        """
+        self.client_socket.close()
 
-                    second_byte_to_n_byte = (
-                        old_filename.encode("ascii")
-                        + len(new_filename).to_bytes(1, "big")
-                        + new_filename.encode("ascii")
-                    )
+        # the original server stops on any request it does not know
+        if not self.connect():
+            raise ConnectionRefusedError(
+                "Server went away after the hello request, servers predating hello only take names up to 31 characters and files up to 4 GiB, without --multiplex, --compression or --download_cache"
+            )
 
-                # unknown request, assigned opcode is 0b101
-                else:
-                    command_name = None
-                    first_byte: int = unknown_request_opcode << 5
-
-                # get change put cases
-                if (
-                    command_name == "get"
-                    or command_name == "summary"
-                    or command_name == "change"
-                ):
-                    payload = first_byte.to_bytes(1, "big") + second_byte_to_n_byte  # type: ignore
-
-                elif command_name == "put":
-                    payload = (
-                        first_byte.to_bytes(1, "big") + second_byte_to_n_byte + data  # type: ignore
-                        if second_byte_to_n_byte is not None and data is not None  # type: ignore
-                        else first_byte.to_bytes(1, "big")  # type: ignore
-                    )
+    def submit_multiplexed(
+        self, payload: bytes, data: Optional[BinaryIO], data_length: int
+    ) -> None:
+        """
+        Send a request on a new stream, its response is parsed by a thread of
+        its own as soon as it arrives
+        """
+        # at most max_streams requests in flight, wait for one to complete
+        self.stream_slots.acquire()
 
-                # help case and unknown request
-                else:
-                    payload: bytes = first_byte.to_bytes(1, "big")  # type: ignore
+        stream_id = self.next_stream_id
+        self.next_stream_id += 2
 
-                print(
-                    f"myftp> - {self.protocol} - sent payload {payload} to the server. Payload length is {len(payload)}"  # type: ignore
-                ) if self.debug else None
+        stream = StreamReader()
 
-                if self.protocol == "UDP":
-                    self.client_socket.sendto(
-                        payload, (self.server_name, self.server_port)
-                    )  # type: ignore
-                else:
-                    self.client_socket.sendall(payload)  # type: ignore
+        with self.streams_lock:
+            self.streams[stream_id] = stream
 
-                response_payload = self.client_socket.recv(2048)
+        handler = Thread(
+            target=self.parse_multiplexed_response, args=(stream_id, stream)
+        )
+        handler.start()
+        self.stream_handlers.append(handler)
 
-                self.parse_response_payload(response_payload)
+        self.mux_writer.submit(stream_id, payload, data, data_length)  # type: ignore
 
-        except ConnectionRefusedError:
-            print(
-                f"myftp> - {self.protocol} - ConnectionRefusedError happened. Please restart the client program, make sure the server is running and/or put a different server name and server port."
-            )
+    def parse_multiplexed_response(self, stream_id: int, stream: StreamReader):
+        try:
+            self.parse_response_payload(stream)
 
-        except TimeoutError:
-            # Server did not respond within the specified timeout
+        except Exception as error:
             print(
-                f"myftp> - {self.protocol} - Server at {self.server_name} did not respond within 5 seconds. Check the address or server status."
+                f"myftp> - {self.protocol} - {error} happened on stream {stream_id}."
             )
 
-        except KeyboardInterrupt:
-            print(f"\nmyftp> - {self.protocol} - Client shutting down")
+        finally:
+            stream.drain()
+            self.stream_slots.release()
 
-        except Exception as error:
-            traceback_info = traceback.format_exc()
+    def read_multiplexed(self) -> None:
+        """
+        Route the frames coming from the server to the stream they belong to
+        """
+        reader = SocketReader(self.client_socket)
 
-            print(f"myftp> - {self.protocol} - {error} happened.")
+        try:
+            while True:
+                try:
+                    stream_id, flags, data = read_frame(reader)
 
-            print(traceback_info)
+                # a quiet connection is fine as long as nothing is in flight
+                except TimeoutError:
+                    with self.streams_lock:
+                        if not self.streams:
+                            continue
+                    raise
+
+                with self.streams_lock:
+                    stream = self.streams.get(stream_id)
+
+                    if flags & FIN_FLAG:
+                        self.streams.pop(stream_id, None)
+
+                # response of a stream nobody waits for anymore
+                if stream is None:
+                    continue
+
+                stream.feed(data)
+
+                if flags & FIN_FLAG:
+                    stream.finish()
+
+        except (OSError, EOFError) as error:
+            print(
+                f"myftp> - {self.protocol} - {error} happened while receiving responses."
+            ) if self.debug else None
 
         finally:
-            self.client_socket.close()
+            # wake up every request still waiting for its response
+            with self.streams_lock:
+                for stream in self.streams.values():
+                    stream.finish()
+                self.streams.clear()
+
+    def close_multiplexing(self) -> None:
+        """
+        Wait for the responses of every request in flight, then stop sending
+        """
+        for handler in self.stream_handlers:
+            handler.join()
+
+        self.mux_writer.close()  # type: ignore
 
-    def parse_response_payload(self, response_payload: bytes):
+    def parse_response_payload(self, response_reader: Reader) -> int:
         """
-        Parse response payload for further processing
+        Parse response payload for further processing, return its rescode
 
-        response_payload is the the entire packet that was sent from the server
+        response_reader reads the packet that was sent from the server, exactly
+        up to the lengths announced in it
         """
-        first_byte = bytes([response_payload[0]])
-        first_byte_binary = int.from_bytes(first_byte, "big")
-        rescode = first_byte_binary >> 5
-        filename_length = first_byte_binary & 0b00011111
-        response_data = response_payload[1:]
-        response_data_length = len(response_data)
+        first_byte = response_reader.read_exact(1)
+        rescode, filename_length = FIRST_BYTE_FIELDS[first_byte[0]]
 
         print(
-            f"myftp> - {self.protocol} - First_byte from server response: {first_byte}. Rescode: {rescode}. File name length: {filename_length}. Data length: {response_data_length}"
+            f"myftp> - {self.protocol} - First_byte from server response: {first_byte}. Rescode: {rescode}. File name length: {filename_length}"
         ) if self.debug else None
 
+        # extended response, its kind is carried in the low 5 bits
+        if rescode == EXTENDED_OPCODE:
+            if filename_length == COMPRESSED_GET_EXTENDED_OPCODE:
+                self.handle_compressed_get_response_from_server(response_reader)
+                return GET_OK_RESCODE
+
+            if filename_length == CONDITIONAL_GET_EXTENDED_OPCODE:
+                self.handle_conditional_get_response_from_server(response_reader)
+                return GET_OK_RESCODE
+
+            if filename_length == SUMMARY_STATS_EXTENDED_OPCODE:
+                self.last_summary = read_summary_stats(response_reader)
+                print(
+                    f"myftp> - {self.protocol} - {json.dumps(self.last_summary, indent=2)}"
+                )
+                return SUMMARY_OK_RESCODE
+
+            if filename_length == LIST_EXTENDED_OPCODE:
+                self.handle_list_response_from_server(response_reader)
+                return GET_OK_RESCODE
+
+            if filename_length == STATS_EXTENDED_OPCODE:
+                self.last_stats = read_stats(response_reader)
+                print(
+                    f"myftp> - {self.protocol} - {json.dumps(self.last_stats, indent=2)}"
+                )
+                return GET_OK_RESCODE
+
+            raise ValueError(f"Unexpected extended response {filename_length}")
+
         try:
             print(
-                f"myftp> - {self.protocol} - Res-code meaning: {rescode_dict[rescode]}"
+                f"myftp> - {self.protocol} - Res-code meaning: {rescode_meanings[rescode]}"
             ) if self.debug else None
         except KeyError:
             print(f"myftp> - {self.protocol} - Res-code does not have meaning")
 
+        # version 2: the lengths follow the first byte as varints
+        filename_length = read_response_length(
+            response_reader, rescode, filename_length, self.protocol_version
+        )
+
         # error rescodes
-        if rescode in [0b011, 0b100, 0b101]:
+        if rescode in error_rescodes:
             # print to client
-            print(f"myftp> - {self.protocol} - {rescode_dict[rescode]}")
+            print(f"myftp> - {self.protocol} - {rescode_meanings[rescode]}")
 
         # successful rescodes
         else:
             # help rescode and successful change or put rescode
-            if rescode == 0b110:
+            if rescode == HELP_RESCODE:
+                # the help message length is carried in the first byte
+                response_data = response_reader.read_exact(filename_length)
                 print(f"myftp> - {self.protocol} - {response_data.decode('ascii')}")
-            elif rescode == 0b000:
-                print(f"myftp> - {self.protocol} - {rescode_dict[rescode]}")
+            elif rescode == PUT_OK_RESCODE:
+                print(f"myftp> - {self.protocol} - {rescode_meanings[rescode]}")
             # get rescode
-            elif rescode == 0b001:
-                self.handle_get_response_from_server(filename_length, response_data)
+            elif rescode == GET_OK_RESCODE:
+                self.handle_get_response_from_server(filename_length, response_reader)
             # summary rescode
-            elif rescode == 0b010:
-                self.handle_summary_response_from_server(filename_length, response_data)
+            elif rescode == SUMMARY_OK_RESCODE:
+                self.handle_summary_response_from_server(
+                    filename_length, response_reader
+                )
+
+        return rescode
 
     def put_payload_handling(
         self, filename: str
-    ) -> Tuple[int, Optional[bytes], Optional[bytes]]:
+    ) -> Tuple[bytes, Optional[BinaryIO], int]:
         """
         Assemble the payload to put the file onto server
 
-        Return first_byte, second_byte_to_n_byte and data if successful
-        Or (None, None, None) if file not found
+        Return the payload, the opened file and its size if successful. The
+        file content is streamed after the payload and the caller closes the
+        file
+        Or a put of an empty name, and None, 0 if file not found
         """
+        # version 2 still announces the empty name
+        missing_file_payload = encode_named(PUT_OPCODE, b"", self.protocol_version)
+
         try:
-            with open(os.path.join(self.directory_path, filename), "rb") as file:
-                content = file.read()
-                content_length = len(content)
+            file = open(os.path.join(self.directory_path, filename), "rb")
+        except FileNotFoundError:
+            return missing_file_payload, None, 0
 
-                first_byte = (put_request_opcode << 5) + len(filename)
+        content_length = os.fstat(file.fileno()).st_size
 
-                second_byte_to_n_byte = filename.encode(
-                    "ascii"
-                ) + content_length.to_bytes(4, "big")
+        if (
+            self.protocol_version == PROTOCOL_V1
+            and content_length > V1_MAX_SIZE
+            and not self.upgrade_protocol()
+        ):
+            file.close()
 
-                data = content
+            print(
+                f"myftp> - {self.protocol} - Files larger than 4 GiB need protocol v2, which this connection does not use"
+            )
 
-                return (first_byte, second_byte_to_n_byte, data)
+            return missing_file_payload, None, 0
 
-        except FileNotFoundError:
-            return ((put_request_opcode << 5), None, None)
+        return (
+            encode_named(PUT_OPCODE, filename.encode("ascii"), self.protocol_version)
+            + encode_size(content_length, self.protocol_version),
+            file,
+            content_length,
+        )
 
     def handle_get_response_from_server(
-        self, filename_length: int, response_data: bytes
+        self, filename_length: int, response_reader: Reader
     ):
         """
         Handle the get response from the server
 
         Response_data is
         File name (filename_length bytes) +
-        File size (4 bytes) +
-        File content (rest of the bytes)
+        File size (4 bytes, a varint with protocol v2) +
+        File content (file size bytes, streamed straight to disk)
         """
         try:
-            filename = response_data[:filename_length].decode("ascii")
-            file_size = int.from_bytes(
-                response_data[filename_length : filename_length + 4], "big"
-            )
-            file_content = response_data[
-                filename_length + 4 : filename_length + 4 + file_size
-            ]
+            filename = response_reader.read_exact(filename_length).decode("ascii")
+            file_size = read_size(response_reader, self.protocol_version)
 
             print(
                 f"myftp> - {self.protocol} - Filename: {filename}, File_size: {file_size} bytes"
             ) if self.debug else None
 
             with open(os.path.join(self.directory_path, filename), "wb") as file:
-                file.write(file_content)
+                response_reader.copy_to(file, file_size)
 
             print(
                 f"myftp> - {self.protocol} - File {filename} has been downloaded successfully"
@@ -320,32 +1695,156 @@ class Client:
         except Exception:
             raise
 
+    def handle_compressed_get_response_from_server(self, response_reader: Reader):
+        """
+        Handle the compressed get response from the server
+
+        Response_data is
+        File name length (1 byte) +
+        File name +
+        Compression header (algorithm, file size, body size, compression time) +
+        Body (body size bytes, decompressed straight to disk)
+        """
+        filename = response_reader.read_exact(response_reader.read_exact(1)[0]).decode(
+            "ascii"
+        )
+        algorithm, file_size, body_length, compress_us = COMPRESSED_HEADER.unpack(
+            response_reader.read_exact(COMPRESSED_HEADER.size)
+        )
+
+        print(
+            f"myftp> - {self.protocol} - Filename: {filename}, File_size: {file_size} bytes, Body size: {body_length} bytes"
+        ) if self.debug else None
+
+        with open(os.path.join(self.directory_path, filename), "wb") as file:
+            writer = DecompressingWriter(file, algorithm, file_size)
+            response_reader.copy_to(writer, body_length)  # type: ignore
+            writer.finish()
+
+        self.report_compression(
+            filename,
+            format_stats(
+                algorithm,
+                file_size,
+                body_length,
+                compress_us,
+                round(writer.cpu_time * 1e6),
+            ),
+        )
+
+        print(
+            f"myftp> - {self.protocol} - File {filename} has been downloaded successfully"
+        )
+
+    def handle_conditional_get_response_from_server(self, response_reader: Reader):
+        """
+        Handle the conditional get response from the server
+
+        Response_data is
+        File name length (1 byte) +
+        File name +
+        Flags (1 byte, not modified) +
+        File size (8 bytes) +
+        Modification time on the server in nanoseconds (8 bytes) +
+        File content (file size bytes, streamed straight to disk and hashed),
+        only if modified
+        """
+        filename = response_reader.read_exact(response_reader.read_exact(1)[0]).decode(
+            "ascii"
+        )
+        flags, file_size, mtime_ns = CONDITIONAL_GET_RESPONSE.unpack(
+            response_reader.read_exact(CONDITIONAL_GET_RESPONSE.size)
+        )
+
+        assert self.download_cache is not None
+
+        if flags & NOT_MODIFIED:
+            self.download_cache.refresh(filename, file_size, mtime_ns)
+            self.last_cache = "hit"
+
+            print(f"myftp> - {self.protocol} - File {filename} is up to date")
+            return
+
+        print(
+            f"myftp> - {self.protocol} - Filename: {filename}, File_size: {file_size} bytes"
+        ) if self.debug else None
+
+        hasher = sha256()
+
+        with open(os.path.join(self.directory_path, filename), "wb") as file:
+            writer = HashingWriter(file, hasher)
+            response_reader.copy_to(writer, file_size)  # type: ignore
+
+        self.download_cache.store(filename, (file_size, mtime_ns, hasher.digest()))
+        self.last_cache = "miss"
+
+        print(
+            f"myftp> - {self.protocol} - File {filename} has been downloaded successfully"
+        )
+
+    def handle_list_response_from_server(self, response_reader: Reader):
+        """
+        Handle the list response from the server
+
+        Response_data is
+        Names matching in the whole directory (4 bytes) +
+        Entries in this page (2 bytes) +
+        Flags (1 byte) +
+        Per entry: name length (1 byte) + name + size (8 bytes) + modification
+        time in nanoseconds (8 bytes) + SHA-256 (32 bytes, stat only)
+        """
+        total, entries, more = read_listing(response_reader)
+
+        for name, size, mtime_ns, digest in entries:
+            modified = datetime.fromtimestamp(mtime_ns / 1e9).isoformat(
+                sep=" ", timespec="seconds"
+            )
+
+            print(
+                f"myftp> - {self.protocol} - {name}  {size} bytes  {modified}"
+                + (f"  sha256 {digest.hex()}" if digest is not None else "")
+            )
+
+        print(
+            f"myftp> - {self.protocol} - {len(entries)} of {total} files listed"
+            + (f", more after {entries[-1][0]}" if more and entries else "")
+        )
+
+        self.last_listing = {
+            "total": total,
+            "more": more,
+            "entries": [
+                {
+                    "name": name,
+                    "size": size,
+                    "mtime_ns": mtime_ns,
+                    **({"sha256": digest.hex()} if digest is not None else {}),
+                }
+                for name, size, mtime_ns, digest in entries
+            ],
+        }
+
     def handle_summary_response_from_server(
-        self, filename_length: int, response_data: bytes
+        self, filename_length: int, response_reader: Reader
     ):
         """
         Handle summary response from server
 
         Response_data is
         File name (filename_length bytes) +
-        File size (4 bytes) +
-        File content (rest of the bytes)
+        File size (4 bytes, a varint with protocol v2) +
+        File content (file size bytes)
         """
         try:
-            filename = response_data[:filename_length].decode("ascii")
-            file_size = int.from_bytes(
-                response_data[filename_length : filename_length + 4], "big"
-            )
-            file_content = response_data[
-                filename_length + 4 : filename_length + 4 + file_size
-            ]
+            filename = response_reader.read_exact(filename_length).decode("ascii")
+            file_size = read_size(response_reader, self.protocol_version)
 
             print(
                 f"myftp> - {self.protocol} - Filename: {filename}, File_size: {file_size} bytes"
             ) if self.debug else None
 
             with open(os.path.join(self.directory_path, filename), "wb") as file:
-                file.write(file_content)
+                response_reader.copy_to(file, file_size)
 
             print(
                 f"myftp> - {self.protocol} - File {filename} has been downloaded successfully"
@@ -411,12 +1910,172 @@ def init():
         "--directory", required=True, type=str, help="Path to the client directory"
     )
 
+    arg_parser.add_argument(
+        "--reliable_udp",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="UDP only: segment and retransmit payloads so files of any size survive packet loss (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--multiplex",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="TCP only: run requests concurrently over one connection if the server supports it (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--range_streams",
+        default=1,
+        type=int,
+        required=False,
+        help="TCP only: parallel connections a large get or put is split over, 1 disables range transfers. Default = 1",
+    )
+
+    arg_parser.add_argument(
+        "--range_chunk_size",
+        default=DEFAULT_RANGE_CHUNK_SIZE,
+        type=int,
+        required=False,
+        help=f"TCP only: size in bytes of the ranges of a range transfer. Default = {DEFAULT_RANGE_CHUNK_SIZE}",
+    )
+
+    arg_parser.add_argument(
+        "--range_threshold",
+        default=DEFAULT_RANGE_THRESHOLD,
+        type=int,
+        required=False,
+        help=f"TCP only: files at least this many bytes large use range transfers, 0 for every file. Default = {DEFAULT_RANGE_THRESHOLD}",
+    )
+
+    arg_parser.add_argument(
+        "--resume",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="TCP only: keep the progress of interrupted gets and puts, and carry on from it when the same file is transferred again (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--compression",
+        type=str,
+        choices=["none", "zlib", "lzma"],
+        default="none",
+        required=False,
+        help="TCP only: compress get and put bodies with this algorithm if the server supports it, content that does not compress is sent as is. Default = none",
+    )
+
+    arg_parser.add_argument(
+        "--delta",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="TCP only: put files the server already has by sending only the blocks that changed (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--dedup",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="TCP only: offer the hash of every file put first, files whose content the server already stores are not uploaded (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--summary_format",
+        type=str,
+        choices=["text", "binary"],
+        default="text",
+        required=False,
+        help="Get summaries as a summary.txt file (text), or as statistics packed in binary that are printed and added to batch reports (binary). Default = text",
+    )
+
+    arg_parser.add_argument(
+        "--download_cache",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help=f"TCP only: remember the files downloaded in {CACHE_FILENAME} of the client directory, and only download them again if they changed on the server (0 or 1)",
+    )
+
+    arg_parser.add_argument(
+        "--protocol_version",
+        type=int,
+        choices=list(PROTOCOL_VERSIONS),
+        default=PROTOCOL_V2,
+        required=False,
+        help="TCP only: highest framing asked for, 2 carries file names longer than 31 characters and files larger than 4 GiB. It is asked for with a hello by the first command needing it, or along with the options that need a hello, servers that answer without it get 1. Default = 2",
+    )
+
+    arg_parser.add_argument(
+        "--protocol",
+        type=str,
+        choices=["TCP", "UDP"],
+        required=False,
+        help="Protocol to use, asked interactively if missing",
+    )
+
+    arg_parser.add_argument(
+        "--ip_addr",
+        type=str,
+        required=False,
+        help="Server name/IP address, asked interactively with the port if missing",
+    )
+
+    arg_parser.add_argument(
+        "--port_number",
+        type=int,
+        required=False,
+        help="Server port number, asked interactively with the address if missing",
+    )
+
+    arg_parser.add_argument(
+        "--batch",
+        type=str,
+        required=False,
+        help="Run the commands of this file, one per line, without prompting (- reads them from stdin)",
+    )
+
+    arg_parser.add_argument(
+        "--connections",
+        default=4,
+        type=int,
+        required=False,
+        help="Batch mode only: connections commands are spread over. Default = 4",
+    )
+
+    arg_parser.add_argument(
+        "--report",
+        default="-",
+        type=str,
+        required=False,
+        help="Batch mode only: file the JSON report is written to. Default = - (stdout)",
+    )
+
     args = arg_parser.parse_args()
 
-    while (
-        protocol_selection := input("myftp>Press 1 for TCP, Press 2 for UDP\n")
-    ) not in {"1", "2"}:
-        print("myftp>Invalid choice. Press 1 for TCP, Press 2 for UDP")
+    if args.batch is not None and (
+        args.protocol is None or args.ip_addr is None or args.port_number is None
+    ):
+        arg_parser.error("--batch requires --protocol, --ip_addr and --port_number")
+
+    protocol = args.protocol
+
+    while protocol is None:
+        protocol_selection = input("myftp>Press 1 for TCP, Press 2 for UDP\n")
+
+        if protocol_selection in {"1", "2"}:
+            protocol = "UDP" if protocol_selection == "2" else "TCP"
+        else:
+            print("myftp>Invalid choice. Press 1 for TCP, Press 2 for UDP")
 
     if not check_directory(args.directory):
         print(
@@ -424,17 +2083,57 @@ def init():
         )
         return
 
-    user_supplied_address = get_address_input()
+    if args.ip_addr is not None and args.port_number is not None:
+        user_supplied_address = (args.ip_addr, args.port_number)
+    else:
+        user_supplied_address = get_address_input()
+
+    # shared by the clients of a batch
+    download_cache = DownloadCache(args.directory) if args.download_cache else None
+
+    def make_client() -> Client:
+        return Client(
+            user_supplied_address[0],
+            user_supplied_address[1],
+            args.directory,
+            args.debug,
+            protocol,
+            bool(args.reliable_udp),
+            bool(args.multiplex),
+            args.range_streams,
+            args.range_chunk_size,
+            args.range_threshold,
+            bool(args.resume),
+            {name: algorithm for algorithm, name in algorithm_names.items()}[
+                args.compression
+            ],
+            bool(args.delta),
+            bool(args.dedup),
+            args.protocol_version,
+            download_cache,
+            args.summary_format,
+        )
+
+    if args.batch is None:
+        make_client().run()
+        return
+
+    commands = read_commands(args.batch)
 
-    client = Client(
-        user_supplied_address[0],
-        user_supplied_address[1],
-        args.directory,
-        args.debug,
-        ("UDP" if protocol_selection == "2" else "TCP"),
-    )
+    # keep stdout clean for the report, progress messages go to stderr
+    with redirect_stdout(sys.stderr):
+        report = run_batch(make_client, commands, args.connections, args.debug)
+
+    report = {"protocol": protocol, **report}
+
+    if args.report == "-":
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
 
-    client.run()
+    if report["failed"]:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: On-the-wire compression of get and put bodies with zlib or lzma.
+# Bodies are compressed in chunks into a spooled file, so memory stays flat, and
+# a few samples of the file are test-compressed first so content that does not
+# compress (images, archives) is sent as is.
+
+
+from tempfile import SpooledTemporaryFile
+from time import thread_time
+from typing import BinaryIO, Optional, Tuple, Union
+import lzma
+import os
+import struct
+import zlib
+
+try:
+    from myftp.transport import CHUNK_SIZE, SPOOL_MAX_SIZE
+    from myftp.mux import FEATURE_LZMA, FEATURE_ZLIB
+    from myftp.protocol import EXTENDED_OPCODE
+except ImportError:
+    from transport import CHUNK_SIZE, SPOOL_MAX_SIZE
+    from mux import FEATURE_LZMA, FEATURE_ZLIB
+    from protocol import EXTENDED_OPCODE
+
+# extended opcodes
+COMPRESSED_GET_EXTENDED_OPCODE: int = 0b00110
+COMPRESSED_PUT_EXTENDED_OPCODE: int = 0b00111
+
+COMPRESSED_GET_FIRST_BYTE: int = (
+    EXTENDED_OPCODE << 5
+) + COMPRESSED_GET_EXTENDED_OPCODE
+COMPRESSED_PUT_FIRST_BYTE: int = (
+    EXTENDED_OPCODE << 5
+) + COMPRESSED_PUT_EXTENDED_OPCODE
+
+# compressed get request: first byte + filename length (1 byte) + filename +
+# algorithm wanted (1 byte)
+# compressed get response: first byte + filename length (1 byte) + filename +
+# header below + body
+# compressed put request: first byte + filename length (1 byte) + filename +
+# header below + body, answered by a regular put response
+# header: algorithm actually used, size of the file, size of the body, CPU time
+# spent compressing in microseconds
+COMPRESSED_HEADER = struct.Struct("!BQQI")
+
+# algorithms
+NO_COMPRESSION: int = 0
+ZLIB_COMPRESSION: int = 1
+LZMA_COMPRESSION: int = 2
+
+algorithm_names: dict[int, str] = {
+    NO_COMPRESSION: "none",
+    ZLIB_COMPRESSION: "zlib",
+    LZMA_COMPRESSION: "lzma",
+}
+
+# hello feature announcing support of each algorithm
+algorithm_features: dict[int, int] = {
+    ZLIB_COMPRESSION: FEATURE_ZLIB,
+    LZMA_COMPRESSION: FEATURE_LZMA,
+}
+
+# compression levels, favouring speed since bodies are compressed on the fly
+ZLIB_LEVEL: int = 1
+LZMA_PRESET: int = 1
+
+# sampling: this many samples of this size, spread over the file, are
+# compressed with fast zlib. Files whose samples do not shrink below the ratio
+# are sent uncompressed
+SAMPLE_SIZE: int = 16 * 1024
+SAMPLE_COUNT: int = 3
+INCOMPRESSIBLE_RATIO: float = 0.9
+
+# files smaller than this are not worth the compression headers
+MIN_COMPRESSED_SIZE: int = 256
+
+# compressed body: bytes or an open file
+Body = Union[BinaryIO, bytes]
+
+
+def compressor(algorithm: int):
+    if algorithm == ZLIB_COMPRESSION:
+        return zlib.compressobj(ZLIB_LEVEL)
+
+    if algorithm == LZMA_COMPRESSION:
+        return lzma.LZMACompressor(preset=LZMA_PRESET)
+
+    raise ValueError(f"Unknown compression algorithm {algorithm}")
+
+
+def decompressor(algorithm: int):
+    if algorithm == ZLIB_COMPRESSION:
+        return zlib.decompressobj()
+
+    if algorithm == LZMA_COMPRESSION:
+        return lzma.LZMADecompressor()
+
+    raise ValueError(f"Unknown compression algorithm {algorithm}")
+
+
+def is_compressible(fd: int, size: int) -> bool:
+    """
+    Cheap guess of whether the file behind fd is worth compressing, from
+    the fast zlib ratio of a few samples taken at its start, middle and end
+    """
+    if size < MIN_COMPRESSED_SIZE:
+        return False
+
+    sampled = 0
+    compressed = 0
+
+    for i in range(SAMPLE_COUNT):
+        offset = max(0, (size - SAMPLE_SIZE) * i // max(1, SAMPLE_COUNT - 1))
+        sample = os.pread(fd, SAMPLE_SIZE, offset)
+
+        sampled += len(sample)
+        compressed += len(zlib.compress(sample, 1))
+
+    return compressed < sampled * INCOMPRESSIBLE_RATIO
+
+
+def compress_file(
+    file: BinaryIO, size: int, algorithm: int
+) -> Tuple[int, Optional[Body], int, int]:
+    """
+    Compress size bytes of file, from its current position, with algorithm
+    unless sampling shows the content does not compress
+
+    Return the algorithm used, the compressed body (None when not compressed,
+    file is sent as is then), its length and the CPU time spent in
+    microseconds. Small bodies are returned as bytes, larger ones as a file
+    rewound to its start that the caller closes
+    """
+    start = thread_time()
+
+    if algorithm == NO_COMPRESSION or not is_compressible(file.fileno(), size):
+        return NO_COMPRESSION, None, size, round((thread_time() - start) * 1e6)
+
+    body = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    engine = compressor(algorithm)
+
+    try:
+        remaining = size
+
+        while remaining > 0:
+            chunk = file.read(min(CHUNK_SIZE, remaining))
+
+            if not chunk:
+                raise EOFError(f"File ended {remaining} bytes early")
+
+            body.write(engine.compress(chunk))
+            remaining -= len(chunk)
+
+        body.write(engine.flush())
+
+        length = body.tell()
+        body.seek(0)
+
+        # still in memory, no need to go through a file
+        if length <= SPOOL_MAX_SIZE:
+            with body:
+                content = body.read()
+
+            return algorithm, content, length, round((thread_time() - start) * 1e6)
+
+    except BaseException:
+        body.close()
+        raise
+
+    return algorithm, body, length, round((thread_time() - start) * 1e6)  # type: ignore
+
+
+class DecompressingWriter:
+    """
+    File-like sink decompressing what is written to it into file
+
+    A corrupted body, or one growing past the announced size, is not written
+    any further but still accepted, so the reader feeding it consumes the
+    whole body and the connection stays aligned. finish raises the error
+    """
+
+    def __init__(self, file: BinaryIO, algorithm: int, size: int) -> None:
+        self.file = file
+        self.size = size
+        self.written = 0
+        self.cpu_time = 0.0
+        self.error: Optional[Exception] = None
+        self.engine = decompressor(algorithm) if algorithm != NO_COMPRESSION else None
+
+    def write(self, data) -> int:
+        if self.error is not None:
+            return len(data)
+
+        start = thread_time()
+
+        try:
+            output = self.engine.decompress(data) if self.engine is not None else data
+
+        except (zlib.error, lzma.LZMAError) as error:
+            self.error = error
+            return len(data)
+
+        finally:
+            self.cpu_time += thread_time() - start
+
+        self.written += len(output)
+
+        if self.written > self.size:
+            self.error = ValueError(
+                f"Body decompresses past the {self.size} bytes announced"
+            )
+            return len(data)
+
+        self.file.write(output)
+
+        return len(data)
+
+    def finish(self) -> None:
+        """
+        Check that the whole body was decompressed to exactly the announced size
+        """
+        if self.error is not None:
+            raise self.error
+
+        if self.engine is not None and not self.engine.eof:
+            raise ValueError("Compressed body ended early")
+
+        if self.written != self.size:
+            raise ValueError(
+                f"Body decompressed to {self.written} of the {self.size} bytes announced"
+            )
+
+
+def format_stats(
+    algorithm: int,
+    size: int,
+    length: int,
+    compress_us: int,
+    decompress_us: int,
+) -> dict:
+    """
+    Statistics of one compressed transfer
+    """
+    return {
+        "algorithm": algorithm_names.get(algorithm, "unknown"),
+        "size": size,
+        "compressed_size": length,
+        "ratio": round(length / size, 4) if size else 1.0,
+        "compress_cpu_ms": round(compress_us / 1000, 3),
+        "decompress_cpu_ms": round(decompress_us / 1000, 3),
+    }
@@ -0,0 +1,218 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Conditional gets. The client remembers, for every file it
+# downloaded, the size, modification time and SHA-256 the file had on the
+# server, and sends them along with the next get of that file. A server whose
+# copy still matches answers with a header only instead of the whole content.
+
+
+from secrets import token_hex
+from threading import Lock
+from typing import Dict, Optional, Tuple
+import json
+import os
+import struct
+
+try:
+    from myftp.protocol import EXTENDED_OPCODE
+    from myftp.cache import FileIdentity, file_identity
+    from myftp.ranges import encode_filename
+except ImportError:
+    from protocol import EXTENDED_OPCODE
+    from cache import FileIdentity, file_identity
+    from ranges import encode_filename
+
+# extended opcodes
+CONDITIONAL_GET_EXTENDED_OPCODE: int = 0b01101
+
+CONDITIONAL_GET_FIRST_BYTE: int = (
+    EXTENDED_OPCODE << 5
+) + CONDITIONAL_GET_EXTENDED_OPCODE
+
+# conditional get request: first byte + filename length (1 byte) + filename +
+# header below
+# flags, size, modification time in nanoseconds and SHA-256 of the copy of
+# the file the client holds, as they were on the server
+CONDITIONAL_GET_REQUEST = struct.Struct("!BQQ32s")
+
+# flags of a conditional get request
+# the validators are set, without it the request is a plain get
+HAS_VALIDATORS: int = 1 << 0
+
+# conditional get response: first byte + filename length (1 byte) + filename +
+# header below + file content unless NOT_MODIFIED is set, or a file not found
+# response
+# flags, size and modification time in nanoseconds of the file on the server
+CONDITIONAL_GET_RESPONSE = struct.Struct("!BQQ")
+
+# flags of a conditional get response
+# the copy of the client is up to date, no content follows
+NOT_MODIFIED: int = 1 << 0
+
+# validators of the downloaded files are kept in this hidden file of the
+# client directory
+CACHE_FILENAME: str = ".myftp_cache.json"
+
+# size and modification time in nanoseconds on the server, SHA-256
+Validators = Tuple[int, int, bytes]
+
+
+def is_not_modified(
+    identity: FileIdentity,
+    size: int,
+    mtime_ns: int,
+    digest: bytes,
+    file_hash,
+) -> bool:
+    """
+    Whether the file with identity (on the server) still has the content of
+    the copy validated by size, mtime_ns and digest
+
+    Matching size and modification time are trusted as is. With only the
+    size matching, file_hash() is compared with digest, so a file rewritten
+    with the same content (a put of an unchanged file) is still not modified
+    """
+    if identity[0] != size:
+        return False
+
+    if identity[1] == mtime_ns:
+        return True
+
+    return file_hash() == digest
+
+
+def build_conditional_get_request(
+    filename: str, validators: Optional[Validators]
+) -> bytes:
+    if validators is None:
+        header = CONDITIONAL_GET_REQUEST.pack(0, 0, 0, bytes(32))
+    else:
+        header = CONDITIONAL_GET_REQUEST.pack(HAS_VALIDATORS, *validators)
+
+    return bytes([CONDITIONAL_GET_FIRST_BYTE]) + encode_filename(filename) + header
+
+
+def encode_conditional_get_response(
+    filename: str, not_modified: bool, size: int, mtime_ns: int
+) -> bytes:
+    """
+    Header of a conditional get response, the content follows it unless
+    not_modified
+    """
+    return (
+        bytes([CONDITIONAL_GET_FIRST_BYTE])
+        + encode_filename(filename)
+        + CONDITIONAL_GET_RESPONSE.pack(
+            NOT_MODIFIED if not_modified else 0, size, mtime_ns
+        )
+    )
+
+
+class DownloadCache:
+    """
+    Validators of the files downloaded into a client directory, persisted in
+    a hidden file of the directory so they outlive the client
+
+    The validators of a file are only offered while the local copy is the
+    one downloaded: its size, modification time and inode are recorded with
+    them, so a copy edited, replaced or deleted since is downloaded again.
+    Thread safe, clients of a batch share one cache
+    """
+
+    def __init__(self, directory_path: str) -> None:
+        self.directory_path = directory_path
+        self.path = os.path.join(directory_path, CACHE_FILENAME)
+        self.lock = Lock()
+
+        # filename -> validators, identity of the local copy
+        self.entries: Dict[str, Tuple[Validators, FileIdentity]] = {}
+
+        # gets answered not modified, and gets that downloaded the file
+        self.hits = 0
+        self.misses = 0
+
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as file:
+                saved = json.load(file)
+
+        except FileNotFoundError:
+            return
+
+        except (OSError, ValueError):
+            # a damaged cache only costs full downloads
+            return
+
+        for filename, entry in saved.items():
+            self.entries[filename] = (
+                (entry["size"], entry["mtime_ns"], bytes.fromhex(entry["sha256"])),
+                tuple(entry["local"]),  # type: ignore
+            )
+
+    def save(self) -> None:
+        """
+        Write the entries to the cache file, called with the lock held
+        """
+        saved = {
+            filename: {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "sha256": digest.hex(),
+                "local": list(local),
+            }
+            for filename, ((size, mtime_ns, digest), local) in self.entries.items()
+        }
+
+        # renamed over the previous one, a crash never leaves it half written
+        temporary_path = f"{self.path}.{token_hex(8)}"
+
+        with open(temporary_path, "w") as file:
+            json.dump(saved, file)
+
+        os.replace(temporary_path, self.path)
+
+    def validators(self, filename: str) -> Optional[Validators]:
+        """
+        Validators of filename, None if it was never downloaded or the local
+        copy changed since
+        """
+        with self.lock:
+            entry = self.entries.get(filename)
+
+        if entry is None:
+            return None
+
+        try:
+            if file_identity(os.path.join(self.directory_path, filename)) == entry[1]:
+                return entry[0]
+
+        except OSError:
+            pass
+
+        return None
+
+    def store(self, filename: str, validators: Validators) -> None:
+        """
+        Record the validators of filename, just downloaded
+        """
+        local = file_identity(os.path.join(self.directory_path, filename))
+
+        with self.lock:
+            self.entries[filename] = (validators, local)
+            self.misses += 1
+            self.save()
+
+    def refresh(self, filename: str, size: int, mtime_ns: int) -> None:
+        """
+        Record that filename is still up to date, with the modification time
+        the server now reports for it
+        """
+        with self.lock:
+            entry = self.entries.get(filename)
+            self.hits += 1
+
+            if entry is not None and entry[0][1] != mtime_ns:
+                self.entries[filename] = ((size, mtime_ns, entry[0][2]), entry[1])
+                self.save()
@@ -0,0 +1,255 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Content-addressed storage behind the server directory. Every
+# distinct content is kept once, as a blob named by its SHA-256, and the files
+# of the directory are hardlinks to these blobs. A client offering the hash of
+# a content the server already holds gets its put done without uploading it.
+
+
+from hashlib import sha256
+from secrets import token_hex
+from socket import socket
+from threading import RLock
+from typing import Dict, Optional
+import os
+import struct
+
+try:
+    from myftp.transport import CHUNK_SIZE, SocketReader
+    from myftp.protocol import EXTENDED_OPCODE
+    from myftp.cache import stat_identity
+    from myftp.ranges import encode_filename
+except ImportError:
+    from transport import CHUNK_SIZE, SocketReader
+    from protocol import EXTENDED_OPCODE
+    from cache import stat_identity
+    from ranges import encode_filename
+
+# extended opcodes
+PUT_HASH_EXTENDED_OPCODE: int = 0b01010
+
+PUT_HASH_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + PUT_HASH_EXTENDED_OPCODE
+
+# put hash request: first byte + filename length (1 byte) + filename + header
+# below, answered by a regular put response, or a file not found response when
+# the server does not hold the content and the file has to be put
+# size of the file, SHA-256 of its content
+PUT_HASH_REQUEST = struct.Struct("!Q32s")
+
+# blobs live in this hidden directory of the server directory, so that names
+# can be hardlinked to them
+BLOB_DIRECTORY: str = ".blobs"
+
+
+def content_hash(fd: int) -> bytes:
+    """
+    SHA-256 of the whole content of the file behind fd
+    """
+    hasher = sha256()
+    offset = 0
+
+    while chunk := os.pread(fd, CHUNK_SIZE, offset):
+        hasher.update(chunk)
+        offset += len(chunk)
+
+    return hasher.digest()
+
+
+class BlobStore:
+    """
+    Blobs of a server directory, named by the SHA-256 of their content
+
+    A file of the directory whose content is known is a hardlink to its blob,
+    so identical files share one inode and the disk space it holds. Such a
+    file must never be written in place: writers open it with open_detached
+    and replace it with replace, so the blob and the other names stay intact.
+    A blob no file links to anymore is deleted
+
+    The store is safe to share between processes (pre-forked workers) since
+    the filesystem holds all its state. A blob stored by another process is
+    not known to this one though, when its last file goes away through this
+    process it is only deleted by the next collect
+    """
+
+    def __init__(self, directory_path: str) -> None:
+        self.root = os.path.join(directory_path, BLOB_DIRECTORY)
+        self.lock = RLock()
+
+        # inode -> path of the blob, for every blob
+        self.blobs: Dict[int, str] = {}
+
+        os.makedirs(self.root, exist_ok=True)
+        self.collect()
+
+    def blob_path(self, digest: bytes) -> str:
+        name = digest.hex()
+        return os.path.join(self.root, name[:2], name)
+
+    def collect(self) -> int:
+        """
+        Index the blobs on disk and delete those no file links to anymore,
+        left by files removed or replaced while the server was stopped
+
+        Return the number of blobs deleted
+        """
+        deleted = 0
+
+        with self.lock:
+            self.blobs.clear()
+
+            for directory, _, names in os.walk(self.root):
+                for name in names:
+                    path = os.path.join(directory, name)
+                    stat = os.stat(path)
+
+                    if stat.st_nlink > 1:
+                        self.blobs[stat.st_ino] = path
+                    else:
+                        os.unlink(path)
+                        deleted += 1
+
+        return deleted
+
+    def link(self, digest: bytes, size: int, path: str) -> bool:
+        """
+        Make path a file with the content of blob digest, return False if
+        there is no such blob of this size
+        """
+        blob = self.blob_path(digest)
+
+        with self.lock:
+            try:
+                if os.stat(blob).st_size != size:
+                    return False
+            except FileNotFoundError:
+                return False
+
+            self.link_over(blob, path)
+
+        return True
+
+    def ingest(self, path: str, digest: Optional[bytes] = None) -> Optional[bytes]:
+        """
+        Store the content of the file just written at path as a blob, or
+        turn path into a link to the blob already holding that content
+
+        digest is the SHA-256 of the file if known, it is computed otherwise.
+        Return the digest, None if path changed while it was being hashed
+        """
+        with open(path, "rb") as file:
+            identity = stat_identity(os.fstat(file.fileno()))
+
+            if digest is None:
+                digest = content_hash(file.fileno())
+
+        blob = self.blob_path(digest)
+
+        with self.lock:
+            # written again meanwhile, the new content gets ingested on its own
+            stat = os.stat(path)
+
+            if stat_identity(stat) != identity:
+                return None
+
+            try:
+                if os.stat(blob).st_ino == stat.st_ino:
+                    return digest
+            except FileNotFoundError:
+                pass
+
+            try:
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                os.link(path, blob)
+                self.blobs[stat.st_ino] = blob
+
+            # content already stored, the copy just written is dropped
+            except FileExistsError:
+                self.link_over(blob, path)
+
+        return digest
+
+    def link_over(self, blob: str, path: str) -> None:
+        """
+        Atomically replace path with a hardlink to blob
+        """
+        linked_path = os.path.join(
+            os.path.dirname(path), f".{os.path.basename(path)}.{token_hex(8)}.link"
+        )
+
+        os.link(blob, linked_path)
+
+        try:
+            self.replace(linked_path, path)
+        except OSError:
+            os.unlink(linked_path)
+            raise
+
+    def replace(self, source: str, target: str) -> None:
+        """
+        os.replace, deleting the blob the replaced target was the last link to
+        """
+        with self.lock:
+            try:
+                replaced_inode: Optional[int] = os.stat(target).st_ino
+            except FileNotFoundError:
+                replaced_inode = None
+
+            os.replace(source, target)
+
+            if replaced_inode is not None:
+                self.release(replaced_inode)
+
+    def open_detached(self, path: str, flags: int, mode: int = 0o666) -> int:
+        """
+        os.open for writing, unlinking path first if it shares its content
+        (with a blob) so the write goes to a fresh file instead
+        """
+        with self.lock:
+            try:
+                stat: Optional[os.stat_result] = os.stat(path)
+            except FileNotFoundError:
+                stat = None
+
+            if stat is not None and stat.st_nlink > 1:
+                os.unlink(path)
+                self.release(stat.st_ino)
+
+            return os.open(path, flags, mode)
+
+    def release(self, inode: int) -> None:
+        """
+        Delete the blob of inode if no file links to it anymore
+        """
+        blob = self.blobs.get(inode)
+
+        if blob is None:
+            return
+
+        try:
+            if os.stat(blob).st_nlink > 1:
+                return
+
+            os.unlink(blob)
+
+        except FileNotFoundError:
+            pass
+
+        del self.blobs[inode]
+
+
+def request_put_hash(
+    sock: socket, reader: SocketReader, filename: str, size: int, digest: bytes
+) -> int:
+    """
+    Offer the server the hash of filename before putting it
+
+    Return the rescode of the response: put ok if the server already held the
+    content, file not found if the file has to be put
+    """
+    sock.sendall(
+        bytes([PUT_HASH_FIRST_BYTE])
+        + encode_filename(filename)
+        + PUT_HASH_REQUEST.pack(size, digest)
+    )
+
+    return reader.read_exact(1)[0] >> 5
@@ -0,0 +1,340 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: rsync-style delta transfer for put. The server describes its copy
+# of a file with one signature per block (rolling weak checksum + strong hash),
+# the client finds these blocks in its own copy at any offset and sends only
+# literal data and references to blocks the server already has.
+
+
+from hashlib import blake2b
+from math import isqrt
+from socket import socket
+from typing import BinaryIO, Dict, List, Optional, Tuple
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    from myftp.transport import CHUNK_SIZE, SocketReader, send_file
+    from myftp.protocol import (
+        EXTENDED_OPCODE,
+        FILE_NOT_FOUND_RESCODE,
+        GET_OK_RESCODE,
+    )
+    from myftp.ranges import RangeError, encode_filename
+except ImportError:
+    from transport import CHUNK_SIZE, SocketReader, send_file
+    from protocol import (
+        EXTENDED_OPCODE,
+        FILE_NOT_FOUND_RESCODE,
+        GET_OK_RESCODE,
+    )
+    from ranges import RangeError, encode_filename
+
+# extended opcodes
+SIGNATURES_EXTENDED_OPCODE: int = 0b01000
+DELTA_PUT_EXTENDED_OPCODE: int = 0b01001
+
+SIGNATURES_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + SIGNATURES_EXTENDED_OPCODE
+DELTA_PUT_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + DELTA_PUT_EXTENDED_OPCODE
+
+# signatures request: first byte + filename length (1 byte) + filename
+# signatures response: get ok first byte + header below + one signature per
+# whole block
+# size of the file, block size, number of blocks
+SIGNATURES_HEADER = struct.Struct("!QII")
+# weak checksum (Adler-32) + strong hash of one block
+STRONG_HASH_SIZE: int = 16
+SIGNATURE = struct.Struct(f"!I{STRONG_HASH_SIZE}s")
+
+# delta put request: first byte + filename length (1 byte) + filename + header
+# below + instructions, answered by a regular put response
+# size of the rebuilt file, block size, length of the instructions
+DELTA_HEADER = struct.Struct("!QIQ")
+
+# instructions: literal data, run of blocks of the server copy, end with the
+# hash of the whole rebuilt file
+LITERAL_INSTRUCTION: bytes = b"L"
+LITERAL_HEADER = struct.Struct("!I")
+COPY_INSTRUCTION: bytes = b"C"
+COPY_HEADER = struct.Struct("!QI")
+END_INSTRUCTION: bytes = b"E"
+FILE_HASH_SIZE: int = 32
+
+# block size grows with the square root of the file size, the usual trade-off
+# between signature size and match granularity
+MIN_BLOCK_SIZE: int = 2 * 1024
+MAX_BLOCK_SIZE: int = 128 * 1024
+
+# Adler-32 modulus, for rolling the weak checksum one byte at a time
+ADLER_MODULUS: int = 65521
+
+# weak checksum -> (block index, strong hash) of the blocks having it
+SignatureTable = Dict[int, List[Tuple[int, bytes]]]
+
+
+def choose_block_size(file_size: int) -> int:
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, isqrt(file_size) // 1024 * 1024))
+
+
+def strong_hash(block) -> bytes:
+    return blake2b(block, digest_size=STRONG_HASH_SIZE).digest()
+
+
+def compute_signatures(fd: int, file_size: int, block_size: int) -> bytes:
+    """
+    Signatures of every whole block of the file behind fd, a trailing partial
+    block is left out and always sent as literal data
+    """
+    signatures = bytearray()
+
+    for offset in range(0, file_size - block_size + 1, block_size):
+        block = os.pread(fd, block_size, offset)
+
+        if len(block) < block_size:
+            break
+
+        signatures += SIGNATURE.pack(zlib.adler32(block), strong_hash(block))
+
+    return bytes(signatures)
+
+
+def parse_signatures(data: bytes) -> SignatureTable:
+    table: SignatureTable = {}
+
+    for index, (weak, strong) in enumerate(SIGNATURE.iter_unpack(data)):
+        table.setdefault(weak, []).append((index, strong))
+
+    return table
+
+
+class DeltaWriter:
+    """
+    Encode instructions into out, merging consecutive block references into
+    runs and cutting literal data into bounded instructions
+    """
+
+    def __init__(self, out: BinaryIO) -> None:
+        self.out = out
+        self.hasher = blake2b(digest_size=FILE_HASH_SIZE)
+        self.run_start = -1
+        self.run_length = 0
+
+        self.literal_bytes = 0
+        self.copied_blocks = 0
+
+    def literal(self, data) -> None:
+        self.flush_run()
+        self.hasher.update(data)
+        self.literal_bytes += len(data)
+
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start : start + CHUNK_SIZE]
+
+            self.out.write(LITERAL_INSTRUCTION + LITERAL_HEADER.pack(len(chunk)))
+            self.out.write(chunk)
+
+    def copy(self, index: int, block) -> None:
+        self.hasher.update(block)
+        self.copied_blocks += 1
+
+        if self.run_length and index == self.run_start + self.run_length:
+            self.run_length += 1
+            return
+
+        self.flush_run()
+        self.run_start = index
+        self.run_length = 1
+
+    def flush_run(self) -> None:
+        if self.run_length:
+            self.out.write(
+                COPY_INSTRUCTION + COPY_HEADER.pack(self.run_start, self.run_length)
+            )
+            self.run_length = 0
+
+    def end(self) -> None:
+        self.flush_run()
+        self.out.write(END_INSTRUCTION + self.hasher.digest())
+
+
+def compute_delta(
+    file: BinaryIO, block_size: int, table: SignatureTable, out: BinaryIO
+) -> Tuple[int, int]:
+    """
+    Write to out the instructions rebuilding file from the server copy
+    described by table
+
+    Blocks are looked up at every offset: the weak checksum of the window is
+    rolled one byte at a time, and the strong hash is only computed when the
+    weak one matches. Return the number of literal bytes and of blocks reused
+    """
+    writer = DeltaWriter(out)
+    file_size = os.fstat(file.fileno()).st_size
+
+    if file_size == 0 or not table:
+        if file_size:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                writer.literal(mapped[:])
+        writer.end()
+
+        return writer.literal_bytes, writer.copied_blocks
+
+    with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        position = 0
+        literal_start = 0
+        weak = -1
+
+        while position + block_size <= file_size:
+            if weak < 0:
+                weak = zlib.adler32(mapped[position : position + block_size])
+
+            candidates = table.get(weak)
+
+            if candidates is not None:
+                block = mapped[position : position + block_size]
+                strong = strong_hash(block)
+
+                for index, candidate in candidates:
+                    if candidate == strong:
+                        if literal_start < position:
+                            writer.literal(mapped[literal_start:position])
+
+                        writer.copy(index, block)
+
+                        position += block_size
+                        literal_start = position
+                        weak = -1
+                        break
+
+                if weak < 0:
+                    continue
+
+            # no block starts here, slide the window by one byte
+            if position + block_size < file_size:
+                outgoing = mapped[position]
+                incoming = mapped[position + block_size]
+
+                a = ((weak & 0xFFFF) - outgoing + incoming) % ADLER_MODULUS
+                b = ((weak >> 16) - block_size * outgoing + a - 1) % ADLER_MODULUS
+                weak = (b << 16) | a
+
+            position += 1
+
+        if literal_start < file_size:
+            writer.literal(mapped[literal_start:file_size])
+
+    writer.end()
+
+    return writer.literal_bytes, writer.copied_blocks
+
+
+def apply_delta(reader, basis_fd: int, block_size: int, out: BinaryIO) -> None:
+    """
+    Rebuild a file into out from the instructions read from reader and the
+    blocks of the file behind basis_fd
+
+    Raise ValueError if the instructions are malformed or the rebuilt file
+    does not match the hash sent along
+    """
+    hasher = blake2b(digest_size=FILE_HASH_SIZE)
+    basis_blocks = os.fstat(basis_fd).st_size // block_size
+    sink = HashingWriter(out, hasher)
+
+    while True:
+        instruction = reader.read_exact(1)
+
+        if instruction == LITERAL_INSTRUCTION:
+            (length,) = LITERAL_HEADER.unpack(reader.read_exact(LITERAL_HEADER.size))
+            reader.copy_to(sink, length)
+
+        elif instruction == COPY_INSTRUCTION:
+            index, count = COPY_HEADER.unpack(reader.read_exact(COPY_HEADER.size))
+
+            if index + count > basis_blocks:
+                raise ValueError(f"Blocks {index}+{count} past the end of the file")
+
+            offset = index * block_size
+            end = offset + count * block_size
+
+            while offset < end:
+                data = os.pread(basis_fd, min(CHUNK_SIZE, end - offset), offset)
+
+                if not data:
+                    raise ValueError("File shrank while being rebuilt")
+
+                sink.write(data)
+                offset += len(data)
+
+        elif instruction == END_INSTRUCTION:
+            if reader.read_exact(FILE_HASH_SIZE) != hasher.digest():
+                raise ValueError("Rebuilt file does not match its hash")
+            return
+
+        else:
+            raise ValueError(f"Unknown delta instruction {instruction!r}")
+
+
+class HashingWriter:
+    """
+    File-like sink writing to file and hashing what goes through
+    """
+
+    def __init__(self, file: BinaryIO, hasher) -> None:
+        self.file = file
+        self.hasher = hasher
+
+    def write(self, data) -> int:
+        self.hasher.update(data)
+        return self.file.write(data)
+
+
+def request_signatures(
+    sock: socket, reader: SocketReader, filename: str
+) -> Optional[Tuple[int, int, bytes]]:
+    """
+    Return the size of filename on the server, the block size it was cut
+    into and the signatures of its blocks, None if the server has no such file
+    """
+    sock.sendall(bytes([SIGNATURES_FIRST_BYTE]) + encode_filename(filename))
+
+    rescode = reader.read_exact(1)[0] >> 5
+
+    if rescode == FILE_NOT_FOUND_RESCODE:
+        return None
+
+    if rescode != GET_OK_RESCODE:
+        raise RangeError(f"Server refused the signatures of {filename}", rescode)
+
+    file_size, block_size, block_count = SIGNATURES_HEADER.unpack(
+        reader.read_exact(SIGNATURES_HEADER.size)
+    )
+
+    return file_size, block_size, reader.read_exact(block_count * SIGNATURE.size)
+
+
+def request_delta_put(
+    sock: socket,
+    reader: SocketReader,
+    filename: str,
+    file_size: int,
+    block_size: int,
+    delta: BinaryIO,
+    delta_length: int,
+) -> int:
+    """
+    Send the instructions rebuilding filename, a file of file_size bytes, from
+    blocks of block_size bytes of the copy on the server
+
+    Return the rescode of the response
+    """
+    sock.sendall(
+        bytes([DELTA_PUT_FIRST_BYTE])
+        + encode_filename(filename)
+        + DELTA_HEADER.pack(file_size, block_size, delta_length)
+    )
+
+    send_file(sock, delta, delta_length)
+
+    return reader.read_exact(1)[0] >> 5
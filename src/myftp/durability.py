@@ -0,0 +1,214 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Atomic and durable replacement of the files of the server. New
+# content is written to a hidden temporary file next to the target and renamed
+# over it once complete, so a crash never leaves a torn file. How much of this
+# survives a power loss depends on the durability policy: nothing is flushed,
+# every file is fsynced, or the fsyncs of concurrent puts are batched.
+
+
+from secrets import token_hex
+from threading import Condition
+from time import sleep
+from typing import Callable, List, Optional, Tuple
+import ctypes
+import os
+
+# syncfs(2) flushes a whole filesystem in one journal commit, where it exists
+# (Linux). Elsewhere the files of a batch are fsynced one after the other
+try:
+    syncfs = ctypes.CDLL(None, use_errno=True).syncfs
+except (AttributeError, OSError):
+    syncfs = None
+
+# durability policies
+# the rename is atomic but neither it nor the content is flushed to disk
+DURABILITY_NONE: str = "none"
+# the content is fsynced before the rename, the directory after it
+DURABILITY_FILE: str = "file"
+# as file, but puts finishing together share one batch of fsyncs
+DURABILITY_GROUP: str = "group"
+
+DURABILITY_POLICIES: Tuple[str, ...] = (
+    DURABILITY_NONE,
+    DURABILITY_FILE,
+    DURABILITY_GROUP,
+)
+
+# how long the first put of a batch waits for others to join it. Without any
+# wait, the puts finishing while a batch is flushed still form the next one
+DEFAULT_GROUP_COMMIT_WINDOW: float = 0.0
+
+
+def create_temporary(path: str, suffix: str) -> Tuple[int, str]:
+    """
+    Create a hidden file next to path, for writing, with the permissions a
+    file created at path would get
+
+    Return its descriptor and its path
+    """
+    directory, name = os.path.split(path)
+    temporary_path = os.path.join(directory, f".{name}.{token_hex(8)}{suffix}")
+
+    return (
+        os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666),
+        temporary_path,
+    )
+
+
+def fsync_directory(directory: str) -> None:
+    """
+    Flush the entries of directory, so a rename into it survives a crash
+    """
+    fd = os.open(directory, os.O_RDONLY)
+
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class PendingCommit:
+    """
+    A file waiting in a group commit batch
+    """
+
+    def __init__(self, fd: int, publish: Callable[[], None], directory: str) -> None:
+        self.fd = fd
+        self.publish = publish
+        self.directory = directory
+        self.error: Optional[Exception] = None
+        self.done = False
+
+
+class Durability:
+    """
+    Publish files written to a temporary path according to a durability
+    policy
+
+    With the group policy, a put finishing while no batch is being flushed
+    becomes the leader of a batch: it waits window seconds for concurrent
+    puts to join, flushes the files of the batch with a single syncfs,
+    renames them all and fsyncs their directory once. The other puts of the
+    batch just wait for it, and those finishing meanwhile queue up for the
+    next batch. Under a load of small uploads a put then pays a share of
+    one flush instead of one flush of its own
+    """
+
+    def __init__(
+        self, policy: str, window: float = DEFAULT_GROUP_COMMIT_WINDOW
+    ) -> None:
+        if policy not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy {policy}")
+
+        self.policy = policy
+        self.window = window
+
+        self.condition = Condition()
+        self.pending: List[PendingCommit] = []
+        self.committing = False
+
+        # group commit batches flushed and files they held, for the metrics
+        self.batches = 0
+        self.files = 0
+
+    def commit(self, fd: int, publish: Callable[[], None], directory: str) -> None:
+        """
+        Make the content behind fd durable, then publish it (rename it over
+        its target) and make the rename durable, as far as the policy goes
+
+        Raise the error of the fsync or of publish if one failed, the file
+        is then not published or not durable
+        """
+        if self.policy == DURABILITY_NONE:
+            publish()
+            return
+
+        if self.policy == DURABILITY_FILE:
+            os.fsync(fd)
+            publish()
+            fsync_directory(directory)
+            return
+
+        entry = PendingCommit(fd, publish, directory)
+
+        with self.condition:
+            self.pending.append(entry)
+
+            while self.committing and not entry.done:
+                self.condition.wait()
+
+            if not entry.done:
+                self.committing = True
+
+        if not entry.done:
+            try:
+                # puts finishing meanwhile join this batch
+                if self.window > 0:
+                    sleep(self.window)
+
+                with self.condition:
+                    batch, self.pending = self.pending, []
+
+                self.flush(batch)
+
+            finally:
+                with self.condition:
+                    self.committing = False
+                    self.condition.notify_all()
+
+        if entry.error is not None:
+            raise entry.error
+
+    def flush(self, batch: List[PendingCommit]) -> None:
+        """
+        Flush, publish and mark done the files of batch, recording the error
+        of each file that failed on its entry
+        """
+        try:
+            self.sync_files(batch)
+
+            for entry in batch:
+                if entry.error is None:
+                    try:
+                        entry.publish()
+                    except Exception as error:
+                        entry.error = error
+
+            for directory in {entry.directory for entry in batch}:
+                try:
+                    fsync_directory(directory)
+                except OSError as error:
+                    for entry in batch:
+                        if entry.directory == directory and entry.error is None:
+                            entry.error = error
+
+        finally:
+            with self.condition:
+                for entry in batch:
+                    entry.done = True
+
+                self.batches += 1
+                self.files += len(batch)
+
+    def sync_files(self, batch: List[PendingCommit]) -> None:
+        """
+        Flush the content of the files of batch, all in the same filesystem
+        as the server directory
+        """
+        if len(batch) > 1 and syncfs is not None:
+            if syncfs(batch[0].fd) == 0:
+                return
+
+            error = OSError(ctypes.get_errno(), "syncfs failed")
+
+            for entry in batch:
+                entry.error = error
+
+            return
+
+        for entry in batch:
+            try:
+                os.fsync(entry.fd)
+            except OSError as error:
+                entry.error = error
@@ -0,0 +1,333 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Directory listing of the FTP server. The metadata of every file
+# of the server directory is kept in memory, sorted by name, so a list request
+# is answered without touching the disk: a prefix is found by binary search and
+# a page is a bounded slice from there. Writes mark the names they touch, which
+# are stat'ed again before the next listing.
+
+
+from bisect import bisect_left, insort
+from stat import S_ISREG
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Set, Tuple
+import os
+import struct
+
+try:
+    from myftp.protocol import EXTENDED_OPCODE
+    from myftp.cache import FileIdentity, stat_identity
+    from myftp.dedup import content_hash
+    from myftp.summary import match_pattern, pattern_prefix
+except ImportError:
+    from protocol import EXTENDED_OPCODE
+    from cache import FileIdentity, stat_identity
+    from dedup import content_hash
+    from summary import match_pattern, pattern_prefix
+
+# extended opcodes
+LIST_EXTENDED_OPCODE: int = 0b01100
+
+LIST_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + LIST_EXTENDED_OPCODE
+
+# list request: first byte + prefix length (1 byte) + prefix + cursor length
+# (1 byte) + cursor + header below. Only names starting with prefix and coming
+# after the cursor (the last name of the previous page) are listed
+# most entries wanted, flags
+LIST_REQUEST = struct.Struct("!HB")
+
+# flags of a list request
+# add the SHA-256 of every file listed
+LIST_WITH_HASH: int = 1 << 0
+# stat: only list the file named prefix
+LIST_EXACT: int = 1 << 1
+
+# list response: first byte + header below + entries, each one a name length
+# (1 byte) + name + entry below (+ SHA-256 of the file with LIST_WITH_HASH)
+# names matching the prefix in the whole directory, entries in this page,
+# flags: LIST_WITH_HASH as requested, LIST_MORE if entries come after the page
+LIST_RESPONSE = struct.Struct("!IHB")
+LIST_MORE: int = 1 << 7
+# size, modification time in nanoseconds
+LIST_ENTRY = struct.Struct("!QQ")
+HASH_SIZE: int = 32
+
+# pages are cut at this many entries, or this many bytes so a page always
+# fits into one UDP datagram
+MAX_LIST_ENTRIES: int = 1000
+MAX_LIST_BYTES: int = 60000
+
+# name, size, modification time in nanoseconds, SHA-256 if asked for
+ListEntry = Tuple[str, int, int, Optional[bytes]]
+
+
+# longest name a list entry can carry, its length is 1 byte
+MAX_LISTED_NAME_LENGTH: int = 255
+
+
+def is_listed(name: str) -> bool:
+    """
+    Hidden names are the server own files: the blob store, staged puts,
+    files being rebuilt. Names a list response can not carry, not ASCII or
+    too long, are left out too
+    """
+    return (
+        not name.startswith(".")
+        and name.isascii()
+        and len(name) <= MAX_LISTED_NAME_LENGTH
+    )
+
+
+class DirectoryIndex:
+    """
+    Metadata of the files of a directory, kept in memory for listings
+
+    The index is built with one os.scandir pass. Requests writing a file
+    mark its name dirty, and dirty names are stat'ed again, added or dropped
+    before the next listing, so a listing costs no system call beyond them.
+    Hashes are only computed for listings asking for them, and kept as long
+    as the file does not change
+
+    With max_age set, the whole directory is scanned again once the index is
+    older than max_age seconds, for files written by other processes
+    """
+
+    def __init__(self, directory_path: str, max_age: Optional[float] = None) -> None:
+        self.directory_path = directory_path
+        self.max_age = max_age
+        self.lock = Lock()
+
+        # sorted names, and name -> identity (size, modification time, inode)
+        self.names: List[str] = []
+        self.entries: Dict[str, FileIdentity] = {}
+        self.dirty: Set[str] = set()
+
+        # name -> identity of the file hashed, its SHA-256
+        self.hashes: Dict[str, Tuple[FileIdentity, bytes]] = {}
+
+        self.scanned_at = 0.0
+        self.scan()
+
+    def scan(self) -> None:
+        entries: Dict[str, FileIdentity] = {}
+
+        with os.scandir(self.directory_path) as iterator:
+            for entry in iterator:
+                if not is_listed(entry.name):
+                    continue
+
+                try:
+                    if entry.is_file():
+                        entries[entry.name] = stat_identity(entry.stat())
+                except FileNotFoundError:
+                    pass
+
+        with self.lock:
+            self.entries = entries
+            self.names = sorted(entries)
+            self.dirty.clear()
+            self.scanned_at = monotonic()
+
+    def invalidate(self, path: str) -> None:
+        """
+        Mark the file at path as written, path may be outside the directory
+        """
+        directory, name = os.path.split(path)
+
+        if directory == os.path.normpath(self.directory_path) and is_listed(name):
+            with self.lock:
+                self.dirty.add(name)
+
+    def refresh(self) -> None:
+        """
+        Stat the dirty names again, called with the lock held
+        """
+        for name in self.dirty:
+            try:
+                stat = os.stat(os.path.join(self.directory_path, name))
+            except FileNotFoundError:
+                stat = None
+
+            identity: Optional[FileIdentity] = (
+                stat_identity(stat)
+                if stat is not None and S_ISREG(stat.st_mode)
+                else None
+            )
+
+            if identity is None:
+                if self.entries.pop(name, None) is not None:
+                    del self.names[bisect_left(self.names, name)]
+                self.hashes.pop(name, None)
+
+            else:
+                if name not in self.entries:
+                    insort(self.names, name)
+                self.entries[name] = identity
+
+        self.dirty.clear()
+
+    def scan_if_stale(self) -> None:
+        if self.max_age is not None and monotonic() - self.scanned_at > self.max_age:
+            self.scan()
+
+    def match(self, pattern: str) -> List[str]:
+        """
+        Names matching the shell pattern, in name order. Only the names
+        starting with the literal part of pattern are tested
+        """
+        self.scan_if_stale()
+        prefix = pattern_prefix(pattern)
+
+        with self.lock:
+            self.refresh()
+
+            start = bisect_left(self.names, prefix)
+            end = (
+                bisect_left(self.names, prefix_end(prefix))
+                if prefix
+                else len(self.names)
+            )
+
+            return match_pattern(self.names[start:end], pattern)
+
+    def list(
+        self, prefix: str, after: str, limit: int, exact: bool = False
+    ) -> Tuple[int, List[Tuple[str, FileIdentity]], bool]:
+        """
+        Up to limit entries whose name starts with prefix and comes after
+        after, in name order
+
+        Return how many names start with prefix, the entries, and whether
+        more come after them. With exact, only the file named prefix is listed
+        """
+        self.scan_if_stale()
+
+        with self.lock:
+            self.refresh()
+
+            if exact:
+                identity = self.entries.get(prefix)
+                found = [] if identity is None else [(prefix, identity)]
+
+                return len(found), found, False
+
+            start = bisect_left(self.names, prefix)
+            end = (
+                bisect_left(self.names, prefix_end(prefix))
+                if prefix
+                else len(self.names)
+            )
+
+            first = max(start, bisect_left(self.names, after)) if after else start
+
+            if first < end and self.names[first] == after:
+                first += 1
+
+            page = self.names[first : min(end, first + limit)]
+
+            return (
+                end - start,
+                [(name, self.entries[name]) for name in page],
+                first + len(page) < end,
+            )
+
+    def file_hash(self, name: str, identity: FileIdentity) -> Optional[bytes]:
+        """
+        SHA-256 of the file name, None if it changed since it was listed
+        """
+        with self.lock:
+            cached = self.hashes.get(name)
+
+        if cached is not None and cached[0] == identity:
+            return cached[1]
+
+        try:
+            with open(os.path.join(self.directory_path, name), "rb") as file:
+                if stat_identity(os.fstat(file.fileno())) != identity:
+                    return None
+
+                digest = content_hash(file.fileno())
+
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            self.hashes[name] = (identity, digest)
+
+        return digest
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+def prefix_end(prefix: str) -> str:
+    """
+    Smallest string greater than every string starting with prefix
+    """
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def encode_name(name: str) -> bytes:
+    encoded = name.encode("ascii")
+
+    return len(encoded).to_bytes(1, "big") + encoded
+
+
+def build_list_request(
+    prefix: str, after: str = "", limit: int = MAX_LIST_ENTRIES, flags: int = 0
+) -> bytes:
+    return (
+        bytes([LIST_FIRST_BYTE])
+        + encode_name(prefix)
+        + encode_name(after)
+        + LIST_REQUEST.pack(min(limit, MAX_LIST_ENTRIES), flags)
+    )
+
+
+def encode_listing(
+    total: int, entries: List[ListEntry], more: bool, with_hash: bool
+) -> bytes:
+    """
+    List response for entries, cut short (with more set) if it would not fit
+    into MAX_LIST_BYTES
+    """
+    body = bytearray()
+    count = 0
+
+    for name, size, mtime_ns, digest in entries:
+        encoded = encode_name(name) + LIST_ENTRY.pack(size, mtime_ns)
+
+        if with_hash:
+            encoded += digest if digest is not None else bytes(HASH_SIZE)
+
+        if LIST_RESPONSE.size + 1 + len(body) + len(encoded) > MAX_LIST_BYTES:
+            more = True
+            break
+
+        body += encoded
+        count += 1
+
+    flags = (LIST_WITH_HASH if with_hash else 0) | (LIST_MORE if more else 0)
+
+    return bytes([LIST_FIRST_BYTE]) + LIST_RESPONSE.pack(total, count, flags) + body
+
+
+def read_listing(reader) -> Tuple[int, List[ListEntry], bool]:
+    """
+    Parse a list response whose first byte was already read
+
+    Return how many names matched, the entries of the page and whether more
+    come after them
+    """
+    total, count, flags = LIST_RESPONSE.unpack(reader.read_exact(LIST_RESPONSE.size))
+    entries: List[ListEntry] = []
+
+    for _ in range(count):
+        name = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        size, mtime_ns = LIST_ENTRY.unpack(reader.read_exact(LIST_ENTRY.size))
+        digest = reader.read_exact(HASH_SIZE) if flags & LIST_WITH_HASH else None
+
+        entries.append((name, size, mtime_ns, digest))
+
+    return total, entries, bool(flags & LIST_MORE)
@@ -0,0 +1,41 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Leveled logging of the FTP server. Messages take their
+# arguments separately and are only formatted once they pass the level check,
+# so disabled levels cost a single comparison on the hot path.
+
+
+from typing import Any, MutableMapping, Tuple
+import logging
+import sys
+
+LOG_FORMAT: str = "myftp> - %(message)s"
+
+log_levels: dict[str, int] = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+class ProtocolLogger(logging.LoggerAdapter):
+    """
+    Logger prefixing its messages with the protocol served
+    """
+
+    def process(
+        self, msg: Any, kwargs: MutableMapping[str, Any]
+    ) -> Tuple[Any, MutableMapping[str, Any]]:
+        return f"{self.extra['protocol']} - {msg}", kwargs  # type: ignore
+
+
+def get_logger(name: str, protocol: str) -> ProtocolLogger:
+    return ProtocolLogger(logging.getLogger(name), {"protocol": protocol})
+
+
+def configure_logging(level: str) -> None:
+    """
+    Send the messages of level and above to stdout
+    """
+    logging.basicConfig(stream=sys.stdout, format=LOG_FORMAT, level=log_levels[level])
@@ -0,0 +1,354 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: In-process metrics of the FTP server: requests, latency and
+# transfer time histograms and bytes moved per request type, responses per rescode, open
+# connections and cache hit rates. Clients read them with a stats request,
+# scrapers in the Prometheus text format over HTTP.
+
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socket import socket
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List, Optional
+import json
+import struct
+
+try:
+    from myftp.transport import SocketReader
+    from myftp.protocol import EXTENDED_OPCODE
+except ImportError:
+    from transport import SocketReader
+    from protocol import EXTENDED_OPCODE
+
+# extended opcodes
+STATS_EXTENDED_OPCODE: int = 0b01011
+
+STATS_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + STATS_EXTENDED_OPCODE
+
+# stats request: first byte only
+# stats response: first byte + header below + metrics as JSON
+# length of the JSON document
+STATS_HEADER = struct.Struct("!I")
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# content type of the Prometheus text exposition format
+PROMETHEUS_CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class RequestMetrics:
+    """
+    Counters of one request type
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+        # requests per latency bucket, the last one past every bound
+        self.buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+
+        # responses sent, per bucket of the time it took to send them (a get
+        # body streamed after its latency was recorded)
+        self.transfers = 0
+        self.transfer_buckets: List[int] = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.transfer_sum = 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_seconds": histogram(self.buckets, self.latency_sum, self.count),
+            "transfer_seconds": histogram(
+                self.transfer_buckets, self.transfer_sum, self.transfers
+            ),
+        }
+
+
+def histogram(counts: List[int], total: float, count: int) -> Dict[str, Any]:
+    """
+    Snapshot of a histogram over LATENCY_BUCKETS, buckets made cumulative
+    """
+    cumulative = 0
+    buckets: Dict[str, int] = {}
+
+    for bound, bucket_count in zip(LATENCY_BUCKETS, counts):
+        cumulative += bucket_count
+        buckets[repr(bound)] = cumulative
+
+    buckets["+Inf"] = count
+
+    return {"sum": total, "count": count, "buckets": buckets}
+
+
+class Metrics:
+    """
+    Thread safe registry of the server metrics
+
+    Recording a request costs one lock and a few additions, so it is always
+    on. Gauges owned by other parts of the server (cache statistics, UDP
+    sessions) are registered as callables and only read on snapshot
+    """
+
+    def __init__(self, rescode_names: Dict[int, str]) -> None:
+        self.rescode_names = rescode_names
+        self.lock = Lock()
+
+        self.requests: Dict[str, RequestMetrics] = {}
+        self.responses: Dict[int, int] = {}
+        self.active_connections = 0
+        self.connections = 0
+
+        # name -> callable returning the current statistics of a cache
+        self.caches: Dict[str, Callable[[], Dict[str, int]]] = {}
+
+        # name -> callable returning the current value of a gauge
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def observe(
+        self,
+        request_type: str,
+        rescode: Optional[int],
+        seconds: float,
+        bytes_in: int,
+        bytes_out: int,
+        error: bool,
+    ) -> None:
+        """
+        Record one request, rescode is None if it got no response
+        """
+        with self.lock:
+            request = self.requests.get(request_type)
+
+            if request is None:
+                request = self.requests[request_type] = RequestMetrics()
+
+            request.count += 1
+            request.errors += error
+            request.bytes_in += bytes_in
+            request.bytes_out += bytes_out
+            request.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            request.latency_sum += seconds
+
+            if rescode is not None:
+                self.responses[rescode] = self.responses.get(rescode, 0) + 1
+
+    def observe_transfer(self, request_type: str, seconds: float) -> None:
+        """
+        Record the time spent sending the response of one request, from the
+        moment it was ready to its last byte
+        """
+        with self.lock:
+            request = self.requests.get(request_type)
+
+            if request is None:
+                request = self.requests[request_type] = RequestMetrics()
+
+            request.transfers += 1
+            request.transfer_buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            request.transfer_sum += seconds
+
+    def connection_opened(self) -> None:
+        with self.lock:
+            self.active_connections += 1
+            self.connections += 1
+
+    def connection_closed(self) -> None:
+        with self.lock:
+            self.active_connections -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            snapshot: Dict[str, Any] = {
+                "requests": {
+                    request_type: request.snapshot()
+                    for request_type, request in sorted(self.requests.items())
+                },
+                "responses": {
+                    self.rescode_names.get(rescode, str(rescode)): count
+                    for rescode, count in sorted(self.responses.items())
+                },
+                "active_connections": self.active_connections,
+                "connections": self.connections,
+            }
+
+        snapshot["gauges"] = {name: gauge() for name, gauge in self.gauges.items()}
+        snapshot["caches"] = {}
+
+        for name, stats in self.caches.items():
+            cache = dict(stats())
+            lookups = cache["hits"] + cache["misses"]
+            cache["hit_rate"] = cache["hits"] / lookups if lookups else 0.0
+
+            snapshot["caches"][name] = cache
+
+        return snapshot
+
+
+def format_prometheus(snapshot: Dict[str, Any]) -> str:
+    """
+    Render a snapshot in the Prometheus text exposition format
+    """
+    lines: List[str] = []
+
+    def family(name: str, kind: str, help_text: str) -> None:
+        lines.append(f"# HELP myftp_{name} {help_text}")
+        lines.append(f"# TYPE myftp_{name} {kind}")
+
+    requests = snapshot["requests"]
+
+    for name, key, help_text in (
+        ("requests_total", "count", "Requests handled, by type"),
+        ("request_errors_total", "errors", "Requests answered with an error"),
+        ("request_bytes_in_total", "bytes_in", "Bytes received in requests"),
+        ("request_bytes_out_total", "bytes_out", "Bytes sent in responses"),
+    ):
+        family(name, "counter", help_text)
+
+        for request_type, request in requests.items():
+            lines.append(f'myftp_{name}{{type="{request_type}"}} {request[key]}')
+
+    for name, key, help_text in (
+        (
+            "request_duration_seconds",
+            "latency_seconds",
+            "Time spent handling a request, until its response is ready",
+        ),
+        (
+            "response_transfer_seconds",
+            "transfer_seconds",
+            "Time spent sending a response, from ready to its last byte",
+        ),
+    ):
+        family(name, "histogram", help_text)
+
+        for request_type, request in requests.items():
+            durations = request[key]
+
+            for bound, count in durations["buckets"].items():
+                lines.append(
+                    f'myftp_{name}_bucket{{type="{request_type}",le="{bound}"}} {count}'
+                )
+
+            lines.append(
+                f'myftp_{name}_sum{{type="{request_type}"}} {durations["sum"]}'
+            )
+            lines.append(
+                f'myftp_{name}_count{{type="{request_type}"}} {durations["count"]}'
+            )
+
+    family("responses_total", "counter", "Responses sent, by rescode")
+
+    for rescode, count in snapshot["responses"].items():
+        lines.append(f'myftp_responses_total{{rescode="{rescode}"}} {count}')
+
+    family("active_connections", "gauge", "TCP clients currently connected")
+    lines.append(f"myftp_active_connections {snapshot['active_connections']}")
+
+    family("connections_total", "counter", "TCP clients accepted")
+    lines.append(f"myftp_connections_total {snapshot['connections']}")
+
+    for name, value in snapshot["gauges"].items():
+        family(name, "gauge", name.replace("_", " ").capitalize())
+        lines.append(f"myftp_{name} {value}")
+
+    for key, kind in (
+        ("hits", "counter"),
+        ("misses", "counter"),
+        ("evictions", "counter"),
+        ("entries", "gauge"),
+        ("hit_rate", "gauge"),
+    ):
+        name = f"cache_{key}" + ("_total" if kind == "counter" else "")
+        family(name, kind, f"Cache {key.replace('_', ' ')}, by cache")
+
+        for cache_name, cache in snapshot["caches"].items():
+            lines.append(f'myftp_{name}{{cache="{cache_name}"}} {cache[key]}')
+
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(metrics: Metrics, host: str, port: int) -> ThreadingHTTPServer:
+    """
+    Serve the metrics in the Prometheus text format at /metrics of host:port,
+    from a daemon thread
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+
+            body = format_prometheus(metrics.snapshot()).encode("utf-8")
+
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        # scrapes are not worth a line of the server output each
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    http_server = ThreadingHTTPServer((host, port), MetricsHandler)
+    http_server.daemon_threads = True
+
+    Thread(target=http_server.serve_forever, daemon=True).start()
+
+    return http_server
+
+
+def encode_stats(metrics: Metrics) -> bytes:
+    """
+    Stats response header and body for the current metrics
+    """
+    body = json.dumps(metrics.snapshot()).encode("utf-8")
+
+    return bytes([STATS_FIRST_BYTE]) + STATS_HEADER.pack(len(body)) + body
+
+
+def request_stats(sock: socket, reader: SocketReader) -> Dict[str, Any]:
+    """
+    Metrics of the server on the other end of a TCP connection
+    """
+    sock.sendall(bytes([STATS_FIRST_BYTE]))
+
+    first_byte = reader.read_exact(1)[0]
+
+    if first_byte != STATS_FIRST_BYTE:
+        raise ValueError(f"Server refused the stats request ({first_byte:#x})")
+
+    return read_stats(reader)
+
+
+def read_stats(reader) -> Dict[str, Any]:
+    """
+    Parse a stats response whose first byte was already read
+    """
+    (length,) = STATS_HEADER.unpack(reader.read_exact(STATS_HEADER.size))
+
+    return json.loads(reader.read_exact(length))
@@ -0,0 +1,387 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Multiplexing of many requests over one TCP connection. Once both
+# sides agreed on it with a hello request, every byte on the connection travels
+# in frames tagged with a stream id, one stream per request/response pair, and
+# the frames of concurrent streams are interleaved.
+
+
+from collections import OrderedDict, deque
+from queue import Queue
+from socket import socket
+from threading import Condition, Thread
+from typing import BinaryIO, Callable, Deque, Dict, Optional, Tuple, Union
+import struct
+
+try:
+    from myftp.transport import CHUNK_SIZE, send_file
+    from myftp.protocol import EXTENDED_OPCODE
+    from myftp.shaping import Flow
+except ImportError:
+    from transport import CHUNK_SIZE, send_file
+    from protocol import EXTENDED_OPCODE
+    from shaping import Flow
+
+# extended opcodes
+HELLO_EXTENDED_OPCODE: int = 0b00000
+
+HELLO_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + HELLO_EXTENDED_OPCODE
+
+# hello request: first byte + features the client wants
+# hello response: first byte + features the server accepted + most streams a
+# client may have in flight at once
+HELLO_REQUEST = struct.Struct("!BI")
+HELLO_RESPONSE = struct.Struct("!BIH")
+
+# feature bits negotiated by hello
+FEATURE_MULTIPLEX: int = 1 << 0
+FEATURE_RANGES: int = 1 << 1
+FEATURE_RESUME: int = 1 << 2
+FEATURE_ZLIB: int = 1 << 3
+FEATURE_LZMA: int = 1 << 4
+FEATURE_DELTA: int = 1 << 5
+FEATURE_DEDUP: int = 1 << 6
+FEATURE_PROTOCOL_V2: int = 1 << 7
+FEATURE_CONDITIONAL_GET: int = 1 << 8
+
+# stream id, flags, length of the data following the frame header
+FRAME_HEADER = struct.Struct("!IBI")
+
+# flag of the last frame of a stream
+FIN_FLAG: int = 0b1
+
+# frames are cut this small so that a large transfer only delays the other
+# streams by a few kilobytes at a time
+FRAME_DATA_SIZE: int = 16 * 1024
+
+# frames announcing more data than this are a protocol error
+MAX_FRAME_DATA_SIZE: int = CHUNK_SIZE
+
+# chunks buffered per incoming stream before the connection reader blocks
+STREAM_QUEUE_SIZE: int = 16
+
+# content sent on a stream: bytes or an open file
+Body = Union[BinaryIO, bytes]
+
+
+class StreamReader:
+    """
+    Same interface as transport.SocketReader, but over the data frames of one
+    stream, fed by the thread reading the connection
+    """
+
+    def __init__(self) -> None:
+        self.chunks: Queue = Queue(STREAM_QUEUE_SIZE)
+        self.current = memoryview(b"")
+        self.finished = False
+
+    def feed(self, data: bytes) -> None:
+        if data:
+            self.chunks.put(data)
+
+    def finish(self) -> None:
+        """
+        Mark the end of the stream, pending and future reads hit EOF
+        """
+        self.chunks.put(None)
+
+    def next_chunk(self, length: int) -> memoryview:
+        """
+        Return up to length bytes, blocking until some arrive
+        """
+        while not self.current:
+            if self.finished:
+                raise EOFError("Stream closed before the whole payload was received")
+
+            chunk = self.chunks.get()
+
+            if chunk is None:
+                self.finished = True
+            else:
+                self.current = memoryview(chunk)
+
+        data = self.current[:length]
+        self.current = self.current[length:]
+
+        return data
+
+    def read_exact(self, length: int) -> bytes:
+        data = bytearray()
+
+        while len(data) < length:
+            data += self.next_chunk(length - len(data))
+
+        return bytes(data)
+
+    def copy_to(self, file: BinaryIO, length: int) -> None:
+        remaining = length
+        write_error = None
+
+        while remaining > 0:
+            data = self.next_chunk(remaining)
+            remaining -= len(data)
+
+            # keep consuming after a write error so the stream is drained
+            if write_error is None:
+                try:
+                    file.write(data)
+                except OSError as error:
+                    write_error = error
+
+        if write_error is not None:
+            raise write_error
+
+    def skip(self, length: int) -> None:
+        remaining = length
+
+        while remaining > 0:
+            remaining -= len(self.next_chunk(remaining))
+
+    def drain(self) -> None:
+        """
+        Drop everything up to the end of the stream, so the connection reader
+        never blocks on a stream nobody reads anymore
+        """
+        self.current = memoryview(b"")
+
+        while not self.finished:
+            if self.chunks.get() is None:
+                self.finished = True
+
+
+class MuxWriter:
+    """
+    Send the messages of many streams over one connection
+
+    A single thread owns the sending side of the socket. It serves the streams
+    with pending data round robin, one frame each, so small responses are not
+    stuck behind large ones. File bodies are framed with send_file and closed
+    once sent
+
+    With a flow, every frame is paced by it, and streams carrying interactive
+    messages are served before the others so they never wait behind a bulk
+    frame held back by the shaping
+    """
+
+    def __init__(
+        self,
+        sock: socket,
+        frame_size: int = FRAME_DATA_SIZE,
+        flow: Optional[Flow] = None,
+    ) -> None:
+        self.sock = sock
+        self.frame_size = frame_size
+        self.flow = flow
+        self.condition = Condition()
+
+        # stream id -> items left to send: memoryview or [file, remaining length]
+        self.pending: OrderedDict[int, Deque] = OrderedDict()
+
+        # stream id -> length of its whole message, header and body
+        self.message_lengths: Dict[int, int] = {}
+
+        # stream id -> called once its last frame is sent
+        self.on_sent: Dict[int, Callable[[], None]] = {}
+        self.closed = False
+        self.error: Optional[BaseException] = None
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(
+        self,
+        stream_id: int,
+        header: bytes,
+        body: Optional[Body] = None,
+        body_length: int = 0,
+        on_sent: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Queue header followed by body_length bytes of body as the whole message
+        of stream_id. The writer takes ownership of a file body, and calls
+        on_sent from its thread once the message is sent
+        """
+        items: Deque = deque([memoryview(header)])
+
+        # in-memory bodies are sliced through views, never copied
+        if isinstance(body, bytes):
+            items.append(memoryview(body)[:body_length])
+        elif body is not None:
+            items.append([body, body_length])
+
+        with self.condition:
+            if self.closed:
+                self.close_files(items)
+                raise ConnectionError("Connection already closed")
+
+            self.pending[stream_id] = items
+            self.message_lengths[stream_id] = len(header) + body_length
+
+            if on_sent is not None:
+                self.on_sent[stream_id] = on_sent
+
+            self.condition.notify()
+
+    def run(self) -> None:
+        items: Deque = deque()
+
+        try:
+            while True:
+                with self.condition:
+                    while not self.pending and not self.closed:
+                        self.condition.wait()
+
+                    if not self.pending:
+                        return
+
+                    # round robin: serve the oldest stream, then requeue it
+                    stream_id = self.next_stream()
+                    items = self.pending.pop(stream_id)
+
+                self.send_frame(stream_id, items)
+
+                with self.condition:
+                    if items:
+                        self.pending[stream_id] = items
+                        continue
+
+                    del self.message_lengths[stream_id]
+                    on_sent = self.on_sent.pop(stream_id, None)
+
+                if on_sent is not None:
+                    on_sent()
+
+        except BaseException as error:
+            with self.condition:
+                self.error = error
+                self.closed = True
+
+                self.close_files(items)
+                for other_items in self.pending.values():
+                    self.close_files(other_items)
+                self.pending.clear()
+                self.message_lengths.clear()
+                self.on_sent.clear()
+
+                self.condition.notify_all()
+
+    def next_stream(self) -> int:
+        """
+        Stream to send a frame of next, called with the lock held
+        """
+        if self.flow is not None:
+            for stream_id in self.pending:
+                if (
+                    self.message_lengths[stream_id]
+                    <= self.flow.shaper.interactive_bytes
+                ):
+                    return stream_id
+
+        return next(iter(self.pending))
+
+    def send_frame(self, stream_id: int, items: Deque) -> None:
+        """
+        Send the next frame of a stream, taken from the front of items
+        """
+        # skip empty items so the FIN flag lands on the real last frame
+        while items and not self.item_length(items[0]):
+            self.close_files([items.popleft()])
+
+        if not items:
+            self.sock.sendall(FRAME_HEADER.pack(stream_id, FIN_FLAG, 0))
+            return
+
+        item = items[0]
+        length = min(self.item_length(item), self.frame_size)
+        last = length == self.item_length(item) and all(
+            not self.item_length(other) for other in list(items)[1:]
+        )
+        flags = FIN_FLAG if last else 0
+
+        if self.flow is not None:
+            self.flow.consume(
+                FRAME_HEADER.size + length, self.message_lengths[stream_id]
+            )
+
+        if isinstance(item, memoryview):
+            self.sock.sendall(
+                FRAME_HEADER.pack(stream_id, flags, length) + item[:length]
+            )
+
+            if length == len(item):
+                items.popleft()
+            else:
+                items[0] = item[length:]
+
+        else:
+            self.sock.sendall(FRAME_HEADER.pack(stream_id, flags, length))
+            send_file(self.sock, item[0], length)
+            item[1] -= length
+
+            if not item[1]:
+                items.popleft()
+                item[0].close()
+
+        if last:
+            self.close_files(items)
+            items.clear()
+
+    def item_length(self, item) -> int:
+        return len(item) if isinstance(item, memoryview) else item[1]
+
+    def close_files(self, items) -> None:
+        for item in items:
+            if not isinstance(item, memoryview):
+                item[0].close()
+
+    def close(self) -> None:
+        """
+        Send what is still pending, then stop the writer thread
+        """
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        self.thread.join()
+
+
+def request_hello(sock: socket, reader, features: int) -> Tuple[int, int]:
+    """
+    Send a hello request asking for features, return the features the server
+    accepted and the most streams it allows
+
+    Servers predating hello answer with an unknown request response, or drop
+    the connection, meaning no feature. The connection should not be used
+    for anything else then, the server may have read the rest of the hello
+    as another request
+    """
+    sock.sendall(HELLO_REQUEST.pack(HELLO_FIRST_BYTE, features))
+
+    try:
+        if reader.read_exact(1)[0] != HELLO_FIRST_BYTE:
+            return 0, 0
+
+        _, accepted_features, max_streams = HELLO_RESPONSE.unpack(
+            bytes([HELLO_FIRST_BYTE]) + reader.read_exact(HELLO_RESPONSE.size - 1)
+        )
+
+    except (EOFError, ConnectionError):
+        return 0, 0
+
+    return accepted_features, max_streams
+
+
+def read_frame(reader) -> tuple:
+    """
+    Read one frame from reader, return (stream_id, flags, data)
+    """
+    stream_id, flags, length = FRAME_HEADER.unpack(
+        reader.read_exact(FRAME_HEADER.size)
+    )
+
+    if length > MAX_FRAME_DATA_SIZE:
+        raise ConnectionError(
+            f"Frame of {length} bytes exceeds the maximum frame size"
+        )
+
+    return stream_id, flags, reader.read_exact(length)
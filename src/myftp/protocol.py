@@ -0,0 +1,257 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Codec of the plain requests and responses, shared by the client
+# and the server: opcodes, rescodes, and the two framings of their lengths.
+# Version 1 packs the filename length into the low 5 bits of the first byte and
+# sizes into 4 bytes, which caps names at 31 characters and files at 4 GiB.
+# Once both sides agreed on version 2 with a hello request, the low 5 bits stay
+# zero and every length follows the first byte as a varint instead.
+
+
+from typing import Dict, FrozenSet, List, Tuple
+import struct
+
+# opcodes, in the high 3 bits of the first byte of a request
+PUT_OPCODE: int = 0b000
+GET_OPCODE: int = 0b001
+CHANGE_OPCODE: int = 0b010
+SUMMARY_OPCODE: int = 0b011
+HELP_OPCODE: int = 0b100
+UNKNOWN_OPCODE: int = 0b101
+
+# opcode 0b111 announces an extended request (or response), whose kind is
+# carried in the low 5 bits of the first byte
+EXTENDED_OPCODE: int = 0b111
+
+op_codes_dict: Dict[int, str] = {
+    PUT_OPCODE: "put",
+    GET_OPCODE: "get",
+    CHANGE_OPCODE: "change",
+    SUMMARY_OPCODE: "summary",
+    HELP_OPCODE: "help",
+    UNKNOWN_OPCODE: "unknown",
+}
+
+# plain requests followed by a filename, whose length the first byte carries
+# with protocol version 1
+NAMED_REQUESTS: FrozenSet[str] = frozenset({"put", "get", "change", "summary"})
+
+# rescodes, in the high 3 bits of the first byte of a response
+PUT_OK_RESCODE: int = 0b000
+GET_OK_RESCODE: int = 0b001
+SUMMARY_OK_RESCODE: int = 0b010
+FILE_NOT_FOUND_RESCODE: int = 0b011
+UNKNOWN_REQUEST_RESCODE: int = 0b100
+CHANGE_FAILED_RESCODE: int = 0b101
+HELP_RESCODE: int = 0b110
+
+# what a rescode means, as printed by the client
+rescode_meanings: Dict[int, str] = {
+    FILE_NOT_FOUND_RESCODE: "File Not Found Error",
+    UNKNOWN_REQUEST_RESCODE: "Unknown Request",
+    CHANGE_FAILED_RESCODE: "Change/Put Unsuccessful Error",
+    PUT_OK_RESCODE: "Put/Change Request Successful",
+    GET_OK_RESCODE: "Get Request Successful",
+    SUMMARY_OK_RESCODE: "Summary Request Successful",
+    HELP_RESCODE: "Help",
+}
+
+# rescodes as reported by the metrics
+rescode_names: Dict[int, str] = {
+    PUT_OK_RESCODE: "put_or_change_ok",
+    GET_OK_RESCODE: "get_ok",
+    SUMMARY_OK_RESCODE: "summary_ok",
+    FILE_NOT_FOUND_RESCODE: "file_not_found",
+    UNKNOWN_REQUEST_RESCODE: "unknown_request",
+    CHANGE_FAILED_RESCODE: "put_or_change_failed",
+    HELP_RESCODE: "help",
+    EXTENDED_OPCODE: "extended",
+}
+
+# rescodes of requests the server could not fulfill
+error_rescodes: FrozenSet[int] = frozenset(
+    {FILE_NOT_FOUND_RESCODE, UNKNOWN_REQUEST_RESCODE, CHANGE_FAILED_RESCODE}
+)
+
+# protocol versions, 1 is spoken until a hello accepts FEATURE_PROTOCOL_V2
+PROTOCOL_V1: int = 1
+PROTOCOL_V2: int = 2
+
+PROTOCOL_VERSIONS: Tuple[int, ...] = (PROTOCOL_V1, PROTOCOL_V2)
+
+# largest name and size version 1 can carry
+V1_MAX_NAME_LENGTH: int = 0b00011111
+V1_MAX_SIZE: int = 0xFFFFFFFF
+
+# file size of a version 1 get or summary response, or put request
+V1_SIZE = struct.Struct("!I")
+
+# a varint of a 64 bits value spans at most this many bytes
+MAX_VARINT_BYTES: int = 10
+
+# longest name a version 2 peer accepts, longer ones are a protocol error
+# rather than an allocation of whatever size was announced
+MAX_NAME_LENGTH: int = 4096
+
+# every possible first byte, built once instead of on every response
+FIRST_BYTES: Tuple[bytes, ...] = tuple(bytes([byte]) for byte in range(256))
+
+# first byte -> its high 3 bits (opcode or rescode) and low 5 bits
+FIRST_BYTE_FIELDS: Tuple[Tuple[int, int], ...] = tuple(
+    (byte >> 5, byte & 0b00011111) for byte in range(256)
+)
+
+
+def build_request_table(
+    ext_op_codes_dict: Dict[int, str]
+) -> List[Tuple[str, int]]:
+    """
+    First byte -> request type and the length its low 5 bits carry (0 for
+    extended requests, which carry their kind there), so decoding a request
+    is a single lookup
+    """
+    table: List[Tuple[str, int]] = []
+
+    for opcode, low_bits in FIRST_BYTE_FIELDS:
+        if opcode == EXTENDED_OPCODE:
+            table.append((ext_op_codes_dict.get(low_bits, "unknown"), 0))
+        else:
+            table.append((op_codes_dict.get(opcode, "unknown"), low_bits))
+
+    return table
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Unsigned LEB128: 7 bits per byte, least significant first, the high bit
+    set on every byte but the last
+    """
+    if value < 0:
+        raise ValueError("Varints are unsigned")
+
+    # the lengths of most names and small files
+    if value < 0x80:
+        return FIRST_BYTES[value]
+
+    encoded = bytearray()
+
+    while value > 0x7F:
+        encoded.append((value & 0x7F) | 0x80)
+        value >>= 7
+
+    encoded.append(value)
+
+    return bytes(encoded)
+
+
+def read_varint(reader) -> int:
+    """
+    Read one varint from reader, byte by byte so nothing past it is consumed
+    """
+    value = 0
+
+    for shift in range(0, 7 * MAX_VARINT_BYTES, 7):
+        byte = reader.read_exact(1)[0]
+        value |= (byte & 0x7F) << shift
+
+        if not byte & 0x80:
+            return value
+
+    raise ConnectionError(f"Varint longer than {MAX_VARINT_BYTES} bytes")
+
+
+def encode_field(data: bytes) -> bytes:
+    """
+    data prefixed with its length
+    """
+    return encode_varint(len(data)) + data
+
+
+def read_name_length(reader) -> int:
+    length = read_varint(reader)
+
+    if length > MAX_NAME_LENGTH:
+        raise ConnectionError(
+            f"Name of {length} bytes exceeds the maximum of {MAX_NAME_LENGTH}"
+        )
+
+    return length
+
+
+def fits_v1(name: str, size: int = 0) -> bool:
+    """
+    Whether a request or response about name, carrying size bytes, can be
+    framed with version 1
+    """
+    return len(name) <= V1_MAX_NAME_LENGTH and size <= V1_MAX_SIZE
+
+
+def encode_named(code: int, name: bytes, version: int) -> bytes:
+    """
+    First byte carrying code (opcode of a plain request, rescode of a get or
+    summary response) and the name following it
+    """
+    if version == PROTOCOL_V2:
+        return FIRST_BYTES[code << 5] + encode_field(name)
+
+    return FIRST_BYTES[(code << 5) + len(name)] + name
+
+
+def encode_size(size: int, version: int) -> bytes:
+    """
+    Size of the file content following a put request or a get response
+    """
+    if version == PROTOCOL_V2:
+        return encode_varint(size)
+
+    return V1_SIZE.pack(size)
+
+
+def read_size(reader, version: int) -> int:
+    if version == PROTOCOL_V2:
+        return read_varint(reader)
+
+    return V1_SIZE.unpack(reader.read_exact(V1_SIZE.size))[0]
+
+
+def encode_status(rescode: int) -> bytes:
+    """
+    Response made of its first byte only: put, change, errors
+    """
+    return FIRST_BYTES[rescode << 5]
+
+
+def encode_file_header(
+    rescode: int, filename: bytes, size: int, version: int
+) -> bytes:
+    """
+    Header of a get or summary response, the file content follows it
+    """
+    return encode_named(rescode, filename, version) + encode_size(size, version)
+
+
+def encode_help(data: bytes, version: int) -> bytes:
+    """
+    Help response, whose length version 1 carries in the first byte
+    """
+    if version == PROTOCOL_V2:
+        return FIRST_BYTES[HELP_RESCODE << 5] + encode_field(data)
+
+    return FIRST_BYTES[(HELP_RESCODE << 5) + len(data)] + data
+
+
+def read_response_length(reader, rescode: int, low_bits: int, version: int) -> int:
+    """
+    Length of the name (get, summary) or of the message (help) following the
+    first byte of a plain response
+    """
+    if version == PROTOCOL_V1:
+        return low_bits
+
+    if rescode == HELP_RESCODE:
+        return read_varint(reader)
+
+    if rescode in (GET_OK_RESCODE, SUMMARY_OK_RESCODE):
+        return read_name_length(reader)
+
+    return 0
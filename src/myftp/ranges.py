@@ -0,0 +1,454 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Parallel and resumable range transfers. A large file is cut into
+# byte ranges that are moved over several TCP connections at once, every range
+# written in place with positional writes and checked against a CRC32 sent
+# along with it. Interrupted transfers resume from the last checkpoint.
+
+
+from collections import deque
+from socket import socket, AF_INET, SOCK_STREAM, IPPROTO_TCP, TCP_NODELAY
+from threading import Lock, Thread
+from typing import BinaryIO, Callable, Deque, List, Optional, Tuple
+import json
+import os
+import struct
+import zlib
+
+try:
+    from myftp.transport import CHUNK_SIZE, SocketReader, send_file
+    from myftp.protocol import (
+        EXTENDED_OPCODE,
+        GET_OK_RESCODE,
+        PUT_OK_RESCODE,
+    )
+except ImportError:
+    from transport import CHUNK_SIZE, SocketReader, send_file
+    from protocol import (
+        EXTENDED_OPCODE,
+        GET_OK_RESCODE,
+        PUT_OK_RESCODE,
+    )
+
+# extended opcodes
+GET_RANGE_EXTENDED_OPCODE: int = 0b00001
+PUT_RANGE_EXTENDED_OPCODE: int = 0b00010
+CHECKSUM_EXTENDED_OPCODE: int = 0b00011
+PUT_STATUS_EXTENDED_OPCODE: int = 0b00100
+PUT_APPEND_EXTENDED_OPCODE: int = 0b00101
+
+GET_RANGE_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + GET_RANGE_EXTENDED_OPCODE
+PUT_RANGE_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + PUT_RANGE_EXTENDED_OPCODE
+CHECKSUM_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + CHECKSUM_EXTENDED_OPCODE
+PUT_STATUS_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + PUT_STATUS_EXTENDED_OPCODE
+PUT_APPEND_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + PUT_APPEND_EXTENDED_OPCODE
+
+# both requests: first byte + filename length (1 byte) + filename + fields below
+# get range request: offset, length
+GET_RANGE_REQUEST = struct.Struct("!QQ")
+# put range request: size of the whole file, offset, length, CRC32 of the range,
+# followed by the range content
+PUT_RANGE_REQUEST = struct.Struct("!QQQI")
+
+# checksum request: offset, length (same layout as a get range request)
+CHECKSUM_REQUEST = GET_RANGE_REQUEST
+# put status request: nothing after the filename
+# put append request: offset the content starts at, size of the whole file,
+# CRC32 of the whole file, followed by the content from offset to the end
+PUT_APPEND_REQUEST = struct.Struct("!QQI")
+
+# get range response: rescode byte + size of the whole file, length of the
+# range actually sent, CRC32 of the range, followed by the range content
+GET_RANGE_RESPONSE = struct.Struct("!QQI")
+# checksum response: rescode byte + size of the whole file, CRC32 of the range
+CHECKSUM_RESPONSE = struct.Struct("!QI")
+# put status response: rescode byte + bytes staged so far, CRC32 of them
+PUT_STATUS_RESPONSE = struct.Struct("!QI")
+
+# defaults of the client flags
+DEFAULT_RANGE_CHUNK_SIZE: int = 8 * 1024 * 1024
+DEFAULT_RANGE_THRESHOLD: int = 64 * 1024 * 1024
+
+# a range failing its checksum (or its connection) is tried this many times
+RANGE_ATTEMPTS: int = 3
+
+# file names of extended requests are prefixed with a 1 byte length
+MAX_EXTENDED_NAME_LENGTH: int = 255
+
+# offset, length
+Range = Tuple[int, int]
+
+
+class RangeError(Exception):
+    """
+    The server refused a range, or the range arrived corrupted
+    """
+
+    def __init__(self, message: str, rescode: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.rescode = rescode
+
+
+class PositionalWriter:
+    """
+    File-like sink writing at an advancing offset of a file descriptor with
+    os.pwrite, so many ranges of the same file are written concurrently, and
+    computing the CRC32 of what was written
+    """
+
+    def __init__(self, fd: int, offset: int) -> None:
+        self.fd = fd
+        self.offset = offset
+        self.crc = 0
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        self.crc = zlib.crc32(view, self.crc)
+
+        while view:
+            n = os.pwrite(self.fd, view, self.offset)
+            self.offset += n
+            view = view[n:]
+
+        return len(data)
+
+
+def range_crc32(fd: int, offset: int, length: int, crc: int = 0) -> int:
+    """
+    CRC32 of length bytes of fd starting at offset, read with os.pread so the
+    file position is left alone. Pass the CRC32 of the bytes before offset as
+    crc to continue it
+    """
+    end = offset + length
+
+    while offset < end:
+        chunk = os.pread(fd, min(CHUNK_SIZE, end - offset), offset)
+
+        if not chunk:
+            raise EOFError(f"File ended {end - offset} bytes before the range end")
+
+        crc = zlib.crc32(chunk, crc)
+        offset += len(chunk)
+
+    return crc
+
+
+def staging_path(path: str) -> str:
+    """
+    Hidden file next to path that a resumable put is staged in, until it is
+    complete and renamed over path
+    """
+    directory, name = os.path.split(path)
+
+    return os.path.join(directory, f".{name}.part")
+
+
+class Checkpoint:
+    """
+    Progress of a resumable download, saved next to the partial file
+
+    Ranges complete in any order, the checkpoint only records the offset up
+    to which every byte arrived, so ranges completed past it are fetched
+    again after a resume
+    """
+
+    def __init__(self, path: str, file_size: int, offset: int) -> None:
+        self.path = path
+        self.file_size = file_size
+        self.offset = offset
+        # offset -> length of the ranges completed past the checkpoint
+        self.completed: dict[int, int] = {}
+        self.lock = Lock()
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        try:
+            with open(path) as file:
+                saved = json.load(file)
+
+            return cls(path, int(saved["file_size"]), int(saved["offset"]))
+
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def complete(self, offset: int, length: int) -> None:
+        with self.lock:
+            self.completed[offset] = length
+
+            moved = False
+
+            while self.offset in self.completed:
+                self.offset += self.completed.pop(self.offset)
+                moved = True
+
+            if moved:
+                self.save()
+
+    def save(self) -> None:
+        """
+        Write the checkpoint atomically, a crash never leaves half of it
+        """
+        temporary_path = self.path + ".tmp"
+
+        with open(temporary_path, "w") as file:
+            json.dump({"file_size": self.file_size, "offset": self.offset}, file)
+
+        os.replace(temporary_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def plan_ranges(start: int, size: int, chunk_size: int) -> Deque[Range]:
+    """
+    Cut [start, size) into ranges of chunk_size bytes, the last one shorter
+    """
+    return deque(
+        (offset, min(chunk_size, size - offset))
+        for offset in range(start, size, chunk_size)
+    )
+
+
+def encode_filename(filename: str) -> bytes:
+    encoded = filename.encode("ascii")
+
+    if len(encoded) > MAX_EXTENDED_NAME_LENGTH:
+        raise ValueError(f"Filename longer than {MAX_EXTENDED_NAME_LENGTH} bytes")
+
+    return bytes([len(encoded)]) + encoded
+
+
+def connect(address: Tuple[str, int], timeout: float = 10) -> socket:
+    sock = socket(AF_INET, SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+    try:
+        sock.connect(address)
+    except BaseException:
+        sock.close()
+        raise
+
+    return sock
+
+
+def request_get_range(
+    sock: socket,
+    reader: SocketReader,
+    filename: str,
+    offset: int,
+    length: int,
+    fd: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Fetch a range of filename and write it at its offset of fd. fd may only
+    be None for an empty range, sent to learn the file size
+
+    Return the size of the whole file and the length of the range received
+    """
+    sock.sendall(
+        bytes([GET_RANGE_FIRST_BYTE])
+        + encode_filename(filename)
+        + GET_RANGE_REQUEST.pack(offset, length)
+    )
+
+    rescode = reader.read_exact(1)[0] >> 5
+
+    if rescode != GET_OK_RESCODE:
+        raise RangeError(f"Server refused range {offset}+{length}", rescode)
+
+    file_size, sent_length, crc = GET_RANGE_RESPONSE.unpack(
+        reader.read_exact(GET_RANGE_RESPONSE.size)
+    )
+
+    if sent_length:
+        if fd is None:
+            reader.skip(sent_length)
+            raise RangeError("Server sent content for an empty range")
+
+        writer = PositionalWriter(fd, offset)
+        reader.copy_to(writer, sent_length)  # type: ignore
+
+        if writer.crc != crc:
+            raise RangeError(f"Checksum mismatch on range {offset}+{sent_length}")
+
+    return file_size, sent_length
+
+
+def request_checksum(
+    sock: socket, reader: SocketReader, filename: str, offset: int, length: int
+) -> Tuple[int, int]:
+    """
+    Return the size of filename and the CRC32 of a range of it
+    """
+    sock.sendall(
+        bytes([CHECKSUM_FIRST_BYTE])
+        + encode_filename(filename)
+        + CHECKSUM_REQUEST.pack(offset, length)
+    )
+
+    rescode = reader.read_exact(1)[0] >> 5
+
+    if rescode != GET_OK_RESCODE:
+        raise RangeError(f"Server refused the checksum of {filename}", rescode)
+
+    file_size, crc = CHECKSUM_RESPONSE.unpack(
+        reader.read_exact(CHECKSUM_RESPONSE.size)
+    )
+
+    return file_size, crc
+
+
+def request_put_status(
+    sock: socket, reader: SocketReader, filename: str
+) -> Tuple[int, int]:
+    """
+    Return how many bytes of a resumable put of filename the server already
+    staged and their CRC32
+    """
+    sock.sendall(bytes([PUT_STATUS_FIRST_BYTE]) + encode_filename(filename))
+
+    rescode = reader.read_exact(1)[0] >> 5
+
+    if rescode != PUT_OK_RESCODE:
+        raise RangeError(f"Server refused the put status of {filename}", rescode)
+
+    staged, crc = PUT_STATUS_RESPONSE.unpack(
+        reader.read_exact(PUT_STATUS_RESPONSE.size)
+    )
+
+    return staged, crc
+
+
+def request_put_append(
+    sock: socket,
+    reader: SocketReader,
+    filename: str,
+    file: BinaryIO,
+    file_size: int,
+    offset: int,
+    crc: int,
+) -> int:
+    """
+    Send file from offset to its end, to be staged by the server after its
+    first offset bytes, then promoted to filename if the whole staged file
+    matches crc
+
+    Return the rescode of the response
+    """
+    sock.sendall(
+        bytes([PUT_APPEND_FIRST_BYTE])
+        + encode_filename(filename)
+        + PUT_APPEND_REQUEST.pack(offset, file_size, crc)
+    )
+
+    file.seek(offset)
+    send_file(sock, file, file_size - offset)
+
+    return reader.read_exact(1)[0] >> 5
+
+
+def request_put_range(
+    sock: socket,
+    reader: SocketReader,
+    filename: str,
+    file: BinaryIO,
+    file_size: int,
+    offset: int,
+    length: int,
+) -> None:
+    """
+    Send a range of file, to be written at the same offset of filename on the
+    server
+    """
+    crc = range_crc32(file.fileno(), offset, length)
+
+    sock.sendall(
+        bytes([PUT_RANGE_FIRST_BYTE])
+        + encode_filename(filename)
+        + PUT_RANGE_REQUEST.pack(file_size, offset, length, crc)
+    )
+
+    file.seek(offset)
+    send_file(sock, file, length)
+
+    rescode = reader.read_exact(1)[0] >> 5
+
+    if rescode != PUT_OK_RESCODE:
+        raise RangeError(f"Server refused range {offset}+{length}", rescode)
+
+
+def run_ranges(
+    address: Tuple[str, int],
+    ranges: Deque[Range],
+    streams: int,
+    transfer: Callable[[socket, SocketReader, Range], None],
+    first_connection: Optional[socket] = None,
+) -> List[BaseException]:
+    """
+    Move ranges over up to streams connections, each connection taking the
+    next range as soon as it is done with its previous one, so a slow
+    connection gets less work
+
+    A failed range is retried on a fresh connection, up to RANGE_ATTEMPTS
+    times. Return the errors of the ranges that could not be moved, the
+    transfer stops at the first one
+    """
+    lock = Lock()
+    errors: List[BaseException] = []
+
+    def worker(sock: Optional[socket]) -> None:
+        try:
+            while True:
+                with lock:
+                    if errors or not ranges:
+                        return
+                    current = ranges.popleft()
+
+                for attempt in range(1, RANGE_ATTEMPTS + 1):
+                    try:
+                        if sock is None:
+                            sock = connect(address)
+
+                        transfer(sock, SocketReader(sock), current)
+                        break
+
+                    except (OSError, EOFError, RangeError) as error:
+                        if sock is not None:
+                            sock.close()
+                            sock = None
+
+                        # a refused range will be refused again
+                        refused = (
+                            isinstance(error, RangeError) and error.rescode is not None
+                        )
+
+                        if refused or attempt == RANGE_ATTEMPTS:
+                            with lock:
+                                errors.append(error)
+                            return
+
+        # anything else is a bug, the transfer must not end with a hole
+        except BaseException as error:
+            with lock:
+                errors.append(error)
+
+        finally:
+            if sock is not None:
+                sock.close()
+
+    workers = [
+        Thread(target=worker, args=(first_connection if i == 0 else None,), daemon=True)
+        for i in range(max(1, min(streams, len(ranges))))
+    ]
+
+    for thread in workers:
+        thread.start()
+
+    for thread in workers:
+        thread.join()
+
+    return errors
@@ -0,0 +1,472 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Reliable transfer of FTP payloads over UDP. A payload is split
+# into MTU sized segments carrying sequence numbers, sent through a sliding
+# window, acknowledged with selective ACKs and retransmitted based on the
+# measured round trip time.
+
+
+from collections import OrderedDict, deque
+from socket import socket, timeout as socket_timeout
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterator, Optional
+import os
+import struct
+import time
+
+try:
+    from myftp.transport import MAX_DATAGRAM_SIZE
+except ImportError:
+    from transport import MAX_DATAGRAM_SIZE
+
+# Every reliable UDP datagram starts with this byte. The 3 high bits (0b111)
+# are not used by any opcode nor rescode, so a server can tell reliable
+# segments apart from plain one-datagram requests
+RUDP_MARKER: int = 0xFF
+
+# segment kinds
+DATA_SEGMENT: int = 0
+ACK_SEGMENT: int = 1
+
+# marker, kind, transfer id, sequence number, total number of segments
+DATA_HEADER = struct.Struct("!BBIII")
+# marker, kind, transfer id, cumulative ack (every segment below it arrived),
+# followed by a bitmap of the segments received after the cumulative ack
+ACK_HEADER = struct.Struct("!BBII")
+
+# IPv4 + UDP headers
+IP_UDP_OVERHEAD: int = 28
+
+DEFAULT_MTU: int = 1500
+DEFAULT_WINDOW: int = 256
+
+# retransmission timer bounds in seconds (RFC 6298 style)
+INITIAL_RTO: float = 1.0
+MIN_RTO: float = 0.2
+MAX_RTO: float = 4.0
+
+# consecutive retransmission timeouts without progress before giving up
+MAX_RETRIES: int = 10
+
+# a receiver hearing nothing gives up no sooner than the sender would: every
+# retransmission timeout it allows, each backed off to the longest
+IDLE_TIMEOUT: float = (MAX_RETRIES + 1) * MAX_RTO
+
+# seconds a receiver stalled in the middle of a message waits before sending
+# its last ACK again, in case the sender is backing off because ACKs got lost
+ACK_REPEAT_INTERVAL: float = 1.0
+
+# the last ACK of a transfer is sent this many times since nothing acks it
+FINAL_ACK_COPIES: int = 3
+
+# remembered completed incoming transfers, to re-ack late duplicates
+COMPLETED_TRANSFERS_KEPT: int = 64
+
+
+def is_rudp_datagram(datagram: bytes) -> bool:
+    return len(datagram) > 0 and datagram[0] == RUDP_MARKER
+
+
+def parse_data_segment(datagram: bytes):
+    """
+    Return (transfer_id, seq, total, payload) of a DATA segment, or None if
+    the datagram is not one
+    """
+    if len(datagram) < DATA_HEADER.size or datagram[1] != DATA_SEGMENT:
+        return None
+
+    _, _, transfer_id, seq, total = DATA_HEADER.unpack_from(datagram)
+
+    return transfer_id, seq, total, memoryview(datagram)[DATA_HEADER.size :]
+
+
+def build_ack(transfer_id: int, cumulative: int, received_after: bytes = b"") -> bytes:
+    return ACK_HEADER.pack(RUDP_MARKER, ACK_SEGMENT, transfer_id, cumulative) + (
+        received_after
+    )
+
+
+def socket_recv_fn(
+    sock: socket, peer: Optional[Any] = None
+) -> Callable[[float], Optional[bytes]]:
+    """
+    Build a recv_fn for ReliableChannel reading from sock
+
+    When peer is given, datagrams coming from any other address are dropped
+    """
+
+    def recv(timeout: float) -> Optional[bytes]:
+        deadline = time.monotonic() + timeout
+        previous_timeout = sock.gettimeout()
+
+        try:
+            while True:
+                # a zero timeout would turn the socket non-blocking
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+
+                try:
+                    datagram, address = sock.recvfrom(MAX_DATAGRAM_SIZE)
+                except socket_timeout:
+                    return None
+
+                if peer is None or address == peer:
+                    return datagram
+
+        finally:
+            sock.settimeout(previous_timeout)
+
+    return recv
+
+
+class ReliableChannel:
+    """
+    One side of a reliable conversation with a single UDP peer
+
+    send_fn sends one datagram to the peer. recv_fn waits up to the given
+    number of seconds for the next datagram from the peer and returns None on
+    timeout. Both directions share the channel so late segments of a finished
+    transfer can still be acknowledged while the other direction is active
+    """
+
+    def __init__(
+        self,
+        send_fn: Callable[[bytes], object],
+        recv_fn: Callable[[float], Optional[bytes]],
+        mtu: int = DEFAULT_MTU,
+        window: int = DEFAULT_WINDOW,
+        timeout: float = IDLE_TIMEOUT,
+    ) -> None:
+        self.send_fn = send_fn
+        self.recv_fn = recv_fn
+        self.segment_size = mtu - IP_UDP_OVERHEAD - DATA_HEADER.size
+        self.window = window
+        self.timeout = timeout
+
+        # datagrams received too early, handed to the next transfer
+        self.backlog: Deque[bytes] = deque()
+
+        # transfer id -> number of segments, for incoming transfers already done
+        self.completed: OrderedDict[int, int] = OrderedDict()
+
+        self.next_transfer_id = int.from_bytes(os.urandom(4), "big")
+
+        # round trip time estimation
+        self.srtt: Optional[float] = None
+        self.rttvar: float = 0
+        self.rto: float = INITIAL_RTO
+
+        # statistics of the last send_message call
+        self.segments_sent = 0
+        self.segments_retransmitted = 0
+
+    def next_datagram(self, timeout: float) -> Optional[bytes]:
+        if self.backlog:
+            return self.backlog.popleft()
+
+        return self.recv_fn(max(timeout, 0))
+
+    def ack_completed(self, transfer_id: int) -> bool:
+        """
+        Re-acknowledge a duplicate segment of an incoming transfer that is
+        already done, return False if the transfer is unknown
+        """
+        total = self.completed.get(transfer_id)
+
+        if total is None:
+            return False
+
+        self.send_fn(build_ack(transfer_id, total))
+        return True
+
+    def update_rtt(self, sample: float) -> None:
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+    def segments(
+        self, header: bytes, body: Optional[BinaryIO], body_length: int
+    ) -> Iterator[bytes]:
+        """
+        Cut header followed by body_length bytes of body into segment payloads
+        """
+        pending = bytearray(header)
+        remaining = body_length
+
+        while len(pending) >= self.segment_size or remaining > 0:
+            if len(pending) < self.segment_size and body is not None:
+                chunk = body.read(min(self.segment_size - len(pending), remaining))
+
+                if not chunk:
+                    raise EOFError(
+                        f"File ended {remaining} bytes before the announced length"
+                    )
+
+                pending += chunk
+                remaining -= len(chunk)
+                continue
+
+            yield bytes(pending[: self.segment_size])
+            del pending[: self.segment_size]
+
+        if pending:
+            yield bytes(pending)
+
+    def send_message(
+        self, header: bytes, body: Optional[BinaryIO] = None, body_length: int = 0
+    ) -> None:
+        """
+        Reliably send header followed by body_length bytes of body
+
+        Only the segments inside the window are kept in memory
+        """
+        transfer_id = self.next_transfer_id
+        self.next_transfer_id = (self.next_transfer_id + 1) & 0xFFFFFFFF
+
+        total = -(-(len(header) + body_length) // self.segment_size)
+        source = self.segments(header, body, body_length)
+
+        # seq -> [payload, time of the last send, retransmitted, selectively acked]
+        in_flight: Dict[int, list] = {}
+        base = 0
+        next_seq = 0
+        retries = 0
+
+        self.segments_sent = 0
+        self.segments_retransmitted = 0
+
+        def send_segment(seq: int) -> None:
+            entry = in_flight[seq]
+            self.send_fn(
+                DATA_HEADER.pack(RUDP_MARKER, DATA_SEGMENT, transfer_id, seq, total)
+                + entry[0]
+            )
+            entry[1] = time.monotonic()
+            self.segments_sent += 1
+
+        def retransmit(seq: int) -> None:
+            in_flight[seq][2] = True
+            self.segments_retransmitted += 1
+            send_segment(seq)
+
+        while base < total:
+            # fill the window
+            while next_seq < total and next_seq < base + self.window:
+                in_flight[next_seq] = [next(source), 0.0, False, False]
+                send_segment(next_seq)
+                next_seq += 1
+
+            now = time.monotonic()
+            deadline = (
+                min(
+                    (entry[1] for entry in in_flight.values() if not entry[3]),
+                    default=now,
+                )
+                + self.rto
+            )
+
+            datagram = self.next_datagram(deadline - now)
+
+            # retransmission timeout: resend what expired and back off
+            if datagram is None:
+                retries += 1
+
+                if retries > MAX_RETRIES:
+                    raise TimeoutError(
+                        f"Peer stopped acknowledging after segment {base} of {total}"
+                    )
+
+                now = time.monotonic()
+                expired = [
+                    seq
+                    for seq, entry in in_flight.items()
+                    if not entry[3] and entry[1] + self.rto <= now
+                ]
+
+                # the acks covering selectively acked segments got lost
+                for seq in expired or [base]:
+                    retransmit(seq)
+
+                self.rto = min(self.rto * 2, MAX_RTO)
+                continue
+
+            if not is_rudp_datagram(datagram):
+                continue
+
+            data_segment = parse_data_segment(datagram)
+
+            if data_segment is not None:
+                # a late copy of a segment we already received
+                if self.ack_completed(data_segment[0]):
+                    continue
+
+                # the peer only answers once it has the whole message, so
+                # its reply stands for the missing final acknowledgement
+                self.backlog.appendleft(datagram)
+                return
+
+            if len(datagram) < ACK_HEADER.size or datagram[1] != ACK_SEGMENT:
+                continue
+
+            _, _, acked_transfer_id, cumulative = ACK_HEADER.unpack_from(datagram)
+
+            if acked_transfer_id != transfer_id:
+                continue
+
+            now = time.monotonic()
+            rtt_sample = None
+            progressed = cumulative > base
+
+            # cumulative acknowledgement
+            while base < min(cumulative, total):
+                entry = in_flight.pop(base, None)
+                if entry is not None and not entry[2] and not entry[3]:
+                    rtt_sample = now - entry[1]
+                base += 1
+
+            # selective acknowledgements
+            bitmap = datagram[ACK_HEADER.size :]
+            highest_sacked = -1
+
+            for index, byte in enumerate(bitmap):
+                if not byte:
+                    continue
+
+                for bit in range(8):
+                    if byte & (0x80 >> bit):
+                        seq = cumulative + 1 + index * 8 + bit
+                        entry = in_flight.get(seq)
+                        if entry is not None and not entry[3]:
+                            entry[3] = True
+                            progressed = True
+                            if not entry[2]:
+                                rtt_sample = now - entry[1]
+                        highest_sacked = max(highest_sacked, seq)
+
+            if rtt_sample is not None:
+                self.update_rtt(rtt_sample)
+
+            if progressed:
+                retries = 0
+
+            # segments reported missing below a selectively acknowledged one
+            # are resent once without waiting for the timer, further losses
+            # of the same segment are left to the retransmission timer
+            if highest_sacked >= 0:
+                fast_retransmit_age = self.srtt if self.srtt is not None else self.rto
+                for seq in range(base, highest_sacked):
+                    entry = in_flight.get(seq)
+                    if (
+                        entry is not None
+                        and not entry[2]
+                        and not entry[3]
+                        and now - entry[1] >= fast_retransmit_age
+                    ):
+                        retransmit(seq)
+
+    def recv_message(self, sink: BinaryIO) -> int:
+        """
+        Reliably receive one message, writing it in order to sink
+
+        Return the number of bytes written
+        """
+        transfer_id: Optional[int] = None
+        total = 0
+        expected = 0
+        written = 0
+        out_of_order: Dict[int, bytes] = {}
+        last_heard = time.monotonic()
+
+        while transfer_id is None or expected < total:
+            idle_left = last_heard + self.timeout - time.monotonic()
+            datagram = self.next_datagram(
+                idle_left
+                if transfer_id is None
+                else min(idle_left, ACK_REPEAT_INTERVAL)
+            )
+
+            if datagram is None:
+                if transfer_id is None or time.monotonic() - last_heard >= self.timeout:
+                    raise TimeoutError(
+                        f"No data from the peer for {self.timeout} seconds"
+                    )
+
+                self.send_fn(
+                    build_ack(
+                        transfer_id,
+                        expected,
+                        self.sack_bitmap(expected, out_of_order),
+                    )
+                )
+                continue
+
+            last_heard = time.monotonic()
+
+            data_segment = parse_data_segment(datagram)
+
+            if data_segment is None:
+                continue
+
+            segment_transfer_id, seq, segment_total, payload = data_segment
+
+            if segment_transfer_id != transfer_id:
+                if self.ack_completed(segment_transfer_id):
+                    continue
+
+                # first segment of the message
+                if transfer_id is None:
+                    transfer_id = segment_transfer_id
+                    total = segment_total
+                else:
+                    continue
+
+            if seq == expected:
+                sink.write(payload)
+                written += len(payload)
+                expected += 1
+
+                while expected in out_of_order:
+                    chunk = out_of_order.pop(expected)
+                    sink.write(chunk)
+                    written += len(chunk)
+                    expected += 1
+
+            elif expected < seq < min(expected + self.window, total):
+                out_of_order.setdefault(seq, bytes(payload))
+
+            if expected < total:
+                self.send_fn(
+                    build_ack(
+                        transfer_id,
+                        expected,
+                        self.sack_bitmap(expected, out_of_order),
+                    )
+                )
+
+        self.completed[transfer_id] = total  # type: ignore
+        if len(self.completed) > COMPLETED_TRANSFERS_KEPT:
+            self.completed.popitem(last=False)
+
+        for _ in range(FINAL_ACK_COPIES):
+            self.send_fn(build_ack(transfer_id, total))  # type: ignore
+
+        return written
+
+    def sack_bitmap(self, cumulative: int, out_of_order: Dict[int, bytes]) -> bytes:
+        """
+        Bit i (most significant first) is set when segment cumulative + 1 + i
+        was received
+        """
+        if not out_of_order:
+            return b""
+
+        bitmap = bytearray((max(out_of_order) - cumulative + 7) // 8)
+
+        for seq in out_of_order:
+            offset = seq - cumulative - 1
+            bitmap[offset // 8] |= 0x80 >> (offset % 8)
+
+        return bytes(bitmap)
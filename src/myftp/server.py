@@ -3,35 +3,422 @@
 # Description: FTP server (both UDP and TCP implemented)
 
 
-from socket import socket, AF_INET, SOCK_DGRAM, SOCK_STREAM
+from socket import (
+    socket,
+    timeout,
+    AF_INET,
+    SOCK_DGRAM,
+    SOCK_STREAM,
+    SOL_SOCKET,
+    SO_REUSEADDR,
+    IPPROTO_TCP,
+    TCP_NODELAY,
+)
+from threading import BoundedSemaphore, Lock, Thread
 from argparse import ArgumentParser
-from typing import Optional, Tuple
-import traceback
+from typing import BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+from time import perf_counter
+import logging
+import struct
 import os
 
-# Res-codes
-rescode_success_dict: dict[str, int] = {
-    "correct_put_and_change_request_rescode": 0b000,
-    "correct_get_request_rescode": 0b001,
-    "correct_summary_request_rescode": 0b010,
-    "help_rescode": 0b110,
-}
+from queue import Queue
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from hashlib import sha256
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+try:
+    from myftp.transport import (
+        MAX_DATAGRAM_SIZE,
+        SPOOL_MAX_SIZE,
+        BufferReader,
+        CountingReader,
+        FileReader,
+        SocketReader,
+        send_message,
+    )
+    from myftp.rudp import (
+        ReliableChannel,
+        is_rudp_datagram,
+        parse_data_segment,
+    )
+    from myftp.summary import (
+        FILES_SEPARATOR,
+        MAX_SUMMARY_FILES,
+        SUMMARY_STATS_EXTENDED_OPCODE,
+        SummaryStats,
+        encode_summary_stats,
+        format_summary,
+        is_pattern,
+        merge_summaries,
+        summarize_path,
+    )
+    from myftp.cache import ByteBudgetCache, LRUCache, file_identity, stat_identity
+    from myftp.mux import (
+        FEATURE_CONDITIONAL_GET,
+        FEATURE_DEDUP,
+        FEATURE_DELTA,
+        FEATURE_LZMA,
+        FEATURE_MULTIPLEX,
+        FEATURE_PROTOCOL_V2,
+        FEATURE_RANGES,
+        FEATURE_RESUME,
+        FEATURE_ZLIB,
+        FIN_FLAG,
+        HELLO_EXTENDED_OPCODE,
+        HELLO_FIRST_BYTE,
+        HELLO_REQUEST,
+        HELLO_RESPONSE,
+        MuxWriter,
+        StreamReader,
+        read_frame,
+    )
+    from myftp.protocol import (
+        CHANGE_FAILED_RESCODE,
+        FILE_NOT_FOUND_RESCODE,
+        GET_OK_RESCODE,
+        NAMED_REQUESTS,
+        PROTOCOL_V1,
+        PROTOCOL_V2,
+        PUT_OK_RESCODE,
+        SUMMARY_OK_RESCODE,
+        UNKNOWN_REQUEST_RESCODE,
+        V1_MAX_NAME_LENGTH,
+        build_request_table,
+        encode_file_header,
+        encode_help,
+        encode_status,
+        error_rescodes,
+        fits_v1,
+        read_name_length,
+        read_size,
+        rescode_names,
+    )
+    from myftp.compression import (
+        COMPRESSED_GET_EXTENDED_OPCODE,
+        COMPRESSED_GET_FIRST_BYTE,
+        COMPRESSED_HEADER,
+        COMPRESSED_PUT_EXTENDED_OPCODE,
+        NO_COMPRESSION,
+        DecompressingWriter,
+        algorithm_features,
+        algorithm_names,
+        compress_file,
+    )
+    from myftp.delta import (
+        DELTA_HEADER,
+        DELTA_PUT_EXTENDED_OPCODE,
+        SIGNATURE,
+        SIGNATURES_EXTENDED_OPCODE,
+        SIGNATURES_HEADER,
+        HashingWriter,
+        apply_delta,
+        choose_block_size,
+        compute_signatures,
+    )
+    from myftp.workers import supervise
+    from myftp.durability import (
+        DEFAULT_GROUP_COMMIT_WINDOW,
+        DURABILITY_NONE,
+        DURABILITY_POLICIES,
+        Durability,
+        create_temporary,
+    )
+    from myftp.listing import (
+        LIST_EXACT,
+        LIST_EXTENDED_OPCODE,
+        LIST_REQUEST,
+        LIST_WITH_HASH,
+        MAX_LIST_ENTRIES,
+        DirectoryIndex,
+        encode_listing,
+    )
+    from myftp.log import configure_logging, get_logger, log_levels
+    from myftp.metrics import (
+        STATS_EXTENDED_OPCODE,
+        Metrics,
+        encode_stats,
+        serve_metrics,
+    )
+    from myftp.sessions import SessionTable, UDPSession
+    from myftp.shaping import (
+        DEFAULT_INTERACTIVE_BYTES,
+        BandwidthShaper,
+        Flow,
+        send_shaped,
+    )
+    from myftp.conditional import (
+        CONDITIONAL_GET_EXTENDED_OPCODE,
+        CONDITIONAL_GET_REQUEST,
+        HAS_VALIDATORS,
+        encode_conditional_get_response,
+        is_not_modified,
+    )
+    from myftp.dedup import (
+        PUT_HASH_EXTENDED_OPCODE,
+        PUT_HASH_REQUEST,
+        BlobStore,
+    )
+    from myftp.ranges import (
+        CHECKSUM_EXTENDED_OPCODE,
+        CHECKSUM_REQUEST,
+        CHECKSUM_RESPONSE,
+        GET_RANGE_EXTENDED_OPCODE,
+        GET_RANGE_REQUEST,
+        GET_RANGE_RESPONSE,
+        PUT_APPEND_EXTENDED_OPCODE,
+        PUT_APPEND_REQUEST,
+        PUT_RANGE_EXTENDED_OPCODE,
+        PUT_RANGE_REQUEST,
+        PUT_STATUS_EXTENDED_OPCODE,
+        PUT_STATUS_RESPONSE,
+        PositionalWriter,
+        encode_filename,
+        range_crc32,
+        staging_path,
+    )
+except ImportError:
+    from transport import (
+        MAX_DATAGRAM_SIZE,
+        SPOOL_MAX_SIZE,
+        BufferReader,
+        CountingReader,
+        FileReader,
+        SocketReader,
+        send_message,
+    )
+    from rudp import (
+        ReliableChannel,
+        is_rudp_datagram,
+        parse_data_segment,
+    )
+    from summary import (
+        FILES_SEPARATOR,
+        MAX_SUMMARY_FILES,
+        SUMMARY_STATS_EXTENDED_OPCODE,
+        SummaryStats,
+        encode_summary_stats,
+        format_summary,
+        is_pattern,
+        merge_summaries,
+        summarize_path,
+    )
+    from cache import ByteBudgetCache, LRUCache, file_identity, stat_identity
+    from mux import (
+        FEATURE_CONDITIONAL_GET,
+        FEATURE_DEDUP,
+        FEATURE_DELTA,
+        FEATURE_LZMA,
+        FEATURE_MULTIPLEX,
+        FEATURE_PROTOCOL_V2,
+        FEATURE_RANGES,
+        FEATURE_RESUME,
+        FEATURE_ZLIB,
+        FIN_FLAG,
+        HELLO_EXTENDED_OPCODE,
+        HELLO_FIRST_BYTE,
+        HELLO_REQUEST,
+        HELLO_RESPONSE,
+        MuxWriter,
+        StreamReader,
+        read_frame,
+    )
+    from protocol import (
+        CHANGE_FAILED_RESCODE,
+        FILE_NOT_FOUND_RESCODE,
+        GET_OK_RESCODE,
+        NAMED_REQUESTS,
+        PROTOCOL_V1,
+        PROTOCOL_V2,
+        PUT_OK_RESCODE,
+        SUMMARY_OK_RESCODE,
+        UNKNOWN_REQUEST_RESCODE,
+        V1_MAX_NAME_LENGTH,
+        build_request_table,
+        encode_file_header,
+        encode_help,
+        encode_status,
+        error_rescodes,
+        fits_v1,
+        read_name_length,
+        read_size,
+        rescode_names,
+    )
+    from compression import (
+        COMPRESSED_GET_EXTENDED_OPCODE,
+        COMPRESSED_GET_FIRST_BYTE,
+        COMPRESSED_HEADER,
+        COMPRESSED_PUT_EXTENDED_OPCODE,
+        NO_COMPRESSION,
+        DecompressingWriter,
+        algorithm_features,
+        algorithm_names,
+        compress_file,
+    )
+    from delta import (
+        DELTA_HEADER,
+        DELTA_PUT_EXTENDED_OPCODE,
+        SIGNATURE,
+        SIGNATURES_EXTENDED_OPCODE,
+        SIGNATURES_HEADER,
+        HashingWriter,
+        apply_delta,
+        choose_block_size,
+        compute_signatures,
+    )
+    from workers import supervise
+    from durability import (
+        DEFAULT_GROUP_COMMIT_WINDOW,
+        DURABILITY_NONE,
+        DURABILITY_POLICIES,
+        Durability,
+        create_temporary,
+    )
+    from listing import (
+        LIST_EXACT,
+        LIST_EXTENDED_OPCODE,
+        LIST_REQUEST,
+        LIST_WITH_HASH,
+        MAX_LIST_ENTRIES,
+        DirectoryIndex,
+        encode_listing,
+    )
+    from log import configure_logging, get_logger, log_levels
+    from metrics import (
+        STATS_EXTENDED_OPCODE,
+        Metrics,
+        encode_stats,
+        serve_metrics,
+    )
+    from sessions import SessionTable, UDPSession
+    from shaping import (
+        DEFAULT_INTERACTIVE_BYTES,
+        BandwidthShaper,
+        Flow,
+        send_shaped,
+    )
+    from conditional import (
+        CONDITIONAL_GET_EXTENDED_OPCODE,
+        CONDITIONAL_GET_REQUEST,
+        HAS_VALIDATORS,
+        encode_conditional_get_response,
+        is_not_modified,
+    )
+    from dedup import (
+        PUT_HASH_EXTENDED_OPCODE,
+        PUT_HASH_REQUEST,
+        BlobStore,
+    )
+    from ranges import (
+        CHECKSUM_EXTENDED_OPCODE,
+        CHECKSUM_REQUEST,
+        CHECKSUM_RESPONSE,
+        GET_RANGE_EXTENDED_OPCODE,
+        GET_RANGE_REQUEST,
+        GET_RANGE_RESPONSE,
+        PUT_APPEND_EXTENDED_OPCODE,
+        PUT_APPEND_REQUEST,
+        PUT_RANGE_EXTENDED_OPCODE,
+        PUT_RANGE_REQUEST,
+        PUT_STATUS_EXTENDED_OPCODE,
+        PUT_STATUS_RESPONSE,
+        PositionalWriter,
+        encode_filename,
+        range_crc32,
+        staging_path,
+    )
 
-rescode_fail_dict: dict[str, int] = {
-    "file_not_error_rescode": 0b011,
-    "unknown_request_rescode": 0b100,
-    "unsuccessful_change_rescode": 0b101,
+# extended opcodes, in the low 5 bits of a first byte whose opcode is 0b111
+ext_op_codes_dict: dict[int, str] = {
+    HELLO_EXTENDED_OPCODE: "hello",
+    GET_RANGE_EXTENDED_OPCODE: "get_range",
+    PUT_RANGE_EXTENDED_OPCODE: "put_range",
+    CHECKSUM_EXTENDED_OPCODE: "checksum",
+    PUT_STATUS_EXTENDED_OPCODE: "put_status",
+    PUT_APPEND_EXTENDED_OPCODE: "put_append",
+    COMPRESSED_GET_EXTENDED_OPCODE: "compressed_get",
+    COMPRESSED_PUT_EXTENDED_OPCODE: "compressed_put",
+    SIGNATURES_EXTENDED_OPCODE: "signatures",
+    DELTA_PUT_EXTENDED_OPCODE: "delta_put",
+    PUT_HASH_EXTENDED_OPCODE: "put_hash",
+    STATS_EXTENDED_OPCODE: "stats",
+    LIST_EXTENDED_OPCODE: "list",
+    CONDITIONAL_GET_EXTENDED_OPCODE: "conditional_get",
+    SUMMARY_STATS_EXTENDED_OPCODE: "summary_stats",
 }
 
-# opcodes
-op_codes_dict: dict[int, str] = {
-    0b000: "put",
-    0b001: "get",
-    0b010: "change",
-    0b011: "summary",
-    0b100: "help",
-    0b101: "unknown",
-}
+# first byte -> request type and the filename length its low 5 bits carry
+request_table: list[Tuple[str, int]] = build_request_table(ext_op_codes_dict)
+
+# custom type to represent the address of a client
+Address = Tuple[str, int]
+
+# where the rest of a request is read from once its first byte is decoded
+Reader = Union[SocketReader, BufferReader, FileReader, StreamReader, CountingReader]
+
+# content sent after a response header: an open file streamed from disk, or
+# a cached file content shared as is
+Body = Union[BinaryIO, bytes]
+
+# response header, body sent right after it and the length of the body
+Response = Tuple[bytes, Optional[Body], int]
+
+# answers one request: filename length, reader of the rest of the request,
+# client address, protocol version
+Handler = Callable[[int, Reader, Address, int], Response]
+
+# message of a help response
+help_message: bytes = b"get,put,summary,change,help,bye"
+
+
+def status_handler(process: Callable[[Reader], int]) -> Handler:
+    """
+    Handler of an extended request answered with its rescode only
+    """
+
+    def handler(
+        filename_length: int, reader: Reader, client_address: Address, version: int
+    ) -> Response:
+        return encode_status(process(reader)), None, 0
+
+    return handler
+
+
+def body_handler(
+    process: Callable[[Reader], Tuple[int, Optional[bytes], Optional[Body], int]]
+) -> Handler:
+    """
+    Handler of an extended request answered with a header and a body, or
+    with its rescode only if it failed
+    """
+
+    def handler(
+        filename_length: int, reader: Reader, client_address: Address, version: int
+    ) -> Response:
+        rescode, res_header, body, body_length = process(reader)
+
+        if res_header is None:
+            return encode_status(rescode), None, 0
+
+        return res_header, body, body_length
+
+    return handler
+
+
+def payload_handler(process: Callable[[Reader], bytes]) -> Handler:
+    """
+    Handler of an extended request whose whole response process builds
+    """
+
+    def handler(
+        filename_length: int, reader: Reader, client_address: Address, version: int
+    ) -> Response:
+        return process(reader), None, 0
+
+    return handler
 
 
 class Server:
@@ -42,422 +429,1949 @@ class Server:
         directory_path: str,
         debug: bool,
         protocol: str,
+        max_connections: int = 64,
+        idle_timeout: float = 300,
+        summary_cache_size: int = 128,
+        get_cache_bytes: int = 0,
+        get_cache_entry_bytes: int = 1024 * 1024,
+        get_cache_policy: str = "lru",
+        max_streams: int = 32,
+        dedup: bool = False,
+        udp_workers: int = 8,
+        max_udp_sessions: int = 1024,
+        metrics_port: int = 0,
+        durability: str = DURABILITY_NONE,
+        group_commit_window: float = DEFAULT_GROUP_COMMIT_WINDOW,
+        summary_workers: int = 1,
+        max_rate: float = 0,
+        client_rate: float = 0,
+        interactive_bytes: int = DEFAULT_INTERACTIVE_BYTES,
     ) -> None:
         self.server_name = server_name
         self.server_port = server_port
         self.protocol: str = protocol
         self.directory_path = directory_path
         self.debug = debug
+        self.log = get_logger("myftp.server", protocol)
+
+        # TCP only: number of clients served at the same time and how long
+        # (in seconds) a connected client may stay silent before being dropped
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.connection_slots = BoundedSemaphore(max_connections)
+
+        # TCP only: requests a multiplexing client may have in flight on one
+        # connection, 0 disables multiplexing
+        self.max_streams = max_streams
+
+        # TCP only: bytes per second the responses may use in total and per
+        # client host, 0 for no limit. Responses up to interactive_bytes are
+        # never held back
+        self.shaper: Optional[BandwidthShaper] = (
+            BandwidthShaper(max_rate, client_rate, interactive_bytes)
+            if max_rate > 0 or client_rate > 0
+            else None
+        )
+
+        # computed summaries of the most recently summarized files
+        self.summary_cache = LRUCache(summary_cache_size)
+
+        # processes the files of a summary of several files are parsed in,
+        # started on the first such summary. 1 parses them in this process
+        self.summary_workers = summary_workers
+        self.summary_pool: Optional[ProcessPoolExecutor] = None
+        self.summary_pool_lock = Lock()
+
+        # content of the hottest files served by get, disabled by default
+        self.get_cache = ByteBudgetCache(
+            get_cache_bytes, get_cache_entry_bytes, get_cache_policy
+        )
+
+        # files are hardlinks to content-addressed blobs, each distinct
+        # content is stored once
+        self.blob_store: Optional[BlobStore] = (
+            BlobStore(directory_path) if dedup else None
+        )
+
+        # written files are renamed into place once complete, flushed to disk
+        # before that or not depending on the policy
+        self.durability = Durability(durability, group_commit_window)
+
+        # metadata of the files of the directory, answering list requests
+        self.directory_index = DirectoryIndex(directory_path)
+
+        # UDP only: state of the clients heard from recently, and threads
+        # serving their requests
+        self.udp_workers = udp_workers
+        self.udp_sessions = SessionTable(max_udp_sessions, idle_timeout)
+
+        # requests, latencies, bytes moved and cache hit rates, read by stats
+        # requests and, if metrics_port is set, over HTTP in the Prometheus
+        # format
+        self.metrics_port = metrics_port
+        self.metrics = Metrics(rescode_names)
+        self.metrics.caches["summary"] = self.summary_cache.stats
+        self.metrics.caches["get"] = self.get_cache.stats
+        self.metrics.gauges["udp_sessions"] = lambda: len(self.udp_sessions)
+        self.metrics.gauges["indexed_files"] = lambda: len(self.directory_index)
+        self.metrics.gauges["group_commit_batches"] = lambda: self.durability.batches
+        self.metrics.gauges["group_commit_files"] = lambda: self.durability.files
+
+        if self.shaper is not None:
+            shaper = self.shaper
+            self.metrics.gauges["shaped_connections"] = lambda: shaper.flows
+            self.metrics.gauges["shaping_wait_seconds"] = lambda: shaper.wait_seconds
+
+        # request type -> handler returning its response
+        self.handlers: Dict[str, Handler] = {
+            "help": self.respond_help,
+            "get": self.respond_get,
+            "put": self.respond_put,
+            "summary": self.respond_summary,
+            "change": self.respond_change,
+            "get_range": body_handler(self.process_get_range_req),
+            "put_range": status_handler(self.process_put_range_req),
+            "compressed_get": body_handler(self.process_compressed_get_req),
+            "compressed_put": status_handler(self.process_compressed_put_req),
+            "signatures": self.respond_signatures,
+            "delta_put": status_handler(self.process_delta_put_req),
+            "put_hash": status_handler(self.process_put_hash_req),
+            "checksum": self.respond_checksum,
+            "put_status": payload_handler(self.process_put_status_req),
+            "put_append": status_handler(self.process_put_append_req),
+            "stats": self.respond_stats,
+            "list": payload_handler(self.process_list_req),
+            "conditional_get": body_handler(self.process_conditional_get_req),
+            "summary_stats": payload_handler(self.process_summary_stats_req),
+        }
+
+    def run(
+        self, server_socket: Optional[socket] = None, reuse_port: bool = False
+    ) -> None:
+        """
+        Serve clients until interrupted, on server_socket if given (a socket
+        shared by pre-forked workers) or on a socket of its own
+        """
+        if server_socket is None:
+            server_socket = self.open_socket(reuse_port)
+
+        metrics_server = (
+            serve_metrics(self.metrics, self.server_name, self.metrics_port)
+            if self.metrics_port
+            else None
+        )
+
+        self.log.debug(
+            "Server is ready to receive at %s:%s",
+            self.server_name,
+            self.server_port,
+        )
+
+        try:
+            if self.protocol == "TCP":
+                self.serve_tcp(server_socket)
+            else:
+                self.serve_udp(server_socket)
+
+        except KeyboardInterrupt:
+            self.log.info("Server shutting down")
+
+        finally:
+            server_socket.close()
+            self.log.info("Closed the server socket")
+
+            if metrics_server is not None:
+                metrics_server.shutdown()
+                metrics_server.server_close()
 
-    def run(self):
+            if self.summary_pool is not None:
+                self.summary_pool.shutdown(cancel_futures=True)
+
+    def open_socket(self, reuse_port: bool = False) -> socket:
+        """
+        Bind the server socket, with reuse_port other processes may bind the
+        same port and the kernel balances clients between them
+        """
         server_socket = socket(
             AF_INET, (SOCK_DGRAM if self.protocol == "UDP" else SOCK_STREAM)
         )
 
-        server_socket.bind((self.server_name, self.server_port))
+        # allow quick restarts without waiting for TIME_WAIT sockets to expire
+        server_socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+
+        if reuse_port:
+            from socket import SO_REUSEPORT  # not on every platform
+
+            server_socket.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+
+        server_socket.bind((self.server_name, self.server_port))
+
+        # only needed for TCP
+        server_socket.listen(self.max_connections) if self.protocol == "TCP" else None
+
+        return server_socket
+
+    def serve_tcp(self, server_socket: socket) -> None:
+        """
+        Accept TCP clients forever, each one is served on its own thread
+
+        At most max_connections clients are served at the same time, the
+        others wait in the listen backlog until a slot frees up
+        """
+        while True:
+            self.connection_slots.acquire()
+
+            try:
+                client_socket, client_address = server_socket.accept()
+            except BaseException:
+                self.connection_slots.release()
+                raise
+
+            self.log.debug("Connected to TCP client at %s", client_address)
+
+            Thread(
+                target=self.handle_tcp_client,
+                args=(client_socket, client_address),
+                daemon=True,
+            ).start()
+
+    def handle_tcp_client(self, client_socket: socket, client_address: Address):
+        """
+        Serve one TCP client until it disconnects or stays idle for too long
+        """
+        client_socket.settimeout(self.idle_timeout)
+        # a response header and its body are sent apart, Nagle would hold the
+        # body back until the client acknowledges the header
+        client_socket.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+        reader = SocketReader(client_socket)
+        self.metrics.connection_opened()
+
+        # paces the responses of this connection if bandwidth is shaped
+        flow: Optional[Flow] = (
+            self.shaper.open_flow(client_address) if self.shaper is not None else None
+        )
+
+        # framing of the plain requests, upgraded by a hello
+        version = PROTOCOL_V1
+
+        try:
+            while True:
+                first_byte = client_socket.recv(1)
+
+                # TCP client disconnected
+                if not first_byte:
+                    self.log.debug("TCP client at %s disconnected", client_address)
+                    break
+
+                # feature negotiation, the connection may switch to frames
+                if first_byte[0] == HELLO_FIRST_BYTE:
+                    features = self.process_hello_req(client_socket, reader)
+
+                    if features & FEATURE_PROTOCOL_V2:
+                        version = PROTOCOL_V2
+
+                    if features & FEATURE_MULTIPLEX:
+                        self.serve_multiplexed(
+                            client_socket, reader, client_address, version, flow
+                        )
+                        break
+
+                    continue
+
+                res_header, res_body, res_body_length = self.handle_request(
+                    first_byte, reader, client_address, version
+                )
+                sending = perf_counter()
+
+                if flow is not None:
+                    send_shaped(
+                        client_socket, flow, res_header, res_body, res_body_length
+                    )
+
+                elif isinstance(res_body, bytes) or res_body is None:
+                    send_message(client_socket, res_header, res_body, res_body_length)
+
+                else:
+                    with res_body:
+                        send_message(
+                            client_socket, res_header, res_body, res_body_length
+                        )
+
+                self.metrics.observe_transfer(
+                    request_table[first_byte[0]][0], perf_counter() - sending
+                )
+
+        except timeout:
+            self.log.debug(
+                "TCP client at %s idle for %s seconds, closing the connection",
+                client_address,
+                self.idle_timeout,
+            )
+
+        except (OSError, EOFError) as error:
+            self.log.debug("%s happened with TCP client at %s", error, client_address)
+
+        finally:
+            client_socket.close()
+            self.connection_slots.release()
+            self.metrics.connection_closed()
+
+            if flow is not None:
+                flow.close()
+
+    def process_hello_req(self, client_socket: socket, reader: SocketReader) -> int:
+        """
+        Answer a hello request with the subset of the requested features this
+        server supports, return that subset
+        """
+        (requested_features,) = struct.unpack(
+            "!I", reader.read_exact(HELLO_REQUEST.size - 1)
+        )
+
+        supported_features = (
+            FEATURE_RANGES
+            | FEATURE_RESUME
+            | FEATURE_ZLIB
+            | FEATURE_LZMA
+            | FEATURE_DELTA
+            | FEATURE_PROTOCOL_V2
+            | FEATURE_CONDITIONAL_GET
+        ) | (
+            (FEATURE_MULTIPLEX if self.max_streams > 0 else 0)
+            | (FEATURE_DEDUP if self.blob_store is not None else 0)
+        )
+        accepted_features = requested_features & supported_features
+
+        self.log.debug(
+            "Hello request asking for features %#x, accepted %#x",
+            requested_features,
+            accepted_features,
+        )
+
+        client_socket.sendall(
+            HELLO_RESPONSE.pack(HELLO_FIRST_BYTE, accepted_features, self.max_streams)
+        )
+
+        return accepted_features
+
+    def serve_multiplexed(
+        self,
+        client_socket: socket,
+        reader: SocketReader,
+        client_address: Address,
+        version: int = PROTOCOL_V1,
+        flow: Optional[Flow] = None,
+    ) -> None:
+        """
+        Serve a connection switched to multiplexing: every frame read belongs
+        to a stream carrying one request, each stream is handled on its own
+        thread and the responses are interleaved by a MuxWriter, paced by flow
+        """
+        writer = MuxWriter(client_socket, flow=flow)
+        stream_slots = BoundedSemaphore(self.max_streams)
+        streams: dict[int, StreamReader] = {}
+        handlers: list[Thread] = []
+
+        try:
+            while True:
+                try:
+                    stream_id, flags, data = read_frame(reader)
+
+                # only idle if no request is still being answered
+                except timeout:
+                    handlers = [handler for handler in handlers if handler.is_alive()]
+
+                    if handlers or writer.pending:
+                        continue
+                    raise
+
+                except EOFError:
+                    self.log.debug("TCP client at %s disconnected", client_address)
+                    break
+
+                stream = streams.get(stream_id)
+
+                if stream is None:
+                    if not stream_slots.acquire(blocking=False):
+                        raise ConnectionError(
+                            f"More than {self.max_streams} streams in flight"
+                        )
+
+                    stream = streams[stream_id] = StreamReader()
+
+                    handler = Thread(
+                        target=self.serve_stream,
+                        args=(
+                            stream_id,
+                            stream,
+                            writer,
+                            stream_slots,
+                            client_address,
+                            version,
+                        ),
+                        daemon=True,
+                    )
+                    handler.start()
+
+                    handlers = [handler for handler in handlers if handler.is_alive()]
+                    handlers.append(handler)
+
+                stream.feed(data)
+
+                if flags & FIN_FLAG:
+                    stream.finish()
+                    del streams[stream_id]
+
+        finally:
+            for stream in streams.values():
+                stream.finish()
+
+            writer.close()
+
+    def serve_stream(
+        self,
+        stream_id: int,
+        stream: StreamReader,
+        writer: MuxWriter,
+        stream_slots: BoundedSemaphore,
+        client_address: Address,
+        version: int = PROTOCOL_V1,
+    ) -> None:
+        """
+        Answer the request carried by one stream of a multiplexed connection
+        """
+        try:
+            first_byte = stream.read_exact(1)
+            res_header, res_body, res_body_length = self.handle_request(
+                first_byte, stream, client_address, version
+            )
+            sending = perf_counter()
+
+            writer.submit(
+                stream_id,
+                res_header,
+                res_body,
+                res_body_length,
+                lambda: self.metrics.observe_transfer(
+                    request_table[first_byte[0]][0], perf_counter() - sending
+                ),
+            )
+
+        except EOFError as error:
+            self.log.debug(
+                "%s happened on stream %s of TCP client at %s",
+                error,
+                stream_id,
+                client_address,
+            )
+
+            # an empty response tells the client its request was cut short
+            writer.submit(stream_id, b"")
+
+        except ConnectionError as error:
+            self.log.debug(
+                "%s happened on stream %s of TCP client at %s",
+                error,
+                stream_id,
+                client_address,
+            )
+
+        finally:
+            stream.drain()
+            stream_slots.release()
+
+    def serve_udp(self, server_socket: socket) -> None:
+        """
+        Receive UDP datagrams forever and route each one to the session of
+        its sender
+
+        A session is served by a pool thread while it has datagrams queued,
+        so the requests of one client are handled in order and a slow one
+        only holds back that client
+        """
+        # sessions with datagrams queued, waiting for a pool thread
+        ready_sessions: Queue = Queue()
+
+        def serve_ready_sessions() -> None:
+            while True:
+                self.serve_udp_session(server_socket, ready_sessions.get())
+
+        for _ in range(self.udp_workers):
+            Thread(target=serve_ready_sessions, daemon=True).start()
+
+        while True:
+            datagram, client_address = server_socket.recvfrom(MAX_DATAGRAM_SIZE)
+
+            session = self.udp_sessions.session_for(client_address)
+
+            if session is None:
+                self.log.debug(
+                    "Every session is busy, dropped a datagram from %s",
+                    client_address,
+                )
+                continue
+
+            if session.deliver(datagram):
+                ready_sessions.put(session)
+
+    def serve_udp_session(self, server_socket: socket, session: UDPSession) -> None:
+        """
+        Handle the datagrams queued by a UDP client until there are none left
+
+        Datagrams that start a reliable UDP transfer are handed to
+        handle_reliable_udp_request, any other datagram is a whole request
+        """
+        client_address = session.address
+
+        try:
+            while (datagram := session.next_datagram()) is not None:
+                if is_rudp_datagram(datagram):
+                    self.handle_reliable_udp_request(server_socket, session, datagram)
+                else:
+                    self.handle_udp_request(server_socket, datagram, client_address)
+
+        except Exception as error:
+            self.log.error(
+                "%s happened with UDP client at %s",
+                error,
+                client_address,
+                exc_info=True,
+            )
+
+            # the session is dropped with what it still queued, the client
+            # starts a new one with its next datagram
+            while session.next_datagram() is not None:
+                pass
+
+    def handle_udp_request(
+        self, server_socket: socket, req_payload: bytes, client_address: Address
+    ) -> None:
+        """
+        Answer a request held in one datagram with one datagram
+        """
+        try:
+            res_header, res_body, res_body_length = self.handle_request(
+                req_payload[:1],
+                BufferReader(memoryview(req_payload)[1:]),
+                client_address,
+            )
+
+        except EOFError as error:
+            self.log.debug("%s happened with UDP client at %s", error, client_address)
+            return
+
+        res_payload = res_header
+
+        if res_body is not None:
+            if len(res_header) + res_body_length <= MAX_DATAGRAM_SIZE:
+                res_payload = res_header + (
+                    res_body
+                    if isinstance(res_body, bytes)
+                    else res_body.read(res_body_length)
+                )
+
+            else:
+                self.log.warning(
+                    "File of %s bytes does not fit in a UDP datagram",
+                    res_body_length,
+                )
+                res_payload = encode_status(FILE_NOT_FOUND_RESCODE)
+
+            if not isinstance(res_body, bytes):
+                res_body.close()
+
+        server_socket.sendto(res_payload, client_address)
+
+    def handle_reliable_udp_request(
+        self, server_socket: socket, session: UDPSession, first_datagram: bytes
+    ) -> None:
+        """
+        Receive a request sent with the reliable UDP transfer mode, starting
+        from its first received segment, and send the response back the same way
+
+        The channel reads the next segments from the session, and is kept
+        with it so late copies of finished transfers are still recognized
+        """
+        client_address = session.address
+        channel = session.channel
+
+        if channel is None:
+            channel = session.channel = ReliableChannel(
+                lambda datagram: server_socket.sendto(datagram, client_address),
+                session.recv,
+            )
+
+        data_segment = parse_data_segment(first_datagram)
+
+        # stray acknowledgement or late copy of an already answered request
+        if data_segment is None or channel.ack_completed(data_segment[0]):
+            return
+
+        channel.backlog.append(first_datagram)
+
+        try:
+            with SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as request:
+                channel.recv_message(request)  # type: ignore
+                request.seek(0)
+
+                reader = FileReader(request)  # type: ignore
+
+                first_byte = reader.read_exact(1)
+                res_header, res_body, res_body_length = self.handle_request(
+                    first_byte, reader, client_address
+                )
+
+            sending = perf_counter()
+
+            if isinstance(res_body, bytes):
+                channel.send_message(res_header, BytesIO(res_body), res_body_length)
+
+            elif res_body is not None:
+                with res_body:
+                    channel.send_message(res_header, res_body, res_body_length)
+            else:
+                channel.send_message(res_header)
+
+            self.metrics.observe_transfer(
+                request_table[first_byte[0]][0], perf_counter() - sending
+            )
+
+            self.log.debug(
+                "Reliable UDP response sent to %s in %s segments, %s retransmitted",
+                client_address,
+                channel.segments_sent,
+                channel.segments_retransmitted,
+            )
+
+        except (TimeoutError, EOFError) as error:
+            self.log.debug(
+                "%s happened with reliable UDP client at %s",
+                error,
+                client_address,
+            )
+
+    def handle_request(
+        self,
+        first_byte: bytes,
+        reader: Reader,
+        client_address: Address,
+        version: int = PROTOCOL_V1,
+    ) -> Response:
+        """
+        Decode one request from a client, run the matching handler and
+        return the response to send back, both framed with protocol version
+
+        The response is the payload header, plus for a get request the body
+        (open file or cached content) and the number of bytes of it to send
+        right after the header
+
+        Every request is recorded in the metrics: its latency, until the
+        response is ready to be sent, and the bytes it moved. The callers
+        record the time spent sending the response
+        """
+        started = perf_counter()
+        counting_reader = CountingReader(reader)
+        request_type, filename_length_in_bytes = self.decode_first_byte(
+            first_byte, version, counting_reader
+        )
+
+        debug = self.log.isEnabledFor(logging.DEBUG)
+
+        if debug:
+            self.log.debug(
+                "Received %s request from client at %s. Filename length in bytes: %s",
+                request_type,
+                client_address,
+                filename_length_in_bytes,
+            )
+
+        try:
+            response = self.dispatch_request(
+                request_type,
+                filename_length_in_bytes,
+                counting_reader,
+                client_address,
+                version,
+            )
+
+        except BaseException:
+            self.metrics.observe(
+                request_type,
+                None,
+                perf_counter() - started,
+                counting_reader.count + 1,
+                0,
+                True,
+            )
+            raise
+
+        res_header, _, res_body_length = response
+        rescode = res_header[0] >> 5
+
+        self.metrics.observe(
+            request_type,
+            rescode,
+            perf_counter() - started,
+            counting_reader.count + 1,
+            len(res_header) + res_body_length,
+            rescode in error_rescodes,
+        )
+
+        if debug:
+            self.log.debug(
+                "Sending to client at %s: %s. Header length is %s, body length is %s",
+                client_address,
+                res_header,
+                len(res_header),
+                res_body_length,
+            )
+
+        return response
+
+    def dispatch_request(
+        self,
+        request_type: str,
+        filename_length_in_bytes: int,
+        reader: Reader,
+        client_address: Address,
+        version: int = PROTOCOL_V1,
+    ) -> Response:
+        """
+        Run the handler of a decoded request, return its response as
+        handle_request does
+
+        Handlers are looked up by request type in self.handlers, types
+        without one get an unknown request response
+        """
+        handler = self.handlers.get(request_type)
+
+        if handler is None:
+            return encode_status(UNKNOWN_REQUEST_RESCODE), None, 0
+
+        return handler(filename_length_in_bytes, reader, client_address, version)
+
+    def respond_help(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        return encode_help(help_message, version), None, 0
+
+    def respond_get(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        filename, body, file_size = self.process_get_req(
+            reader.read_exact(filename_length)
+        )
+
+        if filename is None or body is None or file_size is None:
+            return encode_status(FILE_NOT_FOUND_RESCODE), None, 0
+
+        # a version 1 response can not announce more than 4 GiB
+        if version == PROTOCOL_V1 and not fits_v1(filename, file_size):
+            self.log.warning(
+                "File %s of %s bytes can only be sent with protocol v2",
+                filename,
+                file_size,
+            )
+
+            if not isinstance(body, bytes):
+                body.close()
+
+            return encode_status(FILE_NOT_FOUND_RESCODE), None, 0
+
+        self.log.debug(
+            "Sending file %s of %s bytes to client at %s",
+            filename,
+            file_size,
+            client_address,
+        )
+
+        return (
+            encode_file_header(
+                GET_OK_RESCODE, filename.encode("ascii"), file_size, version
+            ),
+            body,
+            file_size,
+        )
+
+    def respond_put(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        # put request failed since there wasnt a file sent from client
+        if filename_length == 0:
+            return encode_status(CHANGE_FAILED_RESCODE), None, 0
+
+        filename = reader.read_exact(filename_length).decode("ascii")
+
+        return (
+            encode_status(
+                self.process_put_req(filename, read_size(reader, version), reader)
+            ),
+            None,
+            0,
+        )
+
+    def respond_summary(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        # empty filename error
+        if filename_length <= 0:
+            return encode_status(FILE_NOT_FOUND_RESCODE), None, 0
+
+        rescode, filename, _, summary = self.process_summary_req(
+            filename_length, reader.read_exact(filename_length)
+        )
+
+        if filename is None or summary is None:
+            return encode_status(rescode), None, 0
+
+        # small enough to go out with its header in one send
+        return (
+            encode_file_header(rescode, filename.encode("ascii"), len(summary), version)
+            + summary,
+            None,
+            0,
+        )
+
+    def respond_change(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        old_filename = reader.read_exact(filename_length)
+        new_filename_length = (
+            read_name_length(reader)
+            if version == PROTOCOL_V2
+            else reader.read_exact(1)[0]
+        )
+        new_filename = reader.read_exact(new_filename_length)
+
+        rescode = self.process_change_req(
+            old_filename.decode("ascii"), new_filename.decode("ascii"), version
+        )
+
+        return encode_status(rescode), None, 0
+
+    def respond_signatures(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        rescode, res_header, signatures = self.process_signatures_req(reader)
+
+        if res_header is None or signatures is None:
+            return encode_status(rescode), None, 0
+
+        return res_header, signatures, len(signatures)
+
+    def respond_checksum(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        rescode, res_header = self.process_checksum_req(reader)
+
+        if res_header is None:
+            return encode_status(rescode), None, 0
+
+        return res_header, None, 0
+
+    def respond_stats(
+        self,
+        filename_length: int,
+        reader: Reader,
+        client_address: Address,
+        version: int,
+    ) -> Response:
+        return encode_stats(self.metrics), None, 0
+
+    def decode_first_byte(
+        self,
+        first_byte: bytes,
+        version: int = PROTOCOL_V1,
+        reader: Optional[Reader] = None,
+    ) -> Tuple[str, int]:
+        """
+        Retrieve the request_type from first byte, and the filename length
+
+        With protocol version 2 the low 5 bits of a plain request are zero,
+        and the filename length follows as a varint read from reader
+        """
+        if len(first_byte) != 1:
+            raise ValueError("Input is not 1 byte")
+
+        request_type, filename_length_in_bytes = request_table[first_byte[0]]
+
+        if version == PROTOCOL_V2 and request_type in NAMED_REQUESTS:
+            filename_length_in_bytes = read_name_length(reader)
+
+        return request_type, filename_length_in_bytes
+
+    def process_change_req(
+        self, old_filename: str, new_filename: str, version: int = PROTOCOL_V1
+    ) -> int:
+        """
+        Process change request from client
+        """
+        try:
+            if version == PROTOCOL_V2 or len(new_filename) <= V1_MAX_NAME_LENGTH:
+                old_filename_full_path = os.path.normpath(
+                    os.path.join(self.directory_path, old_filename)
+                )
+                new_filename_full_path = os.path.normpath(
+                    os.path.join(self.directory_path, new_filename)
+                )
+
+                self.log.info(
+                    "Changing file named %s to new file %s",
+                    old_filename_full_path,
+                    new_filename_full_path,
+                )
+
+                # files are only renamed, their content is never copied
+                if self.blob_store is not None:
+                    self.blob_store.replace(
+                        old_filename_full_path, new_filename_full_path
+                    )
+                else:
+                    os.rename(old_filename_full_path, new_filename_full_path)
+
+                self.invalidate_cached(old_filename_full_path)
+                self.invalidate_cached(new_filename_full_path)
+
+                return PUT_OK_RESCODE
+
+            else:
+                self.log.warning(
+                    "New file name longer than %s characters error",
+                    V1_MAX_NAME_LENGTH,
+                )
+                return CHANGE_FAILED_RESCODE
+
+        except Exception as error:
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+    def process_summary_req(
+        self, filename_length: int, req_payload: bytes
+    ) -> Tuple[int, Optional[str], Optional[int], Optional[bytes]]:
+        """
+        Find the files mentioned: a filename, or filenames and globs
+        separated by commas
+        Calculate the count, min, max, avg, variance and percentiles of their
+        numbers, merged from per file statistics
+        Send those numbers back as the content of a file called summary.txt,
+        built in memory
+        """
+        filename = req_payload[:filename_length].decode("ascii")
+
+        self.log.info("Summarizing the files named %s on the server", filename)
+
+        try:
+            files, stats = self.summarize(filename)
+
+            self.log.info(
+                "%s file(s) %s summarized successfully. The max is %s, the min is %s, the average is %s",
+                files,
+                filename,
+                stats.largest,
+                stats.smallest,
+                stats.average,
+            )
+
+            return (
+                SUMMARY_OK_RESCODE,
+                "summary.txt",
+                11,
+                format_summary(stats, files),
+            )
+
+        except Exception as error:
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return FILE_NOT_FOUND_RESCODE, None, None, None
+
+    def process_summary_stats_req(self, reader: Reader) -> bytes:
+        """
+        Summarize files like a summary request, but answer with the
+        statistics packed in binary instead of summary.txt
+        """
+        filename = reader.read_exact(read_name_length(reader)).decode("ascii")
+
+        self.log.info("Summarizing the files named %s on the server", filename)
+
+        try:
+            files, stats = self.summarize(filename)
+
+        except Exception as error:
+            self.log.error("%s happened.", error)
+
+            return encode_status(FILE_NOT_FOUND_RESCODE)
+
+        return encode_summary_stats(stats, files)
+
+    def summarize(self, filenames: str) -> Tuple[int, SummaryStats]:
+        """
+        Statistics of the numbers of every file filenames names, merged
+
+        Every file is summarized on its own, so its statistics are cached
+        and reused by any later summary including it. The files missing from
+        the cache are parsed in parallel by the summary worker processes when
+        there are several of them
+
+        Return the number of files and their statistics. Raise OSError if a
+        file can not be read, ValueError if a glob matches nothing, too many
+        files are named or none holds any number
+        """
+        paths = self.resolve_summary_files(filenames)
+        identities = [file_identity(path) for path in paths]
+
+        partials: List[Optional[SummaryStats]] = [
+            self.summary_cache.get(path, identity)
+            for path, identity in zip(paths, identities)
+        ]
+        missing = [index for index, partial in enumerate(partials) if partial is None]
+
+        if len(paths) > len(missing):
+            self.log.debug(
+                "Summaries of %s file(s) served from the cache",
+                len(paths) - len(missing),
+            )
+
+        computed: Optional[List[SummaryStats]] = None
+
+        if len(missing) > 1 and self.summary_workers > 1:
+            try:
+                computed = list(
+                    self.summary_executor().map(
+                        summarize_path, [paths[index] for index in missing]
+                    )
+                )
+
+            # a worker died (killed, out of memory): the next summary starts
+            # a new pool, this one is parsed here
+            except BrokenProcessPool as error:
+                self.log.warning("%s, summarizing in the server process", error)
+
+                with self.summary_pool_lock:
+                    self.summary_pool = None
+
+        if computed is None:
+            computed = [summarize_path(paths[index]) for index in missing]
+
+        for index, stats in zip(missing, computed):
+            partials[index] = stats
+            self.summary_cache.put(paths[index], identities[index], stats)
+
+        stats = merge_summaries(partials)  # type: ignore
+
+        if stats.count == 0:
+            raise ValueError(f"{filenames} does not contain any number")
+
+        return len(paths), stats
+
+    def resolve_summary_files(self, filenames: str) -> List[str]:
+        """
+        Paths of the files named by a list of filenames and globs, a glob
+        expanding to the matching files of the directory in name order
+        """
+        names: List[str] = []
+
+        for name in filenames.split(FILES_SEPARATOR):
+            if not is_pattern(name):
+                names.append(name)
+                continue
+
+            matched = self.directory_index.match(name)
+
+            if not matched:
+                raise ValueError(f"No file matches {name}")
+
+            names.extend(matched)
+
+        # a file named twice is only counted once
+        names = list(dict.fromkeys(names))
+
+        if len(names) > MAX_SUMMARY_FILES:
+            raise ValueError(
+                f"{len(names)} files to summarize, at most {MAX_SUMMARY_FILES} allowed"
+            )
+
+        return [
+            os.path.normpath(os.path.join(self.directory_path, name)) for name in names
+        ]
+
+    def summary_executor(self) -> ProcessPoolExecutor:
+        """
+        Pool of the summary worker processes, started on first use
+
+        Workers are spawned rather than forked, a fork of this multithreaded
+        process could inherit locks held by other threads
+        """
+        with self.summary_pool_lock:
+            if self.summary_pool is None:
+                self.summary_pool = ProcessPoolExecutor(
+                    self.summary_workers, mp_context=get_context("spawn")
+                )
+
+            return self.summary_pool
+
+    def process_put_req(self, filename: str, filesize: int, reader: Reader) -> int:
+        """
+        Reconstruct file put by client
+
+        The file content itself is streamed from reader straight to disk
+        """
+        self.log.info(
+            "Reconstructing the file %s of size %s bytes on the server while the client is sending",
+            filename,
+            filesize,
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
+        try:
+            fd, temporary_path = create_temporary(path, ".put")
+
+        except Exception as error:
+            # drain the file content so the next request stays aligned
+            reader.skip(filesize)
+
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+        try:
+            # the content is hashed on the way to disk when deduplicating
+            hasher = sha256() if self.blob_store is not None else None
+
+            with open(fd, "wb") as file:
+                reader.copy_to(
+                    HashingWriter(file, hasher) if hasher is not None else file,  # type: ignore
+                    filesize,
+                )
+
+                self.commit_file(file, temporary_path, path)
+
+        except EOFError:
+            self.discard(temporary_path)
+            raise
+
+        except Exception as error:
+            self.discard(temporary_path)
+
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+        self.log.info("File %s uploaded successfully", filename)
+
+        self.ingest(path, hasher.digest() if hasher is not None else None)
+
+        return PUT_OK_RESCODE
+
+    def process_put_range_req(self, reader: Reader) -> int:
+        """
+        Write one range of a file put over parallel connections
+
+        The range is written in place with positional writes, so the ranges
+        of one file are written concurrently in any order. The file is sized
+        to the announced total first, and the range is checked against the
+        CRC32 sent by the client
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        file_size, offset, length, crc = PUT_RANGE_REQUEST.unpack(
+            reader.read_exact(PUT_RANGE_REQUEST.size)
+        )
+
+        self.log.debug(
+            "Writing range %s+%s of file %s of size %s bytes",
+            offset,
+            length,
+            filename,
+            file_size,
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
+        try:
+            if offset + length > file_size:
+                raise ValueError(f"Range {offset}+{length} past the end of the file")
+
+            fd = self.open_for_writing(path, os.O_WRONLY | os.O_CREAT)
+
+        except Exception as error:
+            # drain the range content so the next request stays aligned
+            reader.skip(length)
+
+            self.log.error("%s happened.", error)
+            return CHANGE_FAILED_RESCODE
+
+        try:
+            # every range sizes the file, only the first one changes it
+            try:
+                if os.fstat(fd).st_size != file_size:
+                    os.ftruncate(fd, file_size)
+
+            except OSError:
+                reader.skip(length)
+                raise
+
+            self.invalidate_cached(path)
+
+            writer = PositionalWriter(fd, offset)
+            reader.copy_to(writer, length)  # type: ignore
+
+        except EOFError:
+            raise
+
+        except Exception as error:
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+        finally:
+            os.close(fd)
+
+        if writer.crc != crc:
+            self.log.warning(
+                "Checksum mismatch on range %s+%s of file %s",
+                offset,
+                length,
+                filename,
+            )
+            return CHANGE_FAILED_RESCODE
+
+        return PUT_OK_RESCODE
+
+    def process_compressed_put_req(self, reader: Reader) -> int:
+        """
+        Reconstruct a file put by the client with a compressed body, the body
+        is decompressed straight to disk
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        algorithm, file_size, body_length, compress_us = COMPRESSED_HEADER.unpack(
+            reader.read_exact(COMPRESSED_HEADER.size)
+        )
+
+        self.log.info(
+            "Reconstructing the file %s of size %s bytes from a %s body of %s bytes",
+            filename,
+            file_size,
+            algorithm_names.get(algorithm, "unknown"),
+            body_length,
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
+        try:
+            if algorithm != NO_COMPRESSION and algorithm not in algorithm_features:
+                raise ValueError(f"Unknown compression algorithm {algorithm}")
+
+            fd, temporary_path = create_temporary(path, ".put")
+
+        except Exception as error:
+            # drain the body so the next request stays aligned
+            reader.skip(body_length)
+
+            self.log.error("%s happened.", error)
+            return CHANGE_FAILED_RESCODE
+
+        try:
+            with open(fd, "wb") as file:
+                writer = DecompressingWriter(file, algorithm, file_size)
+                reader.copy_to(writer, body_length)  # type: ignore
+                writer.finish()
+
+                self.commit_file(file, temporary_path, path)
+
+        except EOFError:
+            self.discard(temporary_path)
+            raise
+
+        except Exception as error:
+            self.discard(temporary_path)
+
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+        self.log.info(
+            "File %s uploaded successfully, decompressed in %.3f ms of CPU",
+            filename,
+            writer.cpu_time * 1000,
+        )
+
+        self.ingest(path)
+
+        return PUT_OK_RESCODE
+
+    def process_signatures_req(
+        self, reader: Reader
+    ) -> Tuple[int, Optional[bytes], Optional[bytes]]:
+        """
+        Describe the current copy of a file with one signature per block, so
+        the client can send a delta put against it
+
+        Return the rescode, and if successful the response header and the
+        signatures following it
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
+        try:
+            file = open(path, "rb")
+
+        except (FileNotFoundError, IsADirectoryError):
+            self.log.warning("file %s not found", filename)
+            return FILE_NOT_FOUND_RESCODE, None, None
+
+        with file:
+            file_size = os.fstat(file.fileno()).st_size
+            block_size = choose_block_size(file_size)
+            signatures = compute_signatures(file.fileno(), file_size, block_size)
+
+        block_count = len(signatures) // SIGNATURE.size
+
+        self.log.debug(
+            "Sending %s signatures of %s byte blocks of file %s",
+            block_count,
+            block_size,
+            filename,
+        )
+
+        res_header = bytes([GET_OK_RESCODE << 5]) + SIGNATURES_HEADER.pack(
+            file_size, block_size, block_count
+        )
+
+        return GET_OK_RESCODE, res_header, signatures
+
+    def process_delta_put_req(self, reader: Reader) -> int:
+        """
+        Rebuild a file from the blocks of its current copy and the literal
+        data sent by the client
+
+        The new content is written to a temporary file next to the target, the
+        current copy is read while doing so. Once the rebuilt file matches the
+        hash sent by the client, it is renamed over the target in one atomic step
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        file_size, block_size, delta_length = DELTA_HEADER.unpack(
+            reader.read_exact(DELTA_HEADER.size)
+        )
+
+        self.log.info(
+            "Rebuilding the file %s of size %s bytes from a delta of %s bytes",
+            filename,
+            file_size,
+            delta_length,
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+        counting_reader = CountingReader(reader)
+        rebuilt_path = None
+
+        try:
+            if block_size == 0:
+                raise ValueError("Delta with an empty block size")
+
+            with open(path, "rb") as basis:
+                rebuilt_fd, rebuilt_path = create_temporary(path, ".delta")
+
+                with open(rebuilt_fd, "wb") as rebuilt_file:
+                    apply_delta(
+                        counting_reader, basis.fileno(), block_size, rebuilt_file
+                    )
+
+                    if counting_reader.count != delta_length:
+                        raise ValueError(
+                            f"Delta of {counting_reader.count} bytes, {delta_length} announced"
+                        )
+
+                    if rebuilt_file.tell() != file_size:
+                        raise ValueError(
+                            f"Rebuilt file of {rebuilt_file.tell()} bytes, {file_size} announced"
+                        )
+
+                    self.commit_file(rebuilt_file, rebuilt_path, path)
+
+        except EOFError:
+            if rebuilt_path is not None:
+                self.discard(rebuilt_path)
+            raise
+
+        except Exception as error:
+            if rebuilt_path is not None:
+                self.discard(rebuilt_path)
+
+            # drain the rest of the delta so the next request stays aligned
+            reader.skip(max(delta_length - counting_reader.count, 0))
+
+            self.log.error("%s happened.", error)
+            return CHANGE_FAILED_RESCODE
+
+        self.log.info("File %s rebuilt successfully from a delta", filename)
+
+        self.ingest(path)
+
+        return PUT_OK_RESCODE
+
+    def process_put_status_req(self, reader: Reader) -> bytes:
+        """
+        Tell how much of a resumable put is already staged, and the CRC32 of
+        the staged bytes so the client can check they match its file
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
+        try:
+            with open(staging_path(path), "rb") as staged_file:
+                staged = os.fstat(staged_file.fileno()).st_size
+                crc = range_crc32(staged_file.fileno(), 0, staged)
+
+        # nothing staged yet
+        except OSError:
+            staged, crc = 0, 0
+
+        self.log.debug("%s bytes of file %s already staged", staged, filename)
+
+        return bytes([PUT_OK_RESCODE << 5]) + PUT_STATUS_RESPONSE.pack(staged, crc)
+
+    def process_put_append_req(self, reader: Reader) -> int:
+        """
+        Stage the content of a resumable put after the bytes already staged
+
+        The content is written to a staging file next to the target, which
+        keeps whatever arrived if the connection breaks. Once the staging file
+        holds the whole file and matches the CRC32 sent by the client, it is
+        renamed over the target in one atomic step
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        offset, file_size, crc = PUT_APPEND_REQUEST.unpack(
+            reader.read_exact(PUT_APPEND_REQUEST.size)
+        )
+        length = max(file_size - offset, 0)
+
+        self.log.info(
+            "Staging file %s of size %s bytes from byte %s",
+            filename,
+            file_size,
+            offset,
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+        staged_path = staging_path(path)
+
+        try:
+            if offset > file_size:
+                raise ValueError(f"Offset {offset} past the end of the file")
+
+            file = open(staged_path, "r+b" if offset else "w+b")
+
+            if offset > os.fstat(file.fileno()).st_size:
+                file.close()
+                raise ValueError(f"Offset {offset} past the staged bytes")
+
+        except Exception as error:
+            # drain the file content so the next request stays aligned
+            reader.skip(length)
+
+            self.log.error("%s happened.", error)
+            return CHANGE_FAILED_RESCODE
+
+        try:
+            # closing the file on a broken connection keeps what arrived
+            with file:
+                file.truncate(offset)
+                file.seek(offset)
+
+                reader.copy_to(file, length)
+                file.flush()
+
+                staged_crc = range_crc32(file.fileno(), 0, file_size)
+
+                if staged_crc == crc:
+                    self.commit_file(file, staged_path, path)
+
+        except EOFError:
+            raise
+
+        except Exception as error:
+            self.log.error("%s happened.", error, exc_info=True)
+
+            return CHANGE_FAILED_RESCODE
+
+        if staged_crc != crc:
+            self.log.warning(
+                "Checksum mismatch on file %s, staged bytes dropped",
+                filename,
+            )
+            os.unlink(staged_path)
+            return CHANGE_FAILED_RESCODE
+
+        self.log.info("File %s uploaded successfully", filename)
+
+        self.ingest(path)
+
+        return PUT_OK_RESCODE
+
+    def process_put_hash_req(self, reader: Reader) -> int:
+        """
+        Put a file by linking it to the blob holding the content the client
+        offered the hash of, so nothing is uploaded
+
+        Answer file not found when the content is not stored, the client then
+        puts the file
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        file_size, digest = PUT_HASH_REQUEST.unpack(
+            reader.read_exact(PUT_HASH_REQUEST.size)
+        )
+
+        if self.blob_store is None:
+            return UNKNOWN_REQUEST_RESCODE
 
-        # only needed for TCP
-        server_socket.listen(5) if self.protocol == "TCP" else None
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
 
-        print(
-            f"myftp> - {self.protocol} - Server is ready to receive at {self.server_name}:{self.server_port}"
-        ) if self.debug else None
+        try:
+            linked = self.blob_store.link(digest, file_size, path)
 
-        shut_down = False
+        except Exception as error:
+            self.log.error("%s happened.", error)
+            return CHANGE_FAILED_RESCODE
 
-        try:
-            if self.protocol == "TCP":
-                client_socket, clientAddress = server_socket.accept()
+        if not linked:
+            self.log.debug(
+                "Content of file %s not stored yet, waiting for the upload",
+                filename,
+            )
 
-                print(
-                    f"myftp> - {self.protocol} - Connected to TCP client at {clientAddress}"
-                ) if self.debug else None
+            return FILE_NOT_FOUND_RESCODE
 
-            while not shut_down:
-                print(
-                    f"myftp> - {self.protocol} ------------------------------------------------------------------"
-                ) if self.debug else None
+        self.invalidate_cached(path)
 
-                if self.protocol == "UDP":
-                    req_payload, clientAddress = server_socket.recvfrom(2048)
-                else:
-                    req_payload = client_socket.recv(2048)  # type: ignore
+        self.log.info(
+            "File %s of %s bytes put from content already stored",
+            filename,
+            file_size,
+        )
 
-                    # TCP client disconnected
-                    if not req_payload:
-                        client_socket.close()  # type: ignore
-                        return
+        return PUT_OK_RESCODE
 
-                first_byte = bytes([req_payload[0]])
+    def open_for_writing(self, path: str, flags: int) -> int:
+        """
+        os.open a file about to be written, a file sharing its content with
+        others through the blob store is replaced by a fresh one first
+        """
+        if self.blob_store is not None:
+            return self.blob_store.open_detached(path, flags)
 
-                request_type, filename_length_in_bytes = self.decode_first_byte(
-                    first_byte
-                )
+        return os.open(path, flags, 0o666)
 
-                print(
-                    f"myftp> - {self.protocol} - Received message from client at {clientAddress}: {req_payload}. Payload length is {len(req_payload)}"  # type: ignore
-                ) if self.debug else None
-
-                # help request handling
-                if request_type == "help":
-                    print(
-                        f"myftp> - {self.protocol} - Client message parsed. Received help request"
-                    ) if self.debug else None
-
-                    rescode = rescode_success_dict["help_rescode"]
-                    response_data = "get,put,summary,change,help,bye".encode("ascii")
-                    filename = None
-                    filename_length_in_bytes = None
-
-                elif request_type == "get":
-                    pre_payload = self.process_get_req(req_payload[1:])
-
-                    if (
-                        pre_payload[0] is not None
-                        and pre_payload[1] is not None
-                        and pre_payload[2] is not None
-                    ):
-                        rescode = rescode_success_dict["correct_get_request_rescode"]
-                        filename = pre_payload[0]
-                        filename_length_in_bytes = pre_payload[2]
-                        response_data = pre_payload[1]
-
-                    else:
-                        rescode = rescode_fail_dict["file_not_error_rescode"]
-                        filename_length_in_bytes = None
-                        filename = None
-                        response_data = None
-
-                elif request_type == "put":
-                    # put request failed since there wasnt a file sent from client
-                    if filename_length_in_bytes == 0:
-                        rescode = rescode_fail_dict["unsuccessful_change_rescode"]
-                        filename_length_in_bytes = None
-                        filename = None
-                        response_data = None
-
-                    # put request success
-                    else:
-                        rescode = self.process_put_req(
-                            filename_length_in_bytes, req_payload[1:]
-                        )
-                        filename_length_in_bytes = None
-                        filename = None
-                        response_data = None
-
-                elif request_type == "summary":
-                    # empty filename error
-                    if filename_length_in_bytes <= 0:
-                        rescode = rescode_fail_dict["file_not_error_rescode"]
-                    else:
-                        (
-                            rescode,
-                            filename,  # "summary.txt"
-                            filename_length_in_bytes,  # of the summary file
-                            response_data,  # summary.txt file content
-                        ) = self.process_summary_req(
-                            filename_length_in_bytes, req_payload[1:]
-                        )
+    def commit_file(self, file: BinaryIO, source: str, target: str) -> None:
+        """
+        Rename the file just written at source over target, once flushed to
+        disk as far as the durability policy goes, and forget what was cached
+        about target
+        """
+        file.flush()
 
-                elif request_type == "change":
-                    rescode = self.process_change_req(
-                        filename_length_in_bytes, req_payload[1:]
-                    )
-                    filename_length_in_bytes = None
-                    filename = None
-                    response_data = None
-
-                elif request_type == "unknown":
-                    rescode = rescode_fail_dict["unknown_request_rescode"]
-                    filename_length_in_bytes = None
-                    filename = None
-                    response_data = None
-
-                res_payload: bytes = self.build_res_payload(
-                    rescode=rescode,  # type: ignore
-                    filename_length=filename_length_in_bytes,
-                    filename=filename,  # type: ignore
-                    response_data=response_data,  # type:ignore
-                )
+        self.durability.commit(
+            file.fileno(),
+            lambda: self.replace_file(source, target),
+            os.path.dirname(target),
+        )
 
-                if self.protocol == "UDP":
-                    server_socket.sendto(res_payload, clientAddress)  # type: ignore
-                else:
-                    client_socket.sendall(res_payload)  # type: ignore
+        self.invalidate_cached(target)
 
-                print(
-                    f"myftp> - {self.protocol} - Sent message to client at {clientAddress}: {res_payload}. Payload length is {len(res_payload)}"  # type: ignore
-                ) if self.debug else None
+    def discard(self, path: str) -> None:
+        """
+        Delete a temporary file of a write that failed
+        """
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
 
-        except KeyboardInterrupt:
-            shut_down = True
-            if self.protocol == "UDP":
-                server_socket.close()
-            else:
-                client_socket.close()  # type: ignore
+    def replace_file(self, source: str, target: str) -> None:
+        if self.blob_store is not None:
+            self.blob_store.replace(source, target)
+        else:
+            os.replace(source, target)
 
-            print(f"myftp> - {self.protocol} - Server shutting down")
+    def ingest(self, path: str, digest: Optional[bytes] = None) -> None:
+        """
+        Hand a file just written to the blob store, if deduplicating
+        """
+        if self.blob_store is None:
+            return
 
-        finally:
-            print(f"myftp> - {self.protocol} - Closed the server socket")
+        try:
+            self.blob_store.ingest(path, digest)
+
+        # the file stays a plain file, only its storage is not shared
+        except OSError as error:
+            self.log.warning("%s happened while deduplicating %s.", error, path)
 
-    def decode_first_byte(self, first_byte: bytes) -> Tuple[str, int]:
+    def invalidate_cached(self, path: str) -> None:
         """
-        Retrieve the request_type from first byte
+        Forget everything cached about path, called whenever a request writes
+        it, and list it again as it is once written
         """
-        if len(first_byte) != 1:
-            raise ValueError("Input is not 1 byte")
+        self.summary_cache.invalidate(path)
+        self.get_cache.invalidate(path)
+        self.directory_index.invalidate(path)
 
-        first_byte_to_binary = int.from_bytes(first_byte, "big")
+    def process_list_req(self, reader: Reader) -> bytes:
+        """
+        List a page of the files of the directory from its index, or stat a
+        single file
+
+        Return the whole response, a file not found response for the stat of
+        a missing file and an unknown request response for names that are not
+        ASCII
+        """
+        prefix_bytes = reader.read_exact(reader.read_exact(1)[0])
+        after_bytes = reader.read_exact(reader.read_exact(1)[0])
+        limit, flags = LIST_REQUEST.unpack(reader.read_exact(LIST_REQUEST.size))
 
         try:
-            request_type = op_codes_dict[first_byte_to_binary >> 5]
+            prefix = prefix_bytes.decode("ascii")
+            after = after_bytes.decode("ascii")
+        except UnicodeDecodeError:
+            self.log.warning("List request with a name that is not ASCII")
+            return encode_status(UNKNOWN_REQUEST_RESCODE)
+
+        total, entries, more = self.directory_index.list(
+            prefix, after, min(limit, MAX_LIST_ENTRIES), bool(flags & LIST_EXACT)
+        )
 
-            filename_length_in_bytes = first_byte_to_binary & 0b00011111
+        self.log.debug(
+            "Listing %s of %s files starting with %r after %r",
+            len(entries),
+            total,
+            prefix,
+            after,
+        )
 
-            print(
-                f"myftp> - {self.protocol} - First byte parsed. Request type: {request_type}. Filename length in bytes: {filename_length_in_bytes}"
-            )
+        if flags & LIST_EXACT and not entries:
+            return encode_status(FILE_NOT_FOUND_RESCODE)
 
-        except KeyError:
-            raise KeyError("Cant not find the request type")
+        with_hash = bool(flags & LIST_WITH_HASH)
 
-        return request_type, filename_length_in_bytes
+        try:
+            return encode_listing(
+                total,
+                [
+                    (
+                        name,
+                        identity[0],
+                        identity[1],
+                        self.directory_index.file_hash(name, identity)
+                        if with_hash
+                        else None,
+                    )
+                    for name, identity in entries
+                ],
+                more,
+                with_hash,
+            )
 
-    def process_change_req(
-        self, old_filename_length_in_bytes: int, req_payload: bytes
-    ) -> int:
+        # the index leaves out the names a listing can not carry, a listing
+        # still failing is answered instead of dropping the connection
+        except (UnicodeEncodeError, OverflowError):
+            self.log.warning("Listing of %r can not be encoded", prefix)
+            return encode_status(UNKNOWN_REQUEST_RESCODE)
+
+    def process_get_req(
+        self, second_byte_to_byte_n: bytes
+    ) -> Tuple[Optional[str], Optional[Body], Optional[int]]:
         """
-        Process change request from client
+        Process the get request
+
+        If successful, return the filename, the body and the content_length.
+        The body is either the opened file, that the caller streams and
+        closes, or the file content when it is small enough for the get cache
+
+        If not, return None, None, None tuple
         """
-        old_filename = req_payload[:old_filename_length_in_bytes].decode("ascii")
-        new_filename_length = int.from_bytes(
-            req_payload[
-                old_filename_length_in_bytes : old_filename_length_in_bytes + 1
-            ],
-            "big",
-        )
-        new_filename = req_payload[old_filename_length_in_bytes + 1 :].decode("ascii")
+        filename = second_byte_to_byte_n.decode("ascii")
+        self.log.debug("trying to find file %s", filename)
 
-        actual_new_filename_length = len(new_filename)
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
 
         try:
-            if new_filename_length <= 31 or actual_new_filename_length <= 31:
-                old_filename_full_path = os.path.normpath(
-                    os.path.join(self.directory_path, old_filename)
-                )
-                new_filename_full_path = os.path.normpath(
-                    os.path.join(self.directory_path, new_filename)
-                )
+            # hot files are served from memory without opening them
+            if self.get_cache.max_bytes > 0:
+                content = self.get_cache.get(path, file_identity(path))
 
-                print(
-                    f"myftp> - {self.protocol} - Changing file named {old_filename_full_path} to new file {new_filename_full_path}"
-                )
+                if content is not None:
+                    return filename, content, len(content)
 
-                os.rename(old_filename_full_path, new_filename_full_path)
+            file = open(path, "rb")
+            stat = os.fstat(file.fileno())
 
-                return rescode_success_dict["correct_put_and_change_request_rescode"]
+            if not self.get_cache.admits(stat.st_size):
+                return filename, file, stat.st_size
 
-            else:
-                print(
-                    f"myftp> - {self.protocol} - New file name longer than 31 characters error"
-                )
-                return rescode_fail_dict["unsuccessful_change_rescode"]
+            with file:
+                content = file.read(stat.st_size)
 
-        except Exception as error:
-            traceback_info = traceback.format_exc()
+            self.get_cache.put(path, stat_identity(stat), content)
 
-            print(f"myftp> - {self.protocol} - {error} happened.")
+            return filename, content, len(content)
 
-            print(traceback_info)
-            return rescode_fail_dict["unsuccessful_change_rescode"]
+        except FileNotFoundError:
+            self.log.warning("file %s not found", filename)
+            return (None, None, None)
 
-    def process_summary_req(
-        self, filename_length: int, req_payload: bytes
-    ) -> Tuple[int, Optional[str], Optional[int], Optional[bytes]]:
-        """
-        Find the filename mentioned
-        Calculate the min,max,avg
-        Put those numbers into a file called summary.txt
+        except IsADirectoryError:
+            self.log.warning("filename is blank")
+            return (None, None, None)
+
+    def process_get_range_req(
+        self, reader: Reader
+    ) -> Tuple[int, Optional[bytes], Optional[BinaryIO], int]:
         """
-        filename = req_payload[:filename_length].decode("ascii")
+        Serve one range of a file fetched over parallel connections
 
-        print(
-            f"myftp> - {self.protocol} - Summarizing the file named {filename} on the server"
+        Return the rescode, then if successful the response header, the file
+        opened at the range offset (None for an empty range) and the range
+        length. The range is clamped to the end of the file
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        offset, length = GET_RANGE_REQUEST.unpack(
+            reader.read_exact(GET_RANGE_REQUEST.size)
         )
 
+        self.log.debug("Sending range %s+%s of file %s", offset, length, filename)
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
+
         try:
-            with open(os.path.join(self.directory_path, filename), "r") as file:
-                numbers = [int(line.strip()) for line in file if line.strip().isdigit()]
+            file = open(path, "rb")
 
-                # Find the largest, smallest, and calculate the average
-                largest_number = max(numbers)
-                smallest_number = min(numbers)
-                average_value = sum(numbers) / len(numbers) if numbers else 0
+        except (FileNotFoundError, IsADirectoryError):
+            self.log.warning("file %s not found", filename)
+            return FILE_NOT_FOUND_RESCODE, None, None, 0
 
-                print(
-                    f"myftp> - {self.protocol} - File {filename} summarized successfully. The max is {largest_number}, the min is {smallest_number}, the average is {average_value}"
-                )
+        try:
+            file_size = os.fstat(file.fileno()).st_size
 
-                with open(
-                    os.path.join(self.directory_path, "summary.txt"), "w"
-                ) as summary_file:
-                    summary_file.write(f"min: {smallest_number}\n")
-                    summary_file.write(f"max: {largest_number}\n")
-                    summary_file.write(f"avg: {average_value}\n")
+            if offset > file_size:
+                file.close()
+                return UNKNOWN_REQUEST_RESCODE, None, None, 0
 
-                print(
-                    f"myftp> - {self.protocol} - Created file summary.txt summarized successfully. Sending it back to the client"
-                )
+            length = min(length, file_size - offset)
 
-                with open(
-                    os.path.join(self.directory_path, "summary.txt"), "rb"
-                ) as summary_file:
-                    binary_content = summary_file.read()
+            # computed ahead of sending, which also pulls the range into the
+            # page cache for send_file
+            crc = range_crc32(file.fileno(), offset, length)
+            file.seek(offset)
 
-                return (
-                    rescode_success_dict["correct_summary_request_rescode"],
-                    "summary.txt",
-                    11,
-                    binary_content,
-                )
+        except BaseException:
+            file.close()
+            raise
 
-        except Exception as error:
-            traceback_info = traceback.format_exc()
+        res_header = bytes([GET_OK_RESCODE << 5]) + GET_RANGE_RESPONSE.pack(
+            file_size, length, crc
+        )
 
-            print(f"myftp> - {self.protocol} - {error} happened.")
+        if length == 0:
+            file.close()
+            return GET_OK_RESCODE, res_header, None, 0
 
-            print(traceback_info)
-            return rescode_fail_dict["file_not_error_rescode"], None, None, None
+        return GET_OK_RESCODE, res_header, file, length
 
-    def process_put_req(self, filename_length: int, req_payload: bytes) -> int:
+    def process_compressed_get_req(
+        self, reader: Reader
+    ) -> Tuple[int, Optional[bytes], Optional[Body], int]:
         """
-        Reconstruct file put by client
+        Serve a file with its body compressed with the algorithm the client
+        asked for, or as is when sampling shows it does not compress
+
+        Return the rescode, then if successful the response header, the body
+        and its length
         """
-        filename = req_payload[:filename_length].decode("ascii")
-        filesize = int.from_bytes(
-            req_payload[filename_length : filename_length + 4], "big"
-        )
-        file_content = req_payload[filename_length + 4 :]
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        algorithm = reader.read_exact(1)[0]
 
-        print(
-            f"myftp> - {self.protocol} - Reconstructing the file {filename} of size {filesize} bytes on the server after the client finished sending"
-        )
+        if algorithm not in algorithm_features:
+            algorithm = NO_COMPRESSION
+
+        self.log.debug("trying to find file %s", filename)
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
 
         try:
-            with open(os.path.join(self.directory_path, filename), "wb") as file:
-                file.write(file_content)
+            file = open(path, "rb")
 
-                print(
-                    f"myftp> - {self.protocol} - File {filename} uploaded successfully"
-                )
+        except (FileNotFoundError, IsADirectoryError):
+            self.log.warning("file %s not found", filename)
+            return FILE_NOT_FOUND_RESCODE, None, None, 0
 
-                return rescode_success_dict["correct_put_and_change_request_rescode"]
+        try:
+            file_size = os.fstat(file.fileno()).st_size
 
-        except Exception as error:
-            traceback_info = traceback.format_exc()
+            algorithm, body, body_length, compress_us = compress_file(
+                file, file_size, algorithm
+            )
 
-            print(f"myftp> - {self.protocol} - {error} happened.")
+        except BaseException:
+            file.close()
+            raise
 
-            print(traceback_info)
-            return rescode_fail_dict["unsuccessful_change_rescode"]
+        # not compressed, the file itself is streamed
+        if body is None:
+            body = file
+        else:
+            file.close()
+
+        self.log.info(
+            "Sending file %s of %s bytes as a %s body of %s bytes, compressed in %.3f ms of CPU",
+            filename,
+            file_size,
+            algorithm_names[algorithm],
+            body_length,
+            compress_us / 1000,
+        )
 
-    def process_get_req(
-        self, second_byte_to_byte_n: bytes
-    ) -> Tuple[Optional[str], Optional[bytes], Optional[int]]:
-        """
-        Process the get request
+        res_header = (
+            bytes([COMPRESSED_GET_FIRST_BYTE])
+            + encode_filename(filename)
+            + COMPRESSED_HEADER.pack(algorithm, file_size, body_length, compress_us)
+        )
 
-        If successful, return the filename, content and the content_length
+        return GET_OK_RESCODE, res_header, body, body_length
 
-        If not, return None, None, None tuple
+    def process_conditional_get_req(
+        self, reader: Reader
+    ) -> Tuple[int, Optional[bytes], Optional[Body], int]:
         """
-        filename = second_byte_to_byte_n.decode("ascii")
-        print(f"myftp> - {self.protocol} - trying to find file {filename}")
+        Serve a file unless the copy the client validates is still up to
+        date, in which case only a header is sent back
+
+        Return the rescode, then if successful the response header, the body
+        (None if not modified) and its length
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        flags, size, mtime_ns, digest = CONDITIONAL_GET_REQUEST.unpack(
+            reader.read_exact(CONDITIONAL_GET_REQUEST.size)
+        )
+
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
 
         try:
-            with open(os.path.join(self.directory_path, filename), "rb") as file:
-                content = file.read()
-                content_length = len(content)
+            file = open(path, "rb")
 
-                return filename, content, content_length
+        except (FileNotFoundError, IsADirectoryError):
+            self.log.warning("file %s not found", filename)
+            return FILE_NOT_FOUND_RESCODE, None, None, 0
 
-        except FileNotFoundError:
-            print(f"myftp> - {self.protocol} - file {filename} not found")
-            return (None, None, None)
+        try:
+            identity = stat_identity(os.fstat(file.fileno()))
 
-        except IsADirectoryError:
-            print(f"myftp> - {self.protocol} - filename is blank")
-            return (None, None, None)
+            # the content is only hashed when the modification time differs,
+            # and the hash is kept by the directory index
+            if flags & HAS_VALIDATORS and is_not_modified(
+                identity,
+                size,
+                mtime_ns,
+                digest,
+                lambda: self.directory_index.file_hash(filename, identity),
+            ):
+                file.close()
 
-    # assembling the payload to send back to the client
-    def build_res_payload(
-        self,
-        rescode: int,
-        filename_length: Optional[int] = None,
-        filename: Optional[str] = None,
-        response_data: Optional[bytes] = None,
-    ) -> bytes:
-        print(
-            f"myftp> - {self.protocol} - Assembling response payload to be sent back to the client"
+                self.log.debug("File %s not modified", filename)
+
+                return (
+                    GET_OK_RESCODE,
+                    encode_conditional_get_response(
+                        filename, True, identity[0], identity[1]
+                    ),
+                    None,
+                    0,
+                )
+
+        except BaseException:
+            file.close()
+            raise
+
+        body: Body = file
+
+        # hot files are served from memory like plain gets
+        if self.get_cache.max_bytes > 0:
+            content = self.get_cache.get(path, identity)
+
+            if content is not None:
+                file.close()
+                body = content
+
+        self.log.debug(
+            "Sending file %s of %s bytes to client", filename, identity[0]
         )
 
-        data_len = len(response_data) if response_data is not None else None
+        return (
+            GET_OK_RESCODE,
+            encode_conditional_get_response(filename, False, identity[0], identity[1]),
+            body,
+            identity[0],
+        )
 
-        print(
-            f"myftp> - {self.protocol} - Rescode {format(rescode, '03b')}"
-        ) if self.debug else None
+    def process_checksum_req(self, reader: Reader) -> Tuple[int, Optional[bytes]]:
+        """
+        Compute the CRC32 of a range of a file, so a client can check the
+        part it already downloaded before resuming
 
-        print(
-            f"myftp> - {self.protocol} - Length of data {data_len}"
-        ) if self.debug else None
+        Return the rescode, and if successful the response
+        """
+        filename = reader.read_exact(reader.read_exact(1)[0]).decode("ascii")
+        offset, length = CHECKSUM_REQUEST.unpack(
+            reader.read_exact(CHECKSUM_REQUEST.size)
+        )
 
-        print(
-            f"myftp> - {self.protocol} - Data {response_data}"
-        ) if self.debug else None
-
-        # convert to binary
-        try:
-            # get case
-            if filename is not None:
-                first_byte = ((rescode << 5) + len(filename)).to_bytes(1, "big")
-            # help case
-            elif filename is None and response_data is not None:
-                first_byte = ((rescode << 5) + len(response_data)).to_bytes(1, "big")
-            # other cases
-            else:
-                first_byte = (rescode << 5).to_bytes(1, "big")
+        path = os.path.normpath(os.path.join(self.directory_path, filename))
 
-            # we only need the firstbyte
-            if filename is None:
-                second_byte_to_FL_plus_five = None
-            # second byte and more are needed
-            else:
-                # get case
-                second_byte_to_FL_plus_five = (
-                    filename.encode() + len(response_data).to_bytes(4, "big")
-                    if response_data is not None
-                    else None
-                )
+        try:
+            file = open(path, "rb")
 
-            print(
-                f"myftp> - {self.protocol} - First byte assembled for rescode {format(rescode, '03b')}: {bin(int.from_bytes(first_byte, byteorder='big'))[2:]}"
-            ) if self.debug else None
-
-            # get/summary case
-            if second_byte_to_FL_plus_five is not None and response_data is not None:
-                res_payload = first_byte + second_byte_to_FL_plus_five + response_data
-            # help case
-            elif second_byte_to_FL_plus_five is None and response_data is not None:
-                res_payload = first_byte + response_data
-            # change/put case
-            else:
-                res_payload = first_byte
+        except (FileNotFoundError, IsADirectoryError):
+            self.log.warning("file %s not found", filename)
+            return FILE_NOT_FOUND_RESCODE, None
 
-            return res_payload
+        with file:
+            file_size = os.fstat(file.fileno()).st_size
 
-        except Exception:
-            raise
+            if offset + length > file_size:
+                return UNKNOWN_REQUEST_RESCODE, None
+
+            crc = range_crc32(file.fileno(), offset, length)
+
+        return GET_OK_RESCODE, bytes([GET_OK_RESCODE << 5]) + CHECKSUM_RESPONSE.pack(
+            file_size, crc
+        )
 
 
 def check_directory(path: str) -> bool:
@@ -497,16 +2411,171 @@ def init():
         help="Port number for the server. Default = 12000",
     )
 
+    parser.add_argument(
+        "--max_connections",
+        default=64,
+        required=False,
+        type=int,
+        help="TCP only: maximum number of clients served at the same time. Default = 64",
+    )
+
+    parser.add_argument(
+        "--idle_timeout",
+        default=300,
+        required=False,
+        type=float,
+        help="Seconds a TCP client may stay idle before it is disconnected, or a UDP client before its session is forgotten. Default = 300",
+    )
+
+    parser.add_argument(
+        "--max_rate",
+        default=0,
+        required=False,
+        type=float,
+        help="TCP only: bytes per second all responses may use together (per worker process), shared fairly between the connections, 0 for no limit. Default = 0",
+    )
+
+    parser.add_argument(
+        "--client_rate",
+        default=0,
+        required=False,
+        type=float,
+        help="TCP only: bytes per second the responses to one client host may use, 0 for no limit. Default = 0",
+    )
+
+    parser.add_argument(
+        "--interactive_bytes",
+        default=DEFAULT_INTERACTIVE_BYTES,
+        required=False,
+        type=int,
+        help="Responses up to this many bytes are sent without waiting for --max_rate or --client_rate. Default = 65536",
+    )
+
+    parser.add_argument(
+        "--summary_cache_size",
+        default=128,
+        required=False,
+        type=int,
+        help="Number of file summaries kept in memory, 0 disables the cache. Default = 128",
+    )
+
+    parser.add_argument(
+        "--summary_workers",
+        default=os.cpu_count() or 1,
+        required=False,
+        type=int,
+        help="Processes the files of a summary of several files are parsed in, 1 parses them in the server process. Default = number of CPUs",
+    )
+
+    parser.add_argument(
+        "--get_cache_bytes",
+        default=0,
+        required=False,
+        type=int,
+        help="Memory budget in bytes for caching the content of files served by get, 0 disables the cache. Default = 0",
+    )
+
+    parser.add_argument(
+        "--get_cache_entry_bytes",
+        default=1024 * 1024,
+        required=False,
+        type=int,
+        help="Largest file size in bytes kept in the get cache. Default = 1048576",
+    )
+
+    parser.add_argument(
+        "--get_cache_policy",
+        default="lru",
+        required=False,
+        choices=["lru", "lfu"],
+        help="Eviction policy of the get cache: least recently or least frequently used. Default = lru",
+    )
+
+    parser.add_argument(
+        "--max_streams",
+        default=32,
+        required=False,
+        type=int,
+        help="TCP only: requests a multiplexing client may have in flight on one connection, 0 disables multiplexing. Default = 32",
+    )
+
+    parser.add_argument(
+        "--dedup",
+        type=int,
+        choices=[0, 1],
+        default=0,
+        required=False,
+        help="Store each distinct file content once, files with the same content are hardlinks to it and puts of content already stored skip the upload (0 or 1)",
+    )
+
+    parser.add_argument(
+        "--udp_workers",
+        default=8,
+        required=False,
+        type=int,
+        help="UDP only: threads serving the requests of different clients concurrently. Default = 8",
+    )
+
+    parser.add_argument(
+        "--max_udp_sessions",
+        default=1024,
+        required=False,
+        type=int,
+        help="UDP only: clients whose session is kept at once, the least recently active idle one is forgotten first. Default = 1024",
+    )
+
+    parser.add_argument(
+        "--workers",
+        default=1,
+        required=False,
+        type=int,
+        help="Serve from this many processes sharing the port, restarted if they crash, each with its own caches. Default = 1 (single process)",
+    )
+
+    parser.add_argument(
+        "--durability",
+        default=DURABILITY_NONE,
+        required=False,
+        choices=list(DURABILITY_POLICIES),
+        help="Flushing of written files: none (atomic rename only), file (fsync every file) or group (fsyncs of concurrent puts batched). Default = none",
+    )
+
+    parser.add_argument(
+        "--group_commit_ms",
+        default=DEFAULT_GROUP_COMMIT_WINDOW * 1000,
+        required=False,
+        type=float,
+        help=f"Group durability only: milliseconds a put waits for others to share its flush. Default = {DEFAULT_GROUP_COMMIT_WINDOW * 1000:g}",
+    )
+
+    parser.add_argument(
+        "--metrics_port",
+        default=0,
+        required=False,
+        type=int,
+        help="Serve the metrics in the Prometheus text format at http://ip_addr:metrics_port/metrics, worker i of --workers on metrics_port + i. Default = 0 (disabled)",
+    )
+
+    parser.add_argument(
+        "--log_level",
+        default="info",
+        required=False,
+        choices=list(log_levels),
+        help="Least severe messages printed by the server. Default = info",
+    )
+
     parser.add_argument(
         "--debug",
         type=int,
         choices=[0, 1],
         default=0,
-        help="Enable or disable the flag (0 or 1)",
+        help="Enable or disable the flag (0 or 1), 1 is the same as --log_level debug",
     )
 
     args = parser.parse_args()
 
+    configure_logging("debug" if args.debug else args.log_level)
+
     while (
         protocol_selection := input("myftp>Press 1 for TCP, Press 2 for UDP\n")
     ) not in {"1", "2"}:
@@ -518,6 +2587,28 @@ def init():
         )
         return
 
+    if args.max_connections < 1:
+        print("Error: --max_connections must be at least 1.")
+        return
+
+    if args.udp_workers < 1 or args.max_udp_sessions < 1:
+        print("Error: --udp_workers and --max_udp_sessions must be at least 1.")
+        return
+
+    if args.max_rate < 0 or args.client_rate < 0 or args.interactive_bytes < 0:
+        print(
+            "Error: --max_rate, --client_rate and --interactive_bytes can not be negative."
+        )
+        return
+
+    if args.workers < 1 or args.summary_workers < 1:
+        print("Error: --workers and --summary_workers must be at least 1.")
+        return
+
+    if args.workers > 1 and not hasattr(os, "fork"):
+        print("Error: --workers needs a platform with fork.")
+        return
+
     # start the server
     server = Server(
         args.ip_addr,
@@ -525,9 +2616,29 @@ def init():
         args.directory,
         args.debug,
         ("UDP" if protocol_selection == "2" else "TCP"),
+        args.max_connections,
+        args.idle_timeout,
+        args.summary_cache_size,
+        args.get_cache_bytes,
+        args.get_cache_entry_bytes,
+        args.get_cache_policy,
+        args.max_streams,
+        bool(args.dedup),
+        args.udp_workers,
+        args.max_udp_sessions,
+        args.metrics_port,
+        args.durability,
+        args.group_commit_ms / 1000,
+        args.summary_workers,
+        args.max_rate,
+        args.client_rate,
+        args.interactive_bytes,
     )
 
-    server.run()
+    if args.workers > 1:
+        supervise(server, args.workers)
+    else:
+        server.run()
 
 
 if __name__ == "__main__":
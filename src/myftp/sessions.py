@@ -0,0 +1,145 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Per-client sessions of the UDP server. The receive loop only
+# routes datagrams to the session of their sender. Each session is drained by
+# a pool thread, so a slow request of one client never holds back the others,
+# while the requests of one client are still answered in order.
+
+
+from collections import OrderedDict, deque
+from threading import Condition, Lock
+from time import monotonic
+from typing import Any, Deque, Optional, Tuple
+
+# datagrams queued per session, more are dropped as the network would
+MAX_QUEUED_DATAGRAMS: int = 256
+
+# custom type to represent the address of a client
+Address = Tuple[str, int]
+
+
+class UDPSession:
+    """
+    State of one UDP client: the datagrams it sent not handled yet, and its
+    reliable UDP channel once it used one
+
+    At most one pool thread serves a session at a time, the one that got
+    True from deliver, until next_datagram returns None
+    """
+
+    def __init__(self, address: Address) -> None:
+        self.address = address
+        self.condition = Condition()
+        self.inbox: Deque[bytes] = deque()
+        self.busy = False
+        self.last_seen = monotonic()
+        self.dropped = 0
+
+        # created by the server on the first reliable UDP request
+        self.channel: Optional[Any] = None
+
+    def deliver(self, datagram: bytes) -> bool:
+        """
+        Queue a datagram received from the client, return True if the session
+        was idle and a pool thread must now serve it
+        """
+        with self.condition:
+            self.last_seen = monotonic()
+
+            if len(self.inbox) >= MAX_QUEUED_DATAGRAMS:
+                self.dropped += 1
+                return False
+
+            self.inbox.append(datagram)
+            self.condition.notify()
+
+            if self.busy:
+                return False
+
+            self.busy = True
+            return True
+
+    def next_datagram(self) -> Optional[bytes]:
+        """
+        Next datagram to handle, None once the inbox is empty, which also
+        hands the session back to the receive loop
+        """
+        with self.condition:
+            if not self.inbox:
+                self.busy = False
+                return None
+
+            return self.inbox.popleft()
+
+    def recv(self, timeout: float) -> Optional[bytes]:
+        """
+        recv_fn of the reliable UDP channel: wait up to timeout seconds for
+        the next datagram of the client
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.inbox, max(timeout, 0)):
+                return None
+
+            return self.inbox.popleft()
+
+
+class SessionTable:
+    """
+    Sessions of the UDP clients, keyed by address
+
+    Sessions silent for longer than idle_timeout are evicted, and at most
+    max_sessions are kept: the least recently active idle one makes room for
+    a new client. When every session is busy, datagrams of new clients are
+    dropped until one frees up
+    """
+
+    def __init__(self, max_sessions: int, idle_timeout: float) -> None:
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.lock = Lock()
+
+        # least recently active first
+        self.sessions: OrderedDict[Address, UDPSession] = OrderedDict()
+
+    def session_for(self, address: Address) -> Optional[UDPSession]:
+        """
+        Session of address, created if needed. None if the table is full of
+        busy sessions
+        """
+        with self.lock:
+            self.evict_idle()
+
+            session = self.sessions.get(address)
+
+            if session is not None:
+                self.sessions.move_to_end(address)
+                return session
+
+            if len(self.sessions) >= self.max_sessions and not self.evict_oldest():
+                return None
+
+            session = self.sessions[address] = UDPSession(address)
+
+            return session
+
+    def evict_idle(self) -> None:
+        deadline = monotonic() - self.idle_timeout
+
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+
+            if session.busy or session.last_seen > deadline:
+                break
+
+            del self.sessions[session.address]
+
+    def evict_oldest(self) -> bool:
+        for address, session in self.sessions.items():
+            if not session.busy:
+                del self.sessions[address]
+                return True
+
+        return False
+
+    def __len__(self) -> int:
+        return len(self.sessions)
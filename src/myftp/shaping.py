@@ -0,0 +1,274 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Bandwidth shaping of the responses of the server. Token buckets
+# cap the rate of each client and of the whole server, and connections waiting
+# for server bandwidth take turns by deficit round robin, so one bulk download
+# can not starve the others. Small responses are never held back.
+
+
+from collections import OrderedDict
+from threading import Condition, Lock
+from time import monotonic, sleep
+from typing import BinaryIO, Dict, Optional, Tuple, Union
+
+try:
+    from myftp.transport import CHUNK_SIZE, send_file, send_message
+except ImportError:
+    from transport import CHUNK_SIZE, send_file, send_message
+
+# responses up to this many bytes (header and body) are interactive: they are
+# sent right away, and the bulk transfers pay for the bandwidth they used
+DEFAULT_INTERACTIVE_BYTES: int = 64 * 1024
+
+# bytes a connection may send per turn of the round robin, bulk bodies are
+# sent in chunks of at most this size
+QUANTUM: int = CHUNK_SIZE
+
+# a bucket left idle fills up to this many seconds worth of its rate
+BURST_SECONDS: float = 0.1
+
+# content sent after a response header: bytes or an open file
+Body = Union[BinaryIO, bytes]
+
+
+class TokenBucket:
+    """
+    Tokens are bytes, added at rate per second up to burst
+
+    Taking more tokens than the bucket holds leaves it in debt: the next bulk
+    send waits until the debt is repaid, so the long run rate never exceeds
+    rate while a send never has to be cut to fit
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.burst = max(rate * BURST_SECONDS, QUANTUM)
+        self.tokens = self.burst
+        self.updated = monotonic()
+        self.lock = Lock()
+
+    def refill(self) -> None:
+        """
+        Called with the lock held
+        """
+        now = monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """
+        Seconds until the bucket is out of debt
+        """
+        with self.lock:
+            self.refill()
+
+            return max(0.0, -self.tokens / self.rate)
+
+    def take(self, amount: int) -> None:
+        with self.lock:
+            self.refill()
+            self.tokens -= amount
+
+
+class Flow:
+    """
+    Responses of one connection, paced by the bucket of its client and by
+    the server wide bandwidth it is scheduled for
+    """
+
+    def __init__(
+        self, shaper: "BandwidthShaper", host: str, bucket: Optional[TokenBucket]
+    ) -> None:
+        self.shaper = shaper
+        self.host = host
+        self.bucket = bucket
+
+        # bytes this connection may still send in its current turn
+        self.deficit = 0
+
+    def consume(self, amount: int, message_length: int) -> None:
+        """
+        Wait until amount bytes of a message of message_length bytes may be
+        sent, interactive messages never wait
+        """
+        if message_length <= self.shaper.interactive_bytes:
+            if self.bucket is not None:
+                self.bucket.take(amount)
+
+            if self.shaper.bucket is not None:
+                self.shaper.bucket.take(amount)
+
+            return
+
+        start = monotonic()
+
+        if self.bucket is not None:
+            while (delay := self.bucket.delay()) > 0:
+                sleep(delay)
+
+            self.bucket.take(amount)
+
+        if self.shaper.bucket is not None:
+            self.shaper.schedule(self, amount)
+
+        self.shaper.waited(monotonic() - start)
+
+    def done(self) -> None:
+        """
+        End of a bulk message, credit left is not carried to the next one
+        """
+        self.deficit = 0
+
+    def close(self) -> None:
+        self.shaper.close_flow(self)
+
+
+class BandwidthShaper:
+    """
+    Rate limits of the responses sent over TCP: max_rate bytes per second for
+    the whole server, client_rate bytes per second per client host (shared by
+    all of its connections), 0 for no limit
+
+    Connections waiting for server bandwidth queue up, and the one at the
+    head is credited QUANTUM bytes and served once the server bucket is out
+    of debt (deficit round robin). A connection sending smaller pieces
+    (multiplexed frames) spends the rest of its credit without queueing
+    again, so every bulk connection gets the same share of bytes whatever
+    its chunk size
+    """
+
+    def __init__(
+        self,
+        max_rate: float = 0,
+        client_rate: float = 0,
+        interactive_bytes: int = DEFAULT_INTERACTIVE_BYTES,
+    ) -> None:
+        self.bucket: Optional[TokenBucket] = (
+            TokenBucket(max_rate) if max_rate > 0 else None
+        )
+        self.client_rate = client_rate
+        self.interactive_bytes = interactive_bytes
+
+        self.condition = Condition()
+
+        # connections waiting for server bandwidth, in round robin order
+        self.waiting: OrderedDict[Flow, None] = OrderedDict()
+
+        # host -> its bucket and how many connections share it
+        self.client_buckets: Dict[str, Tuple[TokenBucket, int]] = {}
+        self.flows = 0
+
+        # seconds bulk sends spent waiting, for the metrics
+        self.wait_seconds = 0.0
+
+    def open_flow(self, client_address: Tuple[str, int]) -> Flow:
+        host = client_address[0]
+        bucket: Optional[TokenBucket] = None
+
+        with self.condition:
+            self.flows += 1
+
+            if self.client_rate > 0:
+                bucket, connections = self.client_buckets.get(
+                    host, (TokenBucket(self.client_rate), 0)
+                )
+                self.client_buckets[host] = (bucket, connections + 1)
+
+        return Flow(self, host, bucket)
+
+    def close_flow(self, flow: Flow) -> None:
+        with self.condition:
+            self.flows -= 1
+
+            entry = self.client_buckets.get(flow.host)
+
+            if entry is not None:
+                if entry[1] > 1:
+                    self.client_buckets[flow.host] = (entry[0], entry[1] - 1)
+                else:
+                    del self.client_buckets[flow.host]
+
+    def schedule(self, flow: Flow, amount: int) -> None:
+        """
+        Wait for the turn of flow to send amount bytes within max_rate
+        """
+        assert self.bucket is not None
+
+        with self.condition:
+            # credit left from its last turn
+            if flow.deficit >= amount:
+                flow.deficit -= amount
+                self.bucket.take(amount)
+                return
+
+            self.waiting[flow] = None
+
+            try:
+                while True:
+                    if next(iter(self.waiting)) is flow:
+                        delay = self.bucket.delay()
+
+                        if delay <= 0:
+                            break
+
+                        self.condition.wait(delay)
+                    else:
+                        self.condition.wait()
+
+            finally:
+                del self.waiting[flow]
+                self.condition.notify_all()
+
+            while flow.deficit < amount:
+                flow.deficit += QUANTUM
+
+            flow.deficit -= amount
+            self.bucket.take(amount)
+
+    def waited(self, seconds: float) -> None:
+        with self.condition:
+            self.wait_seconds += seconds
+
+
+def send_shaped(
+    sock,
+    flow: Flow,
+    header: bytes,
+    body: Optional[Body] = None,
+    body_length: int = 0,
+) -> None:
+    """
+    Send header followed by body_length bytes of body, paced by flow. The
+    body goes out in chunks of at most QUANTUM bytes, the first one in the
+    same send as the header (see send_message), the others from files
+    through send_file. A file body is closed once sent
+    """
+    message_length = len(header) + body_length
+
+    try:
+        length = min(QUANTUM, body_length) if body is not None else 0
+        flow.consume(len(header) + length, message_length)
+        send_message(sock, header, body, length)
+
+        if body is None:
+            return
+
+        view = memoryview(body) if isinstance(body, bytes) else None
+        sent = length
+
+        while sent < body_length:
+            length = min(QUANTUM, body_length - sent)
+            flow.consume(length, message_length)
+
+            if view is not None:
+                sock.sendall(view[sent : sent + length])
+            else:
+                send_file(sock, body, length)  # type: ignore
+
+            sent += length
+
+    finally:
+        flow.done()
+
+        if body is not None and not isinstance(body, bytes):
+            body.close()
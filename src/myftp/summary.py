@@ -0,0 +1,471 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Statistics of numeric files for the summary request. Files are
+# parsed in a single streaming pass in constant memory. When NumPy is installed
+# the file is memory-mapped and parsed with vectorized operations instead.
+# Statistics of several files (a list or glob of shards) are computed one file
+# at a time and merged: count, sum, extremes, variance, and percentiles from a
+# mergeable sketch.
+
+
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, Tuple
+import math
+import mmap
+import os
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from myftp.protocol import EXTENDED_OPCODE
+except ImportError:
+    from protocol import EXTENDED_OPCODE
+
+# extended opcodes
+SUMMARY_STATS_EXTENDED_OPCODE: int = 0b01110
+
+SUMMARY_STATS_FIRST_BYTE: int = (EXTENDED_OPCODE << 5) + SUMMARY_STATS_EXTENDED_OPCODE
+
+# summary stats request: first byte + files length (varint) + files, the same
+# list of names and globs a summary request takes
+# summary stats response: first byte + header below, the binary counterpart of
+# summary.txt
+# files summarized, count, then as doubles min, max, average, variance and the
+# percentiles of SUMMARY_PERCENTILES
+SUMMARY_STATS_RESPONSE = struct.Struct("!IQ7d")
+
+# the files of a summary are a list of names or globs separated by commas
+FILES_SEPARATOR: str = ","
+
+# files one summary may cover
+MAX_SUMMARY_FILES: int = 10000
+
+# percentiles of summary.txt and of the summary stats response
+SUMMARY_PERCENTILES: Tuple[float, ...] = (0.5, 0.9, 0.99)
+
+# percentiles are estimated within this relative error of the true value
+SKETCH_ACCURACY: float = 0.01
+SKETCH_GAMMA: float = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+LOG_SKETCH_GAMMA: float = math.log(SKETCH_GAMMA)
+
+# bytes parsed at once, the line cut at the end of a chunk is carried over
+CHUNK_SIZE: int = 1024 * 1024
+
+# longest run of digits the vectorized parser handles, so that per chunk sums
+# stay far away from the int64 limit. Chunks with longer numbers are parsed by
+# the pure Python parser
+MAX_VECTORIZED_DIGITS: int = 12
+
+POWERS_OF_TEN = (
+    10 ** np.arange(MAX_VECTORIZED_DIGITS + 1, dtype=np.int64)
+    if np is not None
+    else None
+)
+
+
+class QuantileSketch:
+    """
+    Histogram of positive numbers over logarithmic buckets, bucket k holding
+    the numbers between gamma^(k-1) and gamma^k
+
+    Any percentile is estimated within SKETCH_ACCURACY of its true value, in
+    a number of buckets that only grows with the logarithm of the range of
+    the numbers. Sketches of different files merge by adding their buckets
+    """
+
+    def __init__(self) -> None:
+        self.zeros = 0
+        self.buckets: Dict[int, int] = {}
+
+    def add(self, value: int) -> None:
+        if value <= 0:
+            self.zeros += 1
+        else:
+            key = math.ceil(math.log(value) / LOG_SKETCH_GAMMA)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def add_buckets(self, zeros: int, keys, counts) -> None:
+        self.zeros += zeros
+
+        for key, count in zip(keys, counts):
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: "QuantileSketch") -> None:
+        self.add_buckets(other.zeros, other.buckets.keys(), other.buckets.values())
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate of the q quantile, 0 <= q <= 1, of the numbers added
+        """
+        rank = q * (self.zeros + sum(self.buckets.values()) - 1)
+
+        if rank < self.zeros:
+            return 0.0
+
+        seen = self.zeros
+
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+
+            if seen > rank:
+                break
+
+        # middle of the bucket, in relative terms
+        return 2 * SKETCH_GAMMA**key / (SKETCH_GAMMA + 1)
+
+
+class SummaryStats:
+    """
+    Count, sum, min, max, variance and percentiles of the numbers found in
+    one or more files
+
+    The variance is kept as the sum of squared deviations from the average,
+    which merges exactly between partial results (Chan et al.), unlike a sum
+    of squares that would also lose precision on large numbers
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.smallest: Optional[int] = None
+        self.largest: Optional[int] = None
+        self.squared_deviations = 0.0
+        self.sketch = QuantileSketch()
+
+    def add_chunk(
+        self,
+        count: int,
+        total: int,
+        smallest: int,
+        largest: int,
+        squared_deviations: float,
+    ) -> None:
+        """
+        Merge the statistics of a chunk of numbers, but for their sketch
+        """
+        if count == 0:
+            return
+
+        if self.count:
+            delta = total / count - self.total / self.count
+            squared_deviations += (
+                delta * delta * self.count * count / (self.count + count)
+            )
+
+        self.count += count
+        self.total += total
+        self.squared_deviations += squared_deviations
+        self.smallest = (
+            smallest if self.smallest is None else min(self.smallest, smallest)
+        )
+        self.largest = largest if self.largest is None else max(self.largest, largest)
+
+    def merge(self, other: "SummaryStats") -> None:
+        if other.count == 0:
+            return
+
+        self.add_chunk(
+            other.count,
+            other.total,
+            other.smallest,  # type: ignore
+            other.largest,  # type: ignore
+            other.squared_deviations,
+        )
+        self.sketch.merge(other.sketch)
+
+    @property
+    def average(self) -> float:
+        return self.total / self.count if self.count else 0
+
+    @property
+    def variance(self) -> float:
+        """
+        Population variance
+        """
+        return self.squared_deviations / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimate of the q quantile, clamped to the numbers actually seen
+        """
+        if self.smallest is None or self.largest is None:
+            return 0.0
+
+        return min(max(self.sketch.quantile(q), self.smallest), self.largest)
+
+
+def summarize_file(path: str) -> SummaryStats:
+    """
+    Compute the statistics of every line of path holding a non negative integer,
+    other lines are ignored
+
+    Raise ValueError if the file has no such line
+    """
+    stats = summarize_path(path)
+
+    if stats.count == 0:
+        raise ValueError(f"{path} does not contain any number")
+
+    return stats
+
+
+def summarize_path(path: str) -> SummaryStats:
+    """
+    Statistics of the numbers of path, empty if it holds none
+
+    Runs in the worker processes of the server, so it only takes and
+    returns picklable values
+    """
+    if np is not None:
+        return summarize_with_numpy(path)
+
+    return summarize_with_python(path)
+
+
+def merge_summaries(partials: List[SummaryStats]) -> SummaryStats:
+    """
+    Statistics of all the numbers behind partials, which are left untouched
+    """
+    stats = SummaryStats()
+
+    for partial in partials:
+        stats.merge(partial)
+
+    return stats
+
+
+def is_pattern(name: str) -> bool:
+    return any(character in name for character in "*?[")
+
+
+def pattern_prefix(pattern: str) -> str:
+    """
+    Literal part of pattern before its first wildcard
+    """
+    for index, character in enumerate(pattern):
+        if character in "*?[":
+            return pattern[:index]
+
+    return pattern
+
+
+def match_pattern(names: List[str], pattern: str) -> List[str]:
+    """
+    Names matching the shell pattern, names being sorted
+    """
+    return [name for name in names if fnmatchcase(name, pattern)]
+
+
+def format_summary(stats: SummaryStats, files: int = 1) -> bytes:
+    """
+    Content of the summary.txt file sent back to the client
+    """
+    percentiles = "".join(
+        f"p{round(q * 100)}: {stats.percentile(q)}\n" for q in SUMMARY_PERCENTILES
+    )
+
+    return (
+        f"min: {stats.smallest}\nmax: {stats.largest}\navg: {stats.average}\n"
+        f"count: {stats.count}\nvariance: {stats.variance}\nstddev: {stats.stddev}\n"
+        f"{percentiles}files: {files}\n"
+    ).encode("ascii")
+
+
+def encode_summary_stats(stats: SummaryStats, files: int) -> bytes:
+    return bytes([SUMMARY_STATS_FIRST_BYTE]) + SUMMARY_STATS_RESPONSE.pack(
+        files,
+        stats.count,
+        stats.smallest,
+        stats.largest,
+        stats.average,
+        stats.variance,
+        *(stats.percentile(q) for q in SUMMARY_PERCENTILES),
+    )
+
+
+def read_summary_stats(reader) -> Dict[str, float]:
+    """
+    Parse a summary stats response whose first byte was already read
+    """
+    files, count, smallest, largest, average, variance, *percentiles = (
+        SUMMARY_STATS_RESPONSE.unpack(reader.read_exact(SUMMARY_STATS_RESPONSE.size))
+    )
+
+    return {
+        "files": files,
+        "count": count,
+        "min": smallest,
+        "max": largest,
+        "avg": average,
+        "variance": variance,
+        "stddev": math.sqrt(variance),
+        **{
+            f"p{round(q * 100)}": value
+            for q, value in zip(SUMMARY_PERCENTILES, percentiles)
+        },
+    }
+
+
+def summarize_with_python(path: str) -> SummaryStats:
+    stats = SummaryStats()
+    carry = b""
+
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            lines = (carry + chunk).split(b"\n")
+            carry = lines.pop()
+
+            summarize_lines(stats, lines)
+
+    summarize_lines(stats, [carry])
+
+    return stats
+
+
+def summarize_lines(stats: SummaryStats, lines: list) -> None:
+    numbers = [int(line) for line in map(bytes.strip, lines) if line.isdigit()]
+
+    if numbers:
+        total = sum(numbers)
+        average = total / len(numbers)
+
+        stats.add_chunk(
+            len(numbers),
+            total,
+            min(numbers),
+            max(numbers),
+            math.fsum((number - average) ** 2 for number in numbers),
+        )
+
+        for number in numbers:
+            stats.sketch.add(number)
+
+
+def summarize_with_numpy(path: str) -> SummaryStats:
+    """
+    Memory-map the file and parse it one newline aligned window at a time
+    """
+    stats = SummaryStats()
+
+    with open(path, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+
+        # empty files can not be mapped
+        if size == 0:
+            return stats
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+
+            while start < size:
+                end = min(start + CHUNK_SIZE, size)
+
+                if end < size:
+                    newline = mapped.rfind(b"\n", start, end)
+
+                    # a single line longer than the window, grow the window
+                    if newline == -1:
+                        newline = mapped.find(b"\n", end)
+
+                    end = newline + 1 if newline != -1 else size
+
+                window = np.frombuffer(
+                    mapped, dtype=np.uint8, count=end - start, offset=start
+                )
+
+                vectorized = summarize_window(stats, window)
+
+                # drop the view right away, an exported buffer would prevent
+                # the map from being closed
+                del window
+
+                if not vectorized:
+                    summarize_lines(stats, mapped[start:end].split(b"\n"))
+
+                start = end
+
+    return stats
+
+
+def summarize_window(stats: SummaryStats, window) -> bool:
+    """
+    Vectorized version of summarize_lines over a window of whole lines
+
+    Return False, without touching stats, if the window holds numbers too long
+    to be parsed safely with int64 arithmetic
+    """
+    newlines = window == ord("\n")
+    digits = (window >= ord("0")) & (window <= ord("9"))
+    # whitespace bytes.strip removes (space, \t, \n, \r, \x0b, \x0c)
+    spaces = (window == ord(" ")) | ((window >= ord("\t")) & (window <= ord("\r")))
+
+    # line index of every byte, the newline belongs to the line it ends
+    line_ids = np.cumsum(newlines, dtype=np.int32)
+    line_ids -= newlines
+    line_count = int(line_ids[-1]) + 1
+
+    # a line is a number when it only holds digits and whitespace, with all
+    # of its digits in one run
+    valid_lines = np.ones(line_count, dtype=bool)
+    valid_lines[line_ids[np.flatnonzero(~(digits | spaces))]] = False
+
+    run_starts = digits.copy()
+    run_starts[1:] &= ~digits[:-1]
+    runs = np.bincount(line_ids[np.flatnonzero(run_starts)], minlength=line_count)
+    valid_lines &= runs == 1
+
+    if not valid_lines.any():
+        return True
+
+    digit_positions = np.flatnonzero(digits)
+    digit_lines = line_ids[digit_positions]
+    digits_per_line = np.bincount(digit_lines, minlength=line_count)
+
+    if digits_per_line[valid_lines].max() > MAX_VECTORIZED_DIGITS:
+        return False
+
+    # power of ten of every digit: number of digits after it on its line.
+    # Lines that are not numbers may hold more digits, their exponents are
+    # clipped since their values are thrown away anyway
+    digits_before_line_end = np.cumsum(digits_per_line)[digit_lines]
+    exponents = digits_before_line_end - np.arange(1, len(digit_positions) + 1)
+    np.minimum(exponents, MAX_VECTORIZED_DIGITS, out=exponents)
+
+    digit_values = (window[digit_positions] - ord("0")).astype(np.int64)
+    digit_values *= POWERS_OF_TEN[exponents]
+
+    # digits of a line are contiguous in digit_positions, add them per line
+    group_starts = np.flatnonzero(np.diff(digit_lines, prepend=-1))
+    group_lines = digit_lines[group_starts]
+    line_values = np.add.reduceat(digit_values, group_starts)
+
+    numbers = line_values[valid_lines[group_lines]]
+    total = int(numbers.sum())
+    deviations = numbers - total / len(numbers)
+
+    stats.add_chunk(
+        len(numbers),
+        total,
+        int(numbers.min()),
+        int(numbers.max()),
+        float(np.dot(deviations, deviations)),
+    )
+
+    positive = numbers[numbers > 0]
+    keys, counts = np.unique(
+        np.ceil(np.log(positive) / LOG_SKETCH_GAMMA).astype(np.int64),
+        return_counts=True,
+    )
+    stats.sketch.add_buckets(
+        len(numbers) - len(positive), keys.tolist(), counts.tolist()
+    )
+
+    return True
@@ -0,0 +1,341 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Framing helpers shared by the FTP client and server. Payloads are
+# read exactly up to their announced length and file bodies are streamed to and
+# from disk in bounded chunks.
+
+
+from socket import socket
+from typing import BinaryIO, Optional, Union
+import errno
+import os
+import selectors
+
+# file bodies are moved in chunks of this size, so memory usage stays flat no
+# matter how large the transferred file is
+CHUNK_SIZE: int = 64 * 1024
+
+# bytes of a body sent in the same call as its header
+COALESCE_SIZE: int = CHUNK_SIZE
+
+# largest amount of bytes handed to a single os.sendfile call
+SENDFILE_BLOCK_SIZE: int = 1 << 30
+
+# os.sendfile errors meaning it can not be used for this file/socket pair
+SENDFILE_UNSUPPORTED_ERRNOS = {
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.ENOTSOCK,
+    errno.EOPNOTSUPP,
+    errno.ENOTSUP,
+}
+
+# largest payload that fits into a single UDP datagram
+MAX_DATAGRAM_SIZE: int = 65507
+
+# reliable UDP messages are kept in memory up to this size, then spooled to disk
+SPOOL_MAX_SIZE: int = 1024 * 1024
+
+
+class SocketReader:
+    """
+    Read a framed payload from a connected TCP socket
+
+    Every read blocks until exactly the requested amount of bytes has arrived,
+    so one recv call returning a partial payload is never mistaken for the
+    whole payload
+    """
+
+    def __init__(self, sock: socket) -> None:
+        self.sock = sock
+        self.buffer = bytearray(CHUNK_SIZE)
+
+    def read_exact(self, length: int) -> bytes:
+        data = bytearray(length)
+        view = memoryview(data)
+        received = 0
+
+        while received < length:
+            n = self.sock.recv_into(view[received:], length - received)
+
+            if n == 0:
+                raise EOFError(
+                    f"Connection closed after {received} of {length} bytes were received"
+                )
+
+            received += n
+
+        return bytes(data)
+
+    def copy_to(self, file: BinaryIO, length: int) -> None:
+        """
+        Stream exactly length bytes from the socket into file
+
+        The whole body is always consumed, even if writing to file fails
+        half-way, so the next payload on the connection stays aligned
+        """
+        view = memoryview(self.buffer)
+        remaining = length
+        write_error = None
+
+        while remaining > 0:
+            n = self.sock.recv_into(view, min(CHUNK_SIZE, remaining))
+
+            if n == 0:
+                raise EOFError(
+                    f"Connection closed after {length - remaining} of {length} bytes were received"
+                )
+
+            remaining -= n
+
+            if write_error is None:
+                try:
+                    file.write(view[:n])
+                except OSError as error:
+                    write_error = error
+
+        if write_error is not None:
+            raise write_error
+
+    def skip(self, length: int) -> None:
+        """
+        Consume and drop length bytes from the socket
+        """
+        view = memoryview(self.buffer)
+        remaining = length
+
+        while remaining > 0:
+            n = self.sock.recv_into(view, min(CHUNK_SIZE, remaining))
+
+            if n == 0:
+                raise EOFError(
+                    f"Connection closed after {length - remaining} of {length} bytes were received"
+                )
+
+            remaining -= n
+
+
+class BufferReader:
+    """
+    Same interface as SocketReader, but over a payload already in memory
+    (a UDP datagram)
+    """
+
+    def __init__(self, data: bytes) -> None:
+        self.view = memoryview(data)
+        self.position = 0
+
+    def read_exact(self, length: int) -> bytes:
+        if self.position + length > len(self.view):
+            raise EOFError(
+                f"Payload truncated: {length} bytes expected, {len(self.view) - self.position} left"
+            )
+
+        data = bytes(self.view[self.position : self.position + length])
+        self.position += length
+
+        return data
+
+    def copy_to(self, file: BinaryIO, length: int) -> None:
+        if self.position + length > len(self.view):
+            raise EOFError(
+                f"Payload truncated: {length} bytes expected, {len(self.view) - self.position} left"
+            )
+
+        file.write(self.view[self.position : self.position + length])
+        self.position += length
+
+    def skip(self, length: int) -> None:
+        self.position = min(self.position + length, len(self.view))
+
+
+class FileReader:
+    """
+    Same interface as SocketReader, but over a file holding the payload (a
+    reliable UDP message spooled while it was received)
+    """
+
+    def __init__(self, file: BinaryIO) -> None:
+        self.file = file
+
+    def read_exact(self, length: int) -> bytes:
+        data = self.file.read(length)
+
+        if len(data) < length:
+            raise EOFError(
+                f"Payload truncated: {length} bytes expected, {len(data)} left"
+            )
+
+        return data
+
+    def copy_to(self, file: BinaryIO, length: int) -> None:
+        remaining = length
+
+        while remaining > 0:
+            chunk = self.file.read(min(CHUNK_SIZE, remaining))
+
+            if not chunk:
+                raise EOFError(
+                    f"Payload truncated: {length} bytes expected, {length - remaining} left"
+                )
+
+            file.write(chunk)
+            remaining -= len(chunk)
+
+    def skip(self, length: int) -> None:
+        self.file.seek(length, os.SEEK_CUR)
+
+
+class CountingReader:
+    """
+    Wrap another reader and count the bytes consumed through it
+    """
+
+    def __init__(self, reader) -> None:
+        self.reader = reader
+        self.count = 0
+
+    def read_exact(self, length: int) -> bytes:
+        data = self.reader.read_exact(length)
+        self.count += length
+
+        return data
+
+    def copy_to(self, file: BinaryIO, length: int) -> None:
+        # the bytes are consumed even when writing them to file fails
+        try:
+            self.reader.copy_to(file, length)
+        finally:
+            self.count += length
+
+    def skip(self, length: int) -> None:
+        self.reader.skip(length)
+        self.count += length
+
+
+def send_message(
+    sock: socket,
+    header: bytes,
+    body: Optional[Union[BinaryIO, bytes]] = None,
+    body_length: int = 0,
+) -> None:
+    """
+    Send header followed by body_length bytes of body, bytes or a file read
+    from its current position
+
+    The header leaves in one sendall with the first COALESCE_SIZE bytes of
+    the body, so with TCP_NODELAY a small message is still one segment:
+    peers reading a whole response with a single recv (the original client)
+    never get a header without its body. The rest of a file body goes
+    through send_file
+    """
+    if body is None or not body_length:
+        sock.sendall(header)
+        return
+
+    if isinstance(body, bytes):
+        view = memoryview(body)
+        sock.sendall(header + view[: min(body_length, COALESCE_SIZE)])
+
+        if body_length > COALESCE_SIZE:
+            sock.sendall(view[COALESCE_SIZE:body_length])
+
+        return
+
+    head = body.read(min(body_length, COALESCE_SIZE))
+
+    if not head:
+        raise EOFError(f"File ended after 0 of {body_length} bytes were sent")
+
+    sock.sendall(header + head)
+
+    if body_length > len(head):
+        send_file(sock, body, body_length - len(head))
+
+
+def send_file(sock: socket, file: BinaryIO, length: int) -> None:
+    """
+    Stream length bytes of file, from its current position, over a connected socket
+
+    The file descriptor is handed to os.sendfile so the content is copied by
+    the kernel and never enters Python. Where sendfile is not usable (missing
+    on the platform, file object without a descriptor, unsupported file or
+    socket type) the rest is sent with a bounded read/sendall loop instead
+    """
+    offset = file.tell()
+    sent = 0
+
+    if hasattr(os, "sendfile") and length > 0:
+        try:
+            fileno = file.fileno()
+        except (AttributeError, OSError):
+            fileno = -1
+
+        if fileno >= 0:
+            sent = _sendfile(sock, fileno, offset, length)
+            file.seek(offset + sent)
+
+    _send_chunks(sock, file, length - sent)
+
+
+def _sendfile(sock: socket, fileno: int, offset: int, length: int) -> int:
+    """
+    Send with os.sendfile, honouring the socket timeout
+
+    Return the number of bytes sent, which is less than length only when
+    sendfile turned out to be unusable before anything was sent
+    """
+    timeout = sock.gettimeout()
+    sent = 0
+
+    with selectors.DefaultSelector() as selector:
+        selector.register(sock, selectors.EVENT_WRITE)
+
+        while sent < length:
+            try:
+                n = os.sendfile(
+                    sock.fileno(),
+                    fileno,
+                    offset + sent,
+                    min(length - sent, SENDFILE_BLOCK_SIZE),
+                )
+
+            # sockets with a timeout are non-blocking under the hood
+            except BlockingIOError:
+                if not selector.select(timeout):
+                    raise TimeoutError("timed out while sending the file")
+                continue
+
+            except OSError as error:
+                if sent == 0 and error.errno in SENDFILE_UNSUPPORTED_ERRNOS:
+                    return 0
+                raise
+
+            if n == 0:
+                raise EOFError(
+                    f"File ended after {sent} of {length} bytes were sent"
+                )
+
+            sent += n
+
+    return sent
+
+
+def _send_chunks(sock: socket, file: BinaryIO, length: int) -> None:
+    """
+    Fallback for send_file: read and send the file in bounded chunks
+    """
+    buffer = bytearray(CHUNK_SIZE)
+    view = memoryview(buffer)
+    remaining = length
+
+    while remaining > 0:
+        n = file.readinto(view[: min(CHUNK_SIZE, remaining)])  # type: ignore
+
+        if not n:
+            raise EOFError(
+                f"File ended after {length - remaining} of {length} bytes were sent"
+            )
+
+        sock.sendall(view[:n])
+        remaining -= n
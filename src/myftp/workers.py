@@ -0,0 +1,150 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Pre-fork mode of the FTP server. A supervisor process forks
+# worker processes all serving the same port, so requests are spread over
+# several cores instead of sharing one interpreter, and restarts the workers
+# that die.
+
+
+from multiprocessing import get_context
+from multiprocessing.connection import wait
+from socket import socket
+from time import monotonic, sleep
+from typing import Any, Dict, Optional
+import signal
+import socket as socket_module
+
+try:
+    from myftp.log import get_logger
+except ImportError:
+    from log import get_logger
+
+# a worker dying sooner than this after being started is restarted only once
+# this delay expired, so a worker crashing on startup does not spin
+MIN_WORKER_UPTIME: float = 1.0
+
+# time given to workers to exit on shutdown before they are killed
+SHUTDOWN_TIMEOUT: float = 5.0
+
+# files written through other workers show up in the listings of a worker
+# after at most this many seconds
+INDEX_MAX_AGE: float = 5.0
+
+
+def can_reuse_port() -> bool:
+    return hasattr(socket_module, "SO_REUSEPORT")
+
+
+def interrupt(signum, frame) -> None:
+    """
+    Signal handler stopping on SIGTERM as on Ctrl+C
+    """
+    raise KeyboardInterrupt
+
+
+def run_worker(server, server_socket: Optional[socket], slot: int) -> None:
+    """
+    Body of a worker process: serve on the inherited socket, or on a socket
+    of its own sharing the port with the other workers
+    """
+    # the supervisor decides when workers stop, by terminating them
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, interrupt)
+
+    # each worker has metrics of its own, scraped on a port of its own
+    if server.metrics_port:
+        server.metrics_port += slot
+
+    # the directory index of a worker only sees the writes of this worker
+    server.directory_index.max_age = INDEX_MAX_AGE
+
+    server.run(server_socket, reuse_port=server_socket is None)
+
+
+def supervise(server, workers: int) -> None:
+    """
+    Run server in workers forked processes until interrupted, restarting the
+    ones that exit
+
+    Where SO_REUSEPORT is available every worker binds the port itself and
+    the kernel balances clients (and UDP peers, always to the same worker)
+    between them. Elsewhere the supervisor binds the port and the workers
+    share its socket
+    """
+    context = get_context("fork")
+    log = get_logger("myftp.workers", server.protocol)
+
+    shared_socket = None if can_reuse_port() else server.open_socket()
+
+    # worker slot -> process, and when it was started
+    processes: Dict[int, Any] = {}
+    started: Dict[int, float] = {}
+
+    def start(slot: int) -> None:
+        process = context.Process(
+            target=run_worker,
+            args=(server, shared_socket, slot),
+            name=f"myftp-worker-{slot}",
+        )
+        process.start()
+
+        processes[slot] = process
+        started[slot] = monotonic()
+
+        log.debug("Worker %s started with pid %s", slot, process.pid)
+
+    signal.signal(signal.SIGTERM, interrupt)
+
+    sharing = (
+        f"each binding port {server.server_port} with SO_REUSEPORT"
+        if shared_socket is None
+        else "sharing one socket"
+    )
+
+    log.info("Starting %s workers %s", workers, sharing)
+
+    try:
+        for slot in range(workers):
+            start(slot)
+
+        while True:
+            sentinels = {process.sentinel: slot for slot, process in processes.items()}
+
+            for sentinel in wait(list(sentinels)):
+                slot = sentinels[sentinel]  # type: ignore
+                process = processes[slot]
+                process.join()
+
+                log.warning(
+                    "Worker %s (pid %s) exited with code %s, restarting it",
+                    slot,
+                    process.pid,
+                    process.exitcode,
+                )
+
+                uptime = monotonic() - started[slot]
+
+                if uptime < MIN_WORKER_UPTIME:
+                    sleep(MIN_WORKER_UPTIME - uptime)
+
+                start(slot)
+
+    except KeyboardInterrupt:
+        log.info("Server shutting down")
+
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+
+        deadline = monotonic() + SHUTDOWN_TIMEOUT
+
+        for process in processes.values():
+            process.join(max(0.0, deadline - monotonic()))
+
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+        if shared_socket is not None:
+            shared_socket.close()
@@ -0,0 +1,62 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Shared fixtures of the tests: a TCP server serving a temporary
+# directory on a free port, and clients connected to it.
+
+
+from threading import Thread
+from typing import Callable, Iterator, List
+
+import pytest
+
+from myftp.client import Client
+from myftp.server import Server
+
+
+@pytest.fixture
+def tcp_server(tmp_path) -> Callable[..., int]:
+    """
+    Start a TCP server on a free port of 127.0.0.1, serving the server
+    directory of tmp_path, and return its port. Keyword arguments go to
+    Server
+    """
+
+    def start(**kwargs) -> int:
+        server_directory = tmp_path / "server"
+        server_directory.mkdir(exist_ok=True)
+
+        server = Server("127.0.0.1", 0, str(server_directory), False, "TCP", **kwargs)
+        server_socket = server.open_socket()
+
+        Thread(target=server.run, args=(server_socket,), daemon=True).start()
+
+        return server_socket.getsockname()[1]
+
+    return start
+
+
+@pytest.fixture
+def tcp_client(tmp_path) -> Iterator[Callable[..., Client]]:
+    """
+    Connect a client, with the client directory of tmp_path, to the server
+    on the given port. Keyword arguments go to Client
+    """
+    clients: List[Client] = []
+
+    def connect(port: int, **kwargs) -> Client:
+        client_directory = tmp_path / "client"
+        client_directory.mkdir(exist_ok=True)
+
+        client = Client(
+            "127.0.0.1", port, str(client_directory), False, "TCP", **kwargs
+        )
+        assert client.connect()
+        client.negotiate_features(client.multiplex)
+        clients.append(client)
+
+        return client
+
+    yield connect
+
+    for client in clients:
+        client.client_socket.close()
@@ -0,0 +1,131 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Delta puts: the instructions computed against the signatures of
+# the server copy must rebuild the new file exactly, reusing the blocks that
+# did not change.
+
+
+from io import BytesIO
+from random import Random
+
+import pytest
+
+from myftp.delta import (
+    apply_delta,
+    choose_block_size,
+    compute_delta,
+    compute_signatures,
+    parse_signatures,
+)
+from myftp.transport import BufferReader
+
+
+def edit(content: bytes) -> bytes:
+    """
+    content with bytes inserted, replaced and removed in the middle, and
+    appended at the end
+    """
+    middle = len(content) // 2
+
+    return (
+        content[:1000]
+        + b"inserted"
+        + content[1000:middle]
+        + b"X" * 100
+        + content[middle + 100 : middle + 50000]
+        + content[middle + 60000 :]
+        + b"appended"
+    )
+
+
+def rebuild(tmp_path, old: bytes, new: bytes):
+    """
+    Rebuild new from old through the delta between them, return the rebuilt
+    file, the number of literal bytes and of blocks reused
+    """
+    (tmp_path / "old").write_bytes(old)
+    (tmp_path / "new").write_bytes(new)
+    block_size = choose_block_size(len(old))
+
+    with open(tmp_path / "old", "rb") as basis, open(tmp_path / "new", "rb") as file:
+        signatures = compute_signatures(basis.fileno(), len(old), block_size)
+
+        delta = BytesIO()
+        literal_bytes, copied_blocks = compute_delta(
+            file, block_size, parse_signatures(signatures), delta
+        )
+
+        rebuilt = BytesIO()
+        apply_delta(BufferReader(delta.getvalue()), basis.fileno(), block_size, rebuilt)
+
+    return rebuilt.getvalue(), literal_bytes, copied_blocks
+
+
+@pytest.fixture
+def content() -> bytes:
+    return Random(0).randbytes(1024 * 1024)
+
+
+def test_delta_reuses_unchanged_blocks(tmp_path, content):
+    new = edit(content)
+    rebuilt, literal_bytes, copied_blocks = rebuild(tmp_path, content, new)
+
+    assert rebuilt == new
+    assert copied_blocks > 0
+    assert literal_bytes < len(new) // 10
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        (b"", b"new file"),
+        (b"old file", b""),
+        (b"a" * 10000, b"b" * 10000),
+        (b"short", b"short"),
+    ],
+)
+def test_delta_edge_cases(tmp_path, old, new):
+    assert rebuild(tmp_path, old, new)[0] == new
+
+
+def test_corrupted_delta_is_refused(tmp_path, content):
+    (tmp_path / "old").write_bytes(content)
+    (tmp_path / "new").write_bytes(edit(content))
+    block_size = choose_block_size(len(content))
+
+    with open(tmp_path / "old", "rb") as basis, open(tmp_path / "new", "rb") as file:
+        delta = BytesIO()
+        compute_delta(
+            file,
+            block_size,
+            parse_signatures(
+                compute_signatures(basis.fileno(), len(content), block_size)
+            ),
+            delta,
+        )
+
+        corrupted = bytearray(delta.getvalue())
+        corrupted[-1] ^= 0xFF
+
+        with pytest.raises(ValueError):
+            apply_delta(
+                BufferReader(bytes(corrupted)), basis.fileno(), block_size, BytesIO()
+            )
+
+
+def test_delta_put_rebuilds_the_file_on_the_server(
+    tmp_path, tcp_server, tcp_client, content
+):
+    port = tcp_server()
+    (tmp_path / "server" / "data.bin").write_bytes(content)
+
+    new = edit(content)
+    client = tcp_client(port, delta=True)
+    (tmp_path / "client" / "data.bin").write_bytes(new)
+
+    result = client.execute("put data.bin")
+
+    assert result["status"] == "ok"
+    assert result["delta"]["reused_blocks"] > 0
+    assert result["bytes_sent"] < len(new) // 10
+    assert (tmp_path / "server" / "data.bin").read_bytes() == new
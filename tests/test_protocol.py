@@ -0,0 +1,168 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Round trips of the plain requests and responses through the
+# version 1 and version 2 framings, and the limits of version 1: names of 31
+# characters and files of 4 GiB.
+
+
+import struct
+
+import pytest
+
+from myftp.protocol import (
+    FIRST_BYTE_FIELDS,
+    GET_OK_RESCODE,
+    GET_OPCODE,
+    HELP_RESCODE,
+    MAX_NAME_LENGTH,
+    PROTOCOL_V1,
+    PROTOCOL_V2,
+    PUT_OPCODE,
+    V1_MAX_NAME_LENGTH,
+    V1_MAX_SIZE,
+    build_request_table,
+    encode_field,
+    encode_file_header,
+    encode_help,
+    encode_named,
+    encode_size,
+    encode_varint,
+    fits_v1,
+    read_name_length,
+    read_response_length,
+    read_size,
+    read_varint,
+)
+from myftp.transport import BufferReader
+
+request_table = build_request_table({})
+
+
+def decode_request(data: bytes, version: int):
+    """
+    Request type, name and size of a put or get request, the way the server
+    reads them
+    """
+    reader = BufferReader(data)
+    request_type, name_length = request_table[reader.read_exact(1)[0]]
+
+    if version == PROTOCOL_V2:
+        name_length = read_name_length(reader)
+
+    name = reader.read_exact(name_length).decode("ascii")
+    size = read_size(reader, version) if request_type == "put" else None
+
+    return request_type, name, size
+
+
+def decode_response(data: bytes, version: int):
+    """
+    Rescode, name or message and size of a get or help response, the way the
+    client reads them
+    """
+    reader = BufferReader(data)
+    rescode, low_bits = FIRST_BYTE_FIELDS[reader.read_exact(1)[0]]
+    length = read_response_length(reader, rescode, low_bits, version)
+    text = reader.read_exact(length).decode("ascii")
+    size = read_size(reader, version) if rescode == GET_OK_RESCODE else None
+
+    return rescode, text, size
+
+
+@pytest.mark.parametrize(
+    "value", [0, 1, 0x7F, 0x80, 300, 2**32 - 1, 2**32, 2**63, 2**64 - 1]
+)
+def test_varint_round_trip(value):
+    encoded = encode_varint(value)
+
+    assert read_varint(BufferReader(encoded)) == value
+    assert len(encoded) == max(1, -(-value.bit_length() // 7))
+
+
+def test_negative_varint_is_refused():
+    with pytest.raises(ValueError):
+        encode_varint(-1)
+
+
+@pytest.mark.parametrize("version", [PROTOCOL_V1, PROTOCOL_V2])
+def test_put_request_round_trip(version):
+    name = "n" * V1_MAX_NAME_LENGTH
+    named = encode_named(PUT_OPCODE, name.encode("ascii"), version)
+    request = named + encode_size(1234, version)
+
+    assert decode_request(request, version) == ("put", name, 1234)
+
+
+@pytest.mark.parametrize("version", [PROTOCOL_V1, PROTOCOL_V2])
+def test_get_response_round_trip(version):
+    response = encode_file_header(GET_OK_RESCODE, b"numbers.txt", V1_MAX_SIZE, version)
+
+    assert decode_response(response, version) == (
+        GET_OK_RESCODE,
+        "numbers.txt",
+        V1_MAX_SIZE,
+    )
+
+
+@pytest.mark.parametrize("version", [PROTOCOL_V1, PROTOCOL_V2])
+def test_help_response_round_trip(version):
+    message = "get,put,summary,change,help,bye"
+    response = encode_help(message.encode("ascii"), version)
+
+    assert decode_response(response, version) == (HELP_RESCODE, message, None)
+
+
+def test_v1_limits():
+    assert fits_v1("n" * V1_MAX_NAME_LENGTH, V1_MAX_SIZE)
+    assert not fits_v1("n" * (V1_MAX_NAME_LENGTH + 1))
+    assert not fits_v1("n", V1_MAX_SIZE + 1)
+
+    # a 32nd character would spill into the opcode bits
+    request = encode_named(GET_OPCODE, b"n" * (V1_MAX_NAME_LENGTH + 1), PROTOCOL_V1)
+    assert request_table[request[0]][0] != "get"
+
+    with pytest.raises(struct.error):
+        encode_size(V1_MAX_SIZE + 1, PROTOCOL_V1)
+
+
+def test_v2_carries_long_names_and_large_files():
+    name = "n" * 300
+    size = 5 * 1024**3
+    named = encode_named(PUT_OPCODE, name.encode("ascii"), PROTOCOL_V2)
+    request = named + encode_size(size, PROTOCOL_V2)
+
+    assert decode_request(request, PROTOCOL_V2) == ("put", name, size)
+
+    response = encode_file_header(
+        GET_OK_RESCODE, name.encode("ascii"), size, PROTOCOL_V2
+    )
+
+    assert decode_response(response, PROTOCOL_V2) == (GET_OK_RESCODE, name, size)
+
+
+def test_v2_refuses_names_over_the_maximum():
+    reader = BufferReader(encode_field(b"n" * (MAX_NAME_LENGTH + 1)))
+
+    with pytest.raises(ConnectionError):
+        read_name_length(reader)
+
+
+@pytest.mark.parametrize("protocol_version", [PROTOCOL_V1, PROTOCOL_V2])
+def test_put_and_get_through_the_server(
+    tmp_path, tcp_server, tcp_client, protocol_version
+):
+    port = tcp_server()
+    client = tcp_client(port, protocol_version=protocol_version)
+
+    name = "n" * V1_MAX_NAME_LENGTH + ("n" if protocol_version == PROTOCOL_V2 else "")
+    content = b"".join(b"%d\n" % number for number in range(10000))
+    (tmp_path / "client" / name).write_bytes(content)
+
+    assert client.execute(f"put {name}")["status"] == "ok"
+    assert (tmp_path / "server" / name).read_bytes() == content
+
+    (tmp_path / "client" / name).unlink()
+
+    assert client.execute(f"get {name}")["status"] == "ok"
+    assert (tmp_path / "client" / name).read_bytes() == content
+    assert client.protocol_version == protocol_version
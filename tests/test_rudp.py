@@ -0,0 +1,118 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Reliable UDP over an in-memory channel dropping datagrams: every
+# message must arrive whole and in order whatever the loss.
+
+
+from io import BytesIO
+from queue import Empty, Queue
+from random import Random
+from threading import Thread
+from typing import Callable, Optional
+
+import pytest
+
+from myftp.rudp import ReliableChannel, parse_data_segment
+
+
+def lossy_link(queue: Queue, loss: float, seed: int) -> Callable[[bytes], None]:
+    """
+    Send function putting datagrams into queue, dropping a loss fraction of
+    them
+    """
+    random = Random(seed)
+
+    def send(datagram: bytes) -> None:
+        if random.random() >= loss:
+            queue.put(datagram)
+
+    return send
+
+
+def receiver(queue: Queue) -> Callable[[float], Optional[bytes]]:
+    def recv(timeout: float) -> Optional[bytes]:
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            return None
+
+    return recv
+
+
+def acknowledge_until_done(channel: ReliableChannel, thread: Thread) -> None:
+    """
+    Acknowledge the retransmissions of a sender that missed the last ACKs of
+    channel, as the server does for late segments, until thread ends
+    """
+    while thread.is_alive():
+        datagram = channel.recv_fn(0.1)
+
+        if datagram is not None:
+            segment = parse_data_segment(datagram)
+
+            if segment is not None:
+                channel.ack_completed(segment[0])
+
+    thread.join()
+
+
+@pytest.mark.parametrize("loss", [0.0, 0.1, 0.3])
+def test_message_survives_loss(loss):
+    to_receiver: Queue = Queue()
+    to_sender: Queue = Queue()
+
+    sender = ReliableChannel(lossy_link(to_receiver, loss, 1), receiver(to_sender))
+    receiving = ReliableChannel(lossy_link(to_sender, loss, 2), receiver(to_receiver))
+
+    header = b"\x20numbers.txt"
+    body = Random(3).randbytes(200 * 1024)
+    errors = []
+
+    def send() -> None:
+        try:
+            sender.send_message(header, BytesIO(body), len(body))
+        except Exception as error:
+            errors.append(error)
+
+    sending = Thread(target=send)
+    sending.start()
+
+    sink = BytesIO()
+    assert receiving.recv_message(sink) == len(header) + len(body)
+    assert sink.getvalue() == header + body
+
+    acknowledge_until_done(receiving, sending)
+
+    assert not errors
+    if loss:
+        assert sender.segments_retransmitted > 0
+
+
+def test_messages_in_both_directions():
+    to_server: Queue = Queue()
+    to_client: Queue = Queue()
+
+    client = ReliableChannel(lossy_link(to_server, 0.2, 4), receiver(to_client))
+    server = ReliableChannel(lossy_link(to_client, 0.2, 5), receiver(to_server))
+
+    request = b"\x20numbers.txt"
+    response = b"".join(b"%d\n" % number for number in range(20000))
+    requests = []
+
+    def serve() -> None:
+        received = BytesIO()
+        server.recv_message(received)
+        requests.append(received.getvalue())
+        server.send_message(response[:1], BytesIO(response[1:]), len(response) - 1)
+
+    serving = Thread(target=serve)
+    serving.start()
+
+    client.send_message(request)
+
+    received = BytesIO()
+    client.recv_message(received)
+    acknowledge_until_done(client, serving)
+
+    assert requests == [request]
+    assert received.getvalue() == response
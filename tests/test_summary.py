@@ -0,0 +1,109 @@
+# Author: Minh Tran and Angelo Reoligio
+# Date: October 16, 2026
+# Description: Statistics of a file cut into shards, merged one shard at a time,
+# must match the statistics of the whole file.
+
+
+from random import Random
+
+import pytest
+
+from myftp.summary import (
+    SUMMARY_PERCENTILES,
+    merge_summaries,
+    np,
+    summarize_file,
+    summarize_with_numpy,
+    summarize_with_python,
+)
+
+SHARDS: int = 7
+
+parsers = [summarize_with_python] + ([summarize_with_numpy] if np is not None else [])
+
+
+@pytest.fixture
+def numbers():
+    random = Random(0)
+
+    return [0, 1] + [
+        random.randrange(10 ** random.randrange(1, 12)) for _ in range(20000)
+    ]
+
+
+def write_numbers(path, numbers) -> None:
+    path.write_bytes(b"".join(b"%d\n" % number for number in numbers))
+
+
+def write_shards(directory, numbers) -> None:
+    """
+    Cut numbers into SHARDS files of uneven sizes, named shard_<index>
+    """
+    cuts = [0, 1, 5, 1000, 1001, 9000, 15000, len(numbers)]
+
+    for index in range(SHARDS):
+        write_numbers(
+            directory / f"shard_{index}", numbers[cuts[index] : cuts[index + 1]]
+        )
+
+
+@pytest.mark.parametrize("summarize", parsers)
+def test_merged_shards_match_the_whole_file(tmp_path, numbers, summarize):
+    write_numbers(tmp_path / "whole", numbers)
+    write_shards(tmp_path, numbers)
+
+    whole = summarize(str(tmp_path / "whole"))
+    merged = merge_summaries(
+        [summarize(str(tmp_path / f"shard_{index}")) for index in range(SHARDS)]
+    )
+
+    assert merged.count == whole.count == len(numbers)
+    assert merged.total == whole.total == sum(numbers)
+    assert (merged.smallest, merged.largest) == (min(numbers), max(numbers))
+    assert merged.average == pytest.approx(whole.average, rel=1e-12)
+    assert merged.variance == pytest.approx(whole.variance, rel=1e-9)
+    assert merged.sketch.zeros == whole.sketch.zeros
+    assert merged.sketch.buckets == whole.sketch.buckets
+
+    for q in SUMMARY_PERCENTILES:
+        assert merged.percentile(q) == whole.percentile(q)
+
+
+def test_merging_leaves_partials_untouched(tmp_path, numbers):
+    write_shards(tmp_path, numbers)
+
+    partials = [
+        summarize_file(str(tmp_path / f"shard_{index}")) for index in range(1, 3)
+    ]
+    counts = [partial.count for partial in partials]
+
+    merge_summaries(partials)
+
+    assert [partial.count for partial in partials] == counts
+
+
+def test_summary_of_shards_through_the_server(
+    tmp_path, tcp_server, tcp_client, numbers
+):
+    # the server indexes its directory when it starts
+    (tmp_path / "server").mkdir()
+    write_numbers(tmp_path / "server" / "whole", numbers)
+    write_shards(tmp_path / "server", numbers)
+
+    port = tcp_server()
+
+    client = tcp_client(port, summary_format="binary")
+
+    whole = client.execute("summary whole")
+    merged = client.execute("summary shard_*")
+
+    assert whole["status"] == merged["status"] == "ok"
+    assert (whole["summary"]["files"], merged["summary"]["files"]) == (1, SHARDS)
+
+    for key in ("count", "min", "max") + tuple(
+        f"p{round(q * 100)}" for q in SUMMARY_PERCENTILES
+    ):
+        assert merged["summary"][key] == whole["summary"][key], key
+
+    for key in ("avg", "variance"):
+        assert merged["summary"][key] == pytest.approx(whole["summary"][key], rel=1e-9)